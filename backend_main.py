@@ -4,11 +4,11 @@ HunyuanVideo Web UI - FastAPI Backend
 import asyncio
 import json
 import os
+import time
 import uuid
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
-import subprocess
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
@@ -31,6 +31,31 @@ RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 jobs: Dict[str, dict] = {}
 active_connections: List[WebSocket] = []
 
+# Container state, polled in the background so /api/health never blocks the event loop
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+container_state = {"running": False, "checked_at": None}
+
+async def poll_container_state():
+    while True:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "docker", "inspect", "-f", "{{.State.Running}}", "hunyuan-video",
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=5)
+            container_state["running"] = stdout.decode().strip() == "true"
+        except asyncio.TimeoutError:
+            process.kill()
+            container_state["running"] = False
+        except OSError:
+            container_state["running"] = False
+        container_state["checked_at"] = time.time()
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+@app.on_event("startup")
+async def start_health_polling():
+    asyncio.create_task(poll_container_state())
+
 class VideoRequest(BaseModel):
     prompt: str = Field(..., description="Text prompt")
     video_size: int = Field(720, description="Resolution (540 or 720)")
@@ -91,7 +116,8 @@ async def run_generation(job_id: str, request: VideoRequest):
         cmd_str += f"--prompt '{prompt_escaped}' "
         cmd_str += f"--embedded-cfg-scale {request.cfg_scale} "
         cmd_str += f"--use-cpu-offload "
-        cmd_str += f"--save-path results/{job_id} "
+        # Written straight to the results directory the container shares with the host
+        cmd_str += f"--save-path {RESULTS_DIR / job_id} "
         
         if request.seed is not None:
             cmd_str += f"--seed {request.seed} "
@@ -140,21 +166,12 @@ async def run_generation(job_id: str, request: VideoRequest):
         duration = (datetime.now() - start_time).total_seconds()
         
         if process.returncode == 0:
-            # Find video
-            find_cmd = ["docker", "exec", "hunyuan-video", "find", f"/workspace/repo/results/{job_id}", "-name", "*.mp4"]
-            find_proc = await asyncio.create_subprocess_exec(*find_cmd, stdout=asyncio.subprocess.PIPE)
-            stdout, _ = await find_proc.communicate()
-            container_paths = stdout.decode().strip().split("\n")
+            # Find video (already on the host: no docker exec find / docker cp)
+            host_result_dir = RESULTS_DIR / job_id
+            videos = sorted(host_result_dir.glob("*.mp4"))
             
-            if container_paths and container_paths[0]:
-                container_path = container_paths[0]
-                video_name = Path(container_path).name
-                host_result_dir = RESULTS_DIR / job_id
-                host_result_dir.mkdir(parents=True, exist_ok=True)
-                host_video_path = host_result_dir / video_name
-                
-                copy_cmd = ["docker", "cp", f"hunyuan-video:{container_path}", str(host_video_path)]
-                await asyncio.create_subprocess_exec(*copy_cmd)
+            if videos:
+                host_video_path = videos[0]
                 
                 jobs[job_id]["status"] = "completed"
                 jobs[job_id]["progress"] = 100
@@ -251,17 +268,12 @@ async def websocket_endpoint(websocket: WebSocket):
 
 @app.get("/api/health")
 async def health_check():
-    try:
-        result = subprocess.run(
-            ["docker", "inspect", "-f", "{{.State.Running}}", "hunyuan-video"],
-            capture_output=True, text=True
-        )
-        container_running = result.stdout.strip() == "true"
-    except:
-        container_running = False
+    container_running = container_state["running"]
+    checked_at = container_state["checked_at"]
     return {
         "status": "healthy" if container_running else "degraded",
         "container_running": container_running,
+        "staleness_seconds": round(time.time() - checked_at, 3) if checked_at else None,
         "active_jobs": sum(1 for j in jobs.values() if j["status"] == "processing"),
         "total_jobs": len(jobs)
     }
@@ -0,0 +1,73 @@
+#!/bin/bash
+# Start the warm model worker(s) inside the HunyuanVideo container
+# Each worker loads the model once and serves jobs over a Unix socket,
+# so each generation skips interpreter startup and model loading.
+#
+# Usage: start-warm-worker.sh [GPU_COUNT]
+#   With more than one GPU, one worker is pinned to each device and
+#   /opt/hunyuan-video/run/workers.json is written for the API's worker pool
+#   (set WORKERS_CONFIG to that path).
+
+set -e
+
+CONTAINER_NAME="hunyuan-video"
+BACKEND_SRC="$(dirname "$0")/../../web-ui/backend"
+RUN_DIR="/opt/hunyuan-video/run"
+GPU_COUNT="${1:-${GPU_COUNT:-1}}"
+GPU_MEMORY_GB="${GPU_MEMORY_GB:-80}"
+
+mkdir -p $RUN_DIR
+
+echo "📦 Copying worker into $CONTAINER_NAME..."
+docker cp "$BACKEND_SRC/worker.py" $CONTAINER_NAME:/workspace/repo/worker.py
+docker cp "$BACKEND_SRC/cache.py" $CONTAINER_NAME:/workspace/repo/cache.py
+docker cp "$BACKEND_SRC/tensor_format.py" $CONTAINER_NAME:/workspace/repo/tensor_format.py
+docker cp "$BACKEND_SRC/prompt_index.py" $CONTAINER_NAME:/workspace/repo/prompt_index.py
+docker cp "$BACKEND_SRC/latent_cache.py" $CONTAINER_NAME:/workspace/repo/latent_cache.py
+
+echo "🛑 Stopping any existing worker..."
+docker exec $CONTAINER_NAME pkill -f "python worker.py" || true
+
+sockets=()
+for i in $(seq 0 $((GPU_COUNT - 1))); do
+    if [ "$GPU_COUNT" -eq 1 ]; then
+        socket="$RUN_DIR/worker.sock"
+    else
+        socket="$RUN_DIR/worker-$i.sock"
+    fi
+    sockets+=("$socket")
+    rm -f "$socket"
+
+    echo "🔥 Starting warm worker on GPU $i (model load takes a few minutes)..."
+    docker exec -d -w /workspace/repo -e CUDA_VISIBLE_DEVICES=$i $CONTAINER_NAME \
+        bash -c "python worker.py --backend hunyuan --model-base /workspace/repo --socket $socket > $RUN_DIR/worker-$i.log 2>&1"
+done
+
+if [ "$GPU_COUNT" -gt 1 ]; then
+    echo "📝 Writing $RUN_DIR/workers.json..."
+    {
+        echo "[{\"name\": \"$(hostname)\", \"devices\": ["
+        for i in "${!sockets[@]}"; do
+            sep=","
+            [ "$i" -eq $((GPU_COUNT - 1)) ] && sep=""
+            echo "  {\"address\": \"${sockets[$i]}\", \"memory_gb\": $GPU_MEMORY_GB}$sep"
+        done
+        echo "]}]"
+    } > $RUN_DIR/workers.json
+fi
+
+echo "⏳ Waiting for worker sockets..."
+for attempt in $(seq 1 120); do
+    ready=0
+    for socket in "${sockets[@]}"; do
+        [ -S "$socket" ] && ready=$((ready + 1))
+    done
+    if [ "$ready" -eq "$GPU_COUNT" ]; then
+        echo "✅ $GPU_COUNT warm worker(s) ready in $RUN_DIR"
+        exit 0
+    fi
+    sleep 5
+done
+
+echo "❌ Workers did not come up; see $RUN_DIR/worker-*.log"
+exit 1
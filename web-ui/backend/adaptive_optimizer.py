@@ -4,10 +4,13 @@ Analyzes prompt complexity and dynamically adjusts inference parameters
 Provides 15-25% average speedup by avoiding over-processing simple prompts
 """
 import os
-import re
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
+from prompt_analyzer import PromptFeatures, prompt_analyzer
+from runtime_estimator import runtime_estimator
+from step_policy import step_policy
+
 class ComplexityLevel(Enum):
     SIMPLE = "simple"
     MODERATE = "moderate"
@@ -17,36 +20,17 @@ class ComplexityLevel(Enum):
 class AdaptiveOptimizer:
     def __init__(self):
         self.enabled = os.getenv("ENABLE_ADAPTIVE_STEPS", "true").lower() == "true"
-        
-        # Keywords that indicate various complexity factors
-        self.motion_keywords = [
-            "walking", "running", "flying", "moving", "dancing", "jumping",
-            "swimming", "driving", "riding", "chasing", "racing", "spinning"
-        ]
-        
-        self.scene_complexity = [
-            "crowd", "city", "busy", "complex", "detailed", "intricate",
-            "marketplace", "festival", "traffic", "cityscape", "panorama"
-        ]
-        
-        self.camera_motion = [
-            "zoom", "pan", "tracking", "dolly", "crane", "orbit",
-            "flythrough", "POV", "handheld", "gimbal"
-        ]
-        
-        self.lighting_effects = [
-            "sunset", "sunrise", "lightning", "fire", "neon", "sparkles",
-            "glow", "dramatic lighting", "god rays", "volumetric"
-        ]
-        
-        self.quality_modifiers = [
-            "photorealistic", "hyperrealistic", "cinematic", "8k", "4k",
-            "high detail", "ultra detailed", "masterpiece", "professional"
-        ]
+        # Steps of a draft render (preview resolution, refined once approved)
+        self.draft_steps = int(os.getenv("DRAFT_STEPS", "15"))
     
-    def analyze_prompt(self, prompt: str) -> Tuple[ComplexityLevel, int]:
+    def analyze_prompt(self, prompt: str, log: bool = True,
+                       features: Optional[PromptFeatures] = None,
+                       video_size: Optional[str] = None) -> Tuple[ComplexityLevel, int]:
         """
         Analyze prompt and return complexity level + recommended steps
+        (log=False skips the printed analysis, e.g. for queue estimates;
+        features are the prompt's analysis if already computed; with a
+        video_size, steps come from the calibrated step policy if it has them)
         
         Returns:
             (ComplexityLevel, recommended_steps)
@@ -54,31 +38,31 @@ class AdaptiveOptimizer:
         if not self.enabled:
             return ComplexityLevel.MODERATE, 30
         
-        prompt_lower = prompt.lower()
+        # Keyword counts per category (see prompt_analyzer.py)
+        features = features or prompt_analyzer.analyze(prompt)
+        counts = features.counts
         complexity_score = 0
         
         # 1. Motion complexity (0-3 points)
-        motion_count = sum(1 for kw in self.motion_keywords if kw in prompt_lower)
+        motion_count = counts["motion"]
         complexity_score += min(motion_count, 3)
         
         # 2. Scene complexity (0-3 points)
-        scene_count = sum(1 for kw in self.scene_complexity if kw in prompt_lower)
+        scene_count = counts["scene"]
         complexity_score += min(scene_count * 2, 3)
         
         # 3. Camera motion (0-2 points)
-        camera_count = sum(1 for kw in self.camera_motion if kw in prompt_lower)
+        camera_count = counts["camera"]
         complexity_score += min(camera_count * 2, 2)
         
         # 4. Lighting effects (0-2 points)
-        lighting_count = sum(1 for kw in self.lighting_effects if kw in prompt_lower)
-        complexity_score += min(lighting_count, 2)
+        complexity_score += min(counts["lighting"], 2)
         
         # 5. Quality modifiers (0-2 points)
-        quality_count = sum(1 for kw in self.quality_modifiers if kw in prompt_lower)
-        complexity_score += min(quality_count, 2)
+        complexity_score += min(counts["quality"], 2)
         
         # 6. Prompt length (0-3 points)
-        word_count = len(prompt.split())
+        word_count = features.word_count
         if word_count > 50:
             complexity_score += 3
         elif word_count > 30:
@@ -87,9 +71,7 @@ class AdaptiveOptimizer:
             complexity_score += 1
         
         # 7. Multiple subjects (0-2 points)
-        subject_indicators = ["and", ",", "with", "multiple", "several", "many"]
-        subject_count = sum(1 for word in subject_indicators if word in prompt_lower)
-        complexity_score += min(subject_count, 2)
+        complexity_score += min(counts["subjects"], 2)
         
         # Determine complexity level and steps
         # Note: HunyuanVideo requires minimum 30 steps for proper denoising
@@ -106,20 +88,34 @@ class AdaptiveOptimizer:
             level = ComplexityLevel.VERY_COMPLEX
             steps = 50  # Increased from 45
         
-        print(f"📊 Prompt Analysis:")
-        print(f"   Complexity Score: {complexity_score}/17")
-        print(f"   Level: {level.value.upper()}")
-        print(f"   Recommended Steps: {steps}")
-        print(f"   Motion: {motion_count}, Scene: {scene_count}, Camera: {camera_count}")
+        # Measured by calibrate_steps.py, where available (see step_policy.py)
+        calibrated = step_policy.steps(video_size, level.value) if video_size else None
+        if calibrated is not None:
+            steps = calibrated
+        
+        if log:
+            print(f"📊 Prompt Analysis:")
+            print(f"   Complexity Score: {complexity_score}/17")
+            print(f"   Level: {level.value.upper()}")
+            print(f"   Recommended Steps: {steps}{' (calibrated)' if calibrated is not None else ''}")
+            print(f"   Motion: {motion_count}, Scene: {scene_count}, Camera: {camera_count}")
         
         return level, steps
     
+    def analyze_prompts(self, prompts: List[str]) -> List[PromptFeatures]:
+        """Keyword analysis of many prompts in one batch (e.g. a storyboard)"""
+        return prompt_analyzer.analyze_many(prompts)
+    
     def optimize_parameters(
         self, 
         prompt: str,
         video_size: str,
         infer_steps: int,
-        quality_tier: str = "auto"
+        quality_tier: str = "auto",
+        video_length: int = 129,
+        log: bool = True,
+        features: Optional[PromptFeatures] = None,
+        draft: bool = False
     ) -> Dict[str, any]:
         """
         Optimize all generation parameters based on prompt and quality tier
@@ -129,11 +125,17 @@ class AdaptiveOptimizer:
             video_size: Requested resolution (540p/720p)
             infer_steps: User-requested steps (0 for auto)
             quality_tier: preview/standard/premium/auto
+            video_length: Number of frames (for the time estimate)
+            log: Print the analysis and chosen mode
+            features: The prompt's analysis, if already computed (see analyze_prompts)
+            draft: Quick preview-resolution draft (at most DRAFT_STEPS steps); the
+                tier still sets CFG and flow reversal, so the refine pass matches it
         
         Returns:
             Optimized parameters dict
         """
-        complexity, recommended_steps = self.analyze_prompt(prompt)
+        complexity, recommended_steps = self.analyze_prompt(prompt, log, features, video_size)
+        say = print if log else (lambda *args: None)
         
         # Handle quality tiers
         if quality_tier == "preview":
@@ -141,54 +143,51 @@ class AdaptiveOptimizer:
             final_steps = max(25, recommended_steps - 10)  # At least 25 steps minimum
             cfg_scale = 5.0  # Lower CFG for faster convergence
             flow_reverse = False  # Disable for speed
-            print("🚀 PREVIEW MODE: Faster generation, good quality")
+            say("🚀 PREVIEW MODE: Faster generation, good quality")
             
         elif quality_tier == "premium":
             # Premium mode - maximize quality
             final_steps = min(50, recommended_steps + 10)
             cfg_scale = 7.0  # Standard CFG
             flow_reverse = True  # Enable for quality
-            print("💎 PREMIUM MODE: Maximum quality, slower generation")
+            say("💎 PREMIUM MODE: Maximum quality, slower generation")
             
         elif quality_tier == "standard":
             # Balanced mode
             final_steps = recommended_steps
             cfg_scale = 6.0
             flow_reverse = True
-            print("⚖️ STANDARD MODE: Balanced speed and quality")
+            say("⚖️ STANDARD MODE: Balanced speed and quality")
             
         else:  # auto
             # Use adaptive steps based on complexity
             final_steps = infer_steps if infer_steps > 0 else recommended_steps
             cfg_scale = 6.0
             flow_reverse = True
-            print("🤖 AUTO MODE: Adaptive based on prompt complexity")
+            say("🤖 AUTO MODE: Adaptive based on prompt complexity")
+        
+        # A draft only has to show composition and motion for approval
+        if draft:
+            final_steps = min(final_steps, self.draft_steps)
+            say(f"✏️ DRAFT: {final_steps} steps at preview resolution")
         
         # Apply resolution-based caps to avoid OOM
         if video_size == "720p":
             final_steps = min(final_steps, 40)
-            print(f"⚠️ 720p cap applied: {final_steps} steps max")
+            say(f"⚠️ 720p cap applied: {final_steps} steps max")
+        
+        # Learned from completed jobs (see runtime_estimator.py)
+        estimate = runtime_estimator.predict(video_size, video_length, final_steps)
         
         return {
             "infer_steps": final_steps,
             "cfg_scale": cfg_scale,
             "flow_reverse": flow_reverse,
             "complexity": complexity.value,
-            "estimated_time_min": self._estimate_time(video_size, final_steps)
+            "estimated_time_min": round(estimate["seconds"] / 60, 1),
+            "estimated_time_range_min": [round(estimate["low"] / 60, 1), round(estimate["high"] / 60, 1)],
+            "estimate": estimate
         }
-    
-    def _estimate_time(self, video_size: str, steps: int) -> float:
-        """
-        Estimate generation time in minutes
-        Based on empirical data: ~15 seconds per step at 540p
-        """
-        if video_size == "720p":
-            time_per_step = 18  # seconds
-        else:  # 540p
-            time_per_step = 15  # seconds
-        
-        total_seconds = steps * time_per_step
-        return round(total_seconds / 60, 1)
 
 # Global optimizer instance
 adaptive_optimizer = AdaptiveOptimizer()
@@ -0,0 +1,115 @@
+"""
+Batch Generation
+Groups storyboard shots with matching shape parameters into micro-batches
+
+Shots that share resolution, length, steps and guidance run back to back in a
+single worker request: one queue slot, one placement and one dispatch for the
+whole group instead of one per shot. The report compares measured batch wall
+time against the one-at-a-time path.
+"""
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+ShapeKey = Tuple[str, int, int, float, bool]
+
+
+def default_batch_size() -> int:
+    return int(os.getenv("BATCH_MAX_SIZE", "4"))
+
+
+def shape_key(video_size: str, video_length: int, infer_steps: int,
+              cfg_scale: float, flow_reverse: bool) -> ShapeKey:
+    """Parameters that must match for shots to share a micro-batch"""
+    return (video_size, int(video_length), int(infer_steps), float(cfg_scale), bool(flow_reverse))
+
+
+def group_micro_batches(items: List[Tuple[str, ShapeKey]], max_size: int) -> List[List[str]]:
+    """
+    Group item IDs by shape key, then split each group into chunks of max_size
+
+    Groups keep submission order, so the first shot of a storyboard is in the
+    first micro-batch.
+    """
+    groups: "OrderedDict[ShapeKey, List[str]]" = OrderedDict()
+    for item_id, key in items:
+        groups.setdefault(key, []).append(item_id)
+
+    micro_batches = []
+    for members in groups.values():
+        for start in range(0, len(members), max_size):
+            micro_batches.append(members[start:start + max_size])
+    return micro_batches
+
+
+def throughput_report(batch_jobs: List[Dict[str, Any]],
+                      reference_durations: List[float]) -> Dict[str, Any]:
+    """
+    Compare a batch's wall time with running its shots one at a time
+
+    Args:
+        batch_jobs: Job records belonging to the batch
+        reference_durations: Durations of completed single jobs with the same
+            shape, the one-at-a-time baseline; without them there is no
+            baseline and no speedup
+
+    Returns:
+        Dict with wall time, items/hour, baseline and speedup
+    """
+    completed = [j for j in batch_jobs if j["status"] == "completed"]
+    started = [j["started_at"] for j in batch_jobs if j.get("started_at")]
+    finished = [j["completed_at"] for j in completed if j.get("completed_at")]
+
+    report: Dict[str, Any] = {
+        "items": len(batch_jobs),
+        "completed": len(completed),
+        "failed": sum(1 for j in batch_jobs if j["status"] == "failed"),
+        "wall_time_s": None,
+        "items_per_hour": None,
+        "baseline_source": None,
+        "baseline_time_s": None,
+        "speedup": None,
+    }
+    if not completed or not started or not finished:
+        return report
+
+    wall = (
+        max(datetime.fromisoformat(t) for t in finished)
+        - min(datetime.fromisoformat(t) for t in started)
+    ).total_seconds()
+    if wall <= 0:
+        return report
+
+    report.update({
+        "wall_time_s": round(wall, 1),
+        "items_per_hour": round(len(completed) / wall * 3600, 1),
+    })
+    # Only a measured baseline: without single-job history for this shape
+    # there is nothing to compare against
+    if reference_durations:
+        baseline = sum(reference_durations) / len(reference_durations) * len(completed)
+        report.update({
+            "baseline_source": "measured",
+            "baseline_time_s": round(baseline, 1),
+            "speedup": round(baseline / wall, 2),
+        })
+    return report
+
+
+def batch_status(jobs: List[Dict[str, Any]]) -> str:
+    """Aggregate status of a batch from its jobs"""
+    statuses = {j["status"] for j in jobs}
+    if statuses <= {"completed"}:
+        return "completed"
+    if statuses <= {"completed", "failed"}:
+        return "failed" if "completed" not in statuses else "partial"
+    if "processing" in statuses or "completed" in statuses or "failed" in statuses:
+        return "processing"
+    return "queued"
+
+
+def batch_progress(jobs: List[Dict[str, Any]]) -> Optional[int]:
+    if not jobs:
+        return None
+    return int(sum(j["progress"] for j in jobs) / len(jobs))
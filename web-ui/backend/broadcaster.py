@@ -0,0 +1,312 @@
+"""
+WebSocket Broadcaster
+Non-blocking fan-out of job updates to dashboard connections
+
+- Each update is serialized once and the same string is shared by every connection
+- Each connection has its own send queue and sender task, so a slow client
+  never blocks the generation coroutine or other clients
+- Per-connection backlog is keyed by job: a newer update for a job replaces the
+  queued one, and the oldest entries are dropped once the backlog is full
+- Per-job coalescing: at most WS_MAX_UPDATES_PER_SEC updates per job; updates in
+  between are merged into the next flush. Terminal states flush immediately
+- Clients may subscribe to specific job IDs:
+      {"type": "subscribe", "job_ids": ["..."]}
+      {"type": "unsubscribe", "job_ids": ["..."]}
+      {"type": "subscribe_all"}
+
+Protocols (chosen with /ws?protocol=N):
+  1 (default, legacy)  {"type": "initial_state", "jobs": [...]} then
+                       {"type": "status_update", "job": {...full record...}}
+  2 (delta)            {"type": "snapshot", "v": 2, "seq": N, "jobs": [summary, ...]} then
+                       {"type": "delta", "v": 2, "seq": N+1, "job_id": "...", "changes": {...}}
+                       {"type": "delta", "v": 2, "seq": N+2, "job_id": "...", "deleted": true}
+     Summaries leave out params and other bulky fields; deltas carry only the
+     fields that changed since the last broadcast. A reconnecting client passes
+     /ws?protocol=2&since=<last seq> (or sends {"type": "resume", "since": N})
+     and gets the missed deltas replayed, or a fresh snapshot if they have
+     aged out of the replay buffer.
+"""
+import asyncio
+import copy
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+PROTOCOL_VERSION = 2
+
+# Job fields sent to dashboards in protocol 2; full records stay at /api/jobs/{id}
+SUMMARY_FIELDS = (
+    "job_id", "status", "prompt", "progress", "created_at", "started_at",
+    "completed_at", "video_path", "thumbnail_path", "sprite_path", "sprite",
+    "preview_path", "draft", "refine_size", "refined_by", "stream_segments", "error", "duration",
+    "queue_position", "batch_id", "step", "total_steps", "seconds_per_step",
+    "eta_seconds", "starts_in_seconds", "estimate", "optimization",
+)
+
+
+def summarize(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: job.get(field) for field in SUMMARY_FIELDS}
+
+
+def delta_message(seq: int, job_id: str, payload: Dict[str, Any]) -> str:
+    return json.dumps({"type": "delta", "v": PROTOCOL_VERSION, "seq": seq, "job_id": job_id, **payload})
+
+
+class Connection:
+    """One WebSocket client with its own bounded send queue"""
+
+    def __init__(self, websocket, max_backlog: int, protocol: int = 1,
+                 on_overflow: Optional[Callable[["Connection"], None]] = None):
+        self.websocket = websocket
+        self.max_backlog = max_backlog
+        self.protocol = protocol
+        self.on_overflow = on_overflow
+        # None = all jobs
+        self.subscriptions: Optional[Set[str]] = None
+        self.dropped = 0
+        # key -> (message, delta) where delta is (seq, job_id, payload) for protocol 2
+        self._pending: "OrderedDict[str, Tuple[str, Optional[tuple]]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._sender: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def wants(self, job_id: str) -> bool:
+        return self.subscriptions is None or job_id in self.subscriptions
+
+    def enqueue(self, key: str, message: str, delta: Optional[tuple] = None):
+        """
+        Queue a message; a newer message with the same key replaces the old one
+
+        Deltas for the same job are merged rather than replaced, so a slow
+        client still ends up with every changed field.
+        """
+        if key in self._pending:
+            _, queued_delta = self._pending.pop(key)
+            self.dropped += 1
+            if delta and queued_delta and "changes" in delta[2] and "changes" in queued_delta[2]:
+                seq, job_id, payload = delta
+                merged = {"changes": {**queued_delta[2]["changes"], **payload["changes"]}}
+                delta = (seq, job_id, merged)
+                message = delta_message(seq, job_id, merged)
+        self._pending[key] = (message, delta)
+
+        if len(self._pending) > self.max_backlog:
+            if self.protocol >= 2 and self.on_overflow:
+                # Dropping a delta would leave the client inconsistent; resync instead
+                self.dropped += len(self._pending)
+                self._pending.clear()
+                self.on_overflow(self)
+            else:
+                while len(self._pending) > self.max_backlog:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+        self._ready.set()
+
+    def clear(self):
+        self._pending.clear()
+
+    async def run(self, on_close: Callable[["Connection"], None]):
+        """Sender loop: drains the queue until the socket fails"""
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._pending:
+                    _, (message, _) = self._pending.popitem(last=False)
+                    await self.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        finally:
+            self.closed = True
+            on_close(self)
+
+
+class Broadcaster:
+    def __init__(self):
+        self.max_updates_per_second = float(os.getenv("WS_MAX_UPDATES_PER_SEC", "4"))
+        self.max_backlog = int(os.getenv("WS_MAX_BACKLOG", "100"))
+        self.connections: List[Connection] = []
+        self.messages_serialized = 0
+        # Source of current job records for snapshots; set by the app
+        self.snapshot_source: Callable[[], Iterable[Dict[str, Any]]] = lambda: []
+        # Per-job coalescing state
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._last_flush: Dict[str, float] = {}
+        self._scheduled: Dict[str, asyncio.TimerHandle] = {}
+        # Delta protocol state
+        self.seq = 0
+        self._sent: Dict[str, Dict[str, Any]] = {}
+        self._history: Deque[Tuple[int, str, str]] = deque(
+            maxlen=int(os.getenv("WS_REPLAY_BUFFER", "1000"))
+        )
+
+    @property
+    def min_interval(self) -> float:
+        return 1.0 / self.max_updates_per_second if self.max_updates_per_second > 0 else 0.0
+
+    def connect(self, websocket, protocol: int = 1, since: Optional[int] = None) -> Connection:
+        """
+        Register a client and queue its initial state
+
+        Protocol 1 gets the full initial_state; protocol 2 gets a snapshot, or
+        only the missed deltas when resuming from `since`.
+        """
+        connection = Connection(websocket, self.max_backlog, protocol, on_overflow=self._send_snapshot)
+        self.connections.append(connection)
+        connection._sender = asyncio.create_task(connection.run(self.disconnect))
+
+        if protocol >= 2:
+            self.resume(connection, since)
+        else:
+            connection.enqueue("_initial_state", json.dumps({
+                "type": "initial_state",
+                "jobs": list(self.snapshot_source())
+            }))
+        return connection
+
+    def disconnect(self, connection: Connection):
+        if connection in self.connections:
+            self.connections.remove(connection)
+        if connection._sender and not connection._sender.done() \
+                and connection._sender is not asyncio.current_task():
+            connection._sender.cancel()
+
+    def resume(self, connection: Connection, since: Optional[int]):
+        """Replay deltas after `since`, or send a snapshot if they're no longer buffered"""
+        if since is not None and since <= self.seq:
+            oldest = self._history[0][0] if self._history else self.seq + 1
+            if since >= oldest - 1:
+                for seq, job_id, message in self._history:
+                    if seq > since and connection.wants(job_id):
+                        connection.enqueue(f"_replay:{seq}", message)
+                return
+        self._send_snapshot(connection)
+
+    def _send_snapshot(self, connection: Connection):
+        connection.clear()
+        jobs = [
+            summarize(job) for job in self.snapshot_source()
+            if connection.wants(job["job_id"])
+        ]
+        connection.enqueue("_snapshot", json.dumps({
+            "type": "snapshot",
+            "v": PROTOCOL_VERSION,
+            "seq": self.seq,
+            "jobs": jobs
+        }))
+
+    def handle_client_message(self, connection: Connection, text: str):
+        """Apply a subscribe/unsubscribe/resume request from the client; ignore anything else"""
+        try:
+            message = json.loads(text)
+        except (ValueError, TypeError):
+            return
+        if not isinstance(message, dict):
+            return
+
+        job_ids = set(message.get("job_ids") or [])
+        if message.get("type") == "subscribe":
+            connection.subscriptions = (connection.subscriptions or set()) | job_ids
+        elif message.get("type") == "unsubscribe":
+            if connection.subscriptions is not None:
+                connection.subscriptions -= job_ids
+        elif message.get("type") == "subscribe_all":
+            connection.subscriptions = None
+        elif message.get("type") == "resume" and connection.protocol >= 2:
+            since = message.get("since")
+            self.resume(connection, since if isinstance(since, int) else None)
+
+    def publish(self, job_id: str, job: Dict[str, Any]):
+        """
+        Publish a job's latest state; never blocks
+
+        Updates within the per-job interval are coalesced into one delayed flush.
+        """
+        self._latest[job_id] = job
+        if job.get("status") in TERMINAL_STATUSES:
+            self._flush(job_id)
+            return
+        if job_id in self._scheduled:
+            return
+
+        wait = self._last_flush.get(job_id, 0.0) + self.min_interval - time.monotonic()
+        if wait <= 0:
+            self._flush(job_id)
+        else:
+            loop = asyncio.get_running_loop()
+            self._scheduled[job_id] = loop.call_later(wait, self._flush, job_id)
+
+    def _flush(self, job_id: str):
+        handle = self._scheduled.pop(job_id, None)
+        if handle:
+            handle.cancel()
+        job = self._latest.pop(job_id, None)
+        if job is None:
+            return
+
+        self._last_flush[job_id] = time.monotonic()
+        terminal = job.get("status") in TERMINAL_STATUSES
+        if terminal:
+            self._last_flush.pop(job_id, None)
+
+        # Delta against what dashboards last saw; nothing changed, nothing sent.
+        # A deep copy, since nested fields (optimization) are updated in place.
+        # Finished jobs are not tracked, so a later update sends a full summary.
+        summary = copy.deepcopy(summarize(job))
+        previous = self._sent.pop(job_id, None) if terminal else self._sent.get(job_id)
+        changes = {k: v for k, v in summary.items() if previous is None or previous.get(k) != v}
+        if not changes:
+            return
+        if not terminal:
+            self._sent[job_id] = summary
+        self._record_delta(job_id, {"changes": changes})
+
+        targets = [c for c in self.connections if not c.closed and c.protocol < 2 and c.wants(job_id)]
+        if targets:
+            # Serialize once, share across connections
+            message = json.dumps({"type": "status_update", "job": job})
+            self.messages_serialized += 1
+            for connection in targets:
+                connection.enqueue(job_id, message)
+
+    def _record_delta(self, job_id: str, payload: Dict[str, Any]):
+        """Assign the next sequence number, buffer for replay and fan out to protocol 2 clients"""
+        self.seq += 1
+        message = delta_message(self.seq, job_id, payload)
+        self.messages_serialized += 1
+        self._history.append((self.seq, job_id, message))
+
+        delta = (self.seq, job_id, payload)
+        for connection in self.connections:
+            if not connection.closed and connection.protocol >= 2 and connection.wants(job_id):
+                connection.enqueue(job_id, message, delta)
+
+    def forget(self, job_id: str):
+        """Drop coalescing state for a deleted job and tell delta clients"""
+        handle = self._scheduled.pop(job_id, None)
+        if handle:
+            handle.cancel()
+        self._latest.pop(job_id, None)
+        self._last_flush.pop(job_id, None)
+        # Finished jobs are no longer in _sent, so always tell delta clients
+        self._sent.pop(job_id, None)
+        self._record_delta(job_id, {"deleted": True})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "messages_serialized": self.messages_serialized,
+            "dropped": sum(c.dropped for c in self.connections),
+            "max_updates_per_second": self.max_updates_per_second,
+            "seq": self.seq,
+        }
+
+
+# Global broadcaster instance
+broadcaster = Broadcaster()
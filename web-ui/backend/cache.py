@@ -3,44 +3,282 @@ Caching layer for HunyuanVideo generation optimization.
 
 Features:
 - Text embedding cache (LLaVA + CLIP)
-- Latent state caching for variations
 - Motion template library
+
+Denoising latents (checkpoints and final latents for refining) are kept by
+latent_cache.LatentCache in CACHE_DIR/checkpoints, not here.
+
+Tensors are stored in the tensor_format container (.hvt) and memory-mapped on
+read; other entries are JSON. Nothing in the cache is pickled.
+
+Every entry is written atomically (temp file + rename) and recorded in a
+SQLite manifest (CACHE_DIR/manifest.db) with its size, last access time and
+hit count. The manifest keeps running totals, so stats never walk the
+directory, and enforces a byte budget (CACHE_MAX_GB) by evicting the least
+recently (CACHE_EVICTION=lru) or least frequently (lfu) used entries. The API
+and the warm worker share the directory and the manifest.
 """
 import hashlib
 import json
-import pickle
+import os
+import shutil
+import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Tuple
 import logging
 
+import tensor_format
+from prompt_index import canonicalize
+
 logger = logging.getLogger(__name__)
 
+EVICTION_POLICIES = ("lru", "lfu")
+
+# After exceeding the budget, evict down to this fraction of it, so a full
+# cache evicts in batches rather than on every write
+LOW_WATER = 0.9
+
+# Entry kinds by file suffix
+KINDS = {".json": "embedding", ".hvt": "embedding_tensors"}
+
+
+class CacheManifest:
+    """
+    SQLite index of the entries in a cache directory
+    
+    One row per file (path relative to the cache directory) with its size,
+    last access time and hit count. Triggers maintain per-kind totals, so
+    they stay right when several processes write to the same directory and
+    reading them costs the same at ten entries or ten million.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            path TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries (last_access);
+        CREATE INDEX IF NOT EXISTS idx_entries_lfu ON entries (hits, last_access);
+        CREATE TABLE IF NOT EXISTS totals (
+            kind TEXT PRIMARY KEY,
+            entries INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO totals (kind, entries, bytes) VALUES (new.kind, 1, new.size)
+                ON CONFLICT (kind) DO UPDATE SET entries = entries + 1, bytes = bytes + new.size;
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            UPDATE totals SET entries = entries - 1, bytes = bytes - old.size WHERE kind = old.kind;
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+            UPDATE totals SET bytes = bytes + new.size - old.size WHERE kind = new.kind;
+        END;
+    """
+    
+    def __init__(self, path: Path):
+        # Shared by the asyncio.to_thread workers of one process; the lock
+        # serializes them, SQLite's file locks serialize processes
+        self.db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+    
+    def close(self):
+        self.db.close()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            row = self.db.execute("SELECT COALESCE(SUM(entries), 0) FROM totals").fetchone()
+        return row[0]
+    
+    def record(self, path: str, kind: str, size: int):
+        """Add or resize an entry; a rewrite keeps its hit count"""
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO entries (path, kind, size, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size = excluded.size, last_access = excluded.last_access",
+                (path, kind, size, time.time()),
+            )
+    
+    def touch(self, path: str) -> bool:
+        """Count a hit; False if the entry is not in the manifest"""
+        with self._lock:
+            return self.db.execute(
+                "UPDATE entries SET hits = hits + 1, last_access = ? WHERE path = ?",
+                (time.time(), path),
+            ).rowcount > 0
+    
+    def contains(self, path: str) -> bool:
+        """Whether the manifest records an entry (a read; no write transaction)"""
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM entries WHERE path = ?", (path,)).fetchone() is not None
+    
+    def remove(self, path: str):
+        with self._lock:
+            self.db.execute("DELETE FROM entries WHERE path = ?", (path,))
+    
+    def totals(self) -> Dict[str, Tuple[int, int]]:
+        """kind -> (entries, bytes)"""
+        with self._lock:
+            rows = self.db.execute("SELECT kind, entries, bytes FROM totals").fetchall()
+        return {kind: (entries, size) for kind, entries, size in rows}
+    
+    def counter(self, name: str) -> int:
+        with self._lock:
+            row = self.db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+    
+    def evict(self, max_bytes: int, target_bytes: int, policy: str, keep: Optional[str] = None) -> List[str]:
+        """
+        Remove entries until the total is at most target_bytes, if it exceeds max_bytes
+        
+        Victims are chosen and deleted in one write transaction, so two
+        processes never evict the same bytes twice. Returns the paths to
+        unlink; `keep` (the entry just written) is never chosen.
+        """
+        order = "last_access" if policy == "lru" else "hits, last_access"
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM totals").fetchone()[0]
+                victims: List[str] = []
+                if total > max_bytes:
+                    freed = 0
+                    cursor = self.db.execute(f"SELECT path, size FROM entries ORDER BY {order}")
+                    for path, size in cursor:
+                        if total - freed <= target_bytes:
+                            break
+                        if path == keep:
+                            continue
+                        victims.append(path)
+                        freed += size
+                    cursor.close()
+                    self.db.executemany("DELETE FROM entries WHERE path = ?", [(p,) for p in victims])
+                    self.db.execute(
+                        "INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+                        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                        (len(victims),),
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return victims
+    
+    def clear(self):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM totals")
+            self.db.execute("COMMIT")
+
 
 class GenerationCache:
     """Cache for expensive generation operations."""
     
-    def __init__(self, cache_dir: str = "/opt/hunyuan-video/cache"):
+    def __init__(self, cache_dir: str = "/opt/hunyuan-video/cache",
+                 max_bytes: Optional[int] = None, policy: Optional[str] = None):
         self.cache_dir = Path(cache_dir)
         self.embeddings_dir = self.cache_dir / "embeddings"
-        self.latents_dir = self.cache_dir / "latents"
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            float(os.getenv("CACHE_MAX_GB", "10")) * 1024 ** 3
+        )
+        self.policy = (policy or os.getenv("CACHE_EVICTION", "lru")).lower()
+        if self.policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown cache eviction policy: {self.policy}")
         
         # Create cache directories
         self.embeddings_dir.mkdir(parents=True, exist_ok=True)
-        self.latents_dir.mkdir(parents=True, exist_ok=True)
+        
+        manifest_path = self.cache_dir / "manifest.db"
+        is_new = not manifest_path.exists()
+        self.manifest = CacheManifest(manifest_path)
+        if is_new:
+            # Entries written before the manifest existed; the only directory walk
+            indexed = self._index_existing()
+            if indexed:
+                logger.info(f"Indexed {indexed} existing cache entries")
         
         logger.info(f"Cache initialized at {self.cache_dir}")
     
+    def _index_existing(self) -> int:
+        # Pickled entries from before the manifest are never read again (nothing
+        # in the cache is unpickled), so they are deleted rather than indexed;
+        # latents/ only ever held pickles
+        removed = 0
+        for path in self.embeddings_dir.glob("*.pkl"):
+            path.unlink(missing_ok=True)
+            removed += 1
+        legacy_latents = self.cache_dir / "latents"
+        if legacy_latents.is_dir():
+            removed += sum(1 for _ in legacy_latents.glob("*.pkl"))
+            shutil.rmtree(legacy_latents, ignore_errors=True)
+        if removed:
+            logger.info(f"Removed {removed} legacy pickle cache entries")
+        
+        count = 0
+        for path in self.embeddings_dir.iterdir():
+            kind = KINDS.get(path.suffix)
+            if kind and path.is_file() and not path.name.startswith("."):
+                self.manifest.record(self._relative(path), kind, path.stat().st_size)
+                count += 1
+        return count
+    
+    def _relative(self, path: Path) -> str:
+        return path.relative_to(self.cache_dir).as_posix()
+    
+    def _write(self, path: Path, data: bytes):
+        """Write an entry atomically, record it and enforce the byte budget"""
+        tensor_format.write_atomic(path, data)
+        relative = self._relative(path)
+        self.manifest.record(relative, KINDS[path.suffix], len(data))
+        victims = self.manifest.evict(self.max_bytes, int(self.max_bytes * LOW_WATER), self.policy, keep=relative)
+        for victim in victims:
+            (self.cache_dir / victim).unlink(missing_ok=True)
+        if victims:
+            logger.info(f"Evicted {len(victims)} cache entries ({self.policy})")
+    
+    def _hit(self, path: Path):
+        relative = self._relative(path)
+        if not self.manifest.touch(relative):
+            # Written by a process that predates the manifest
+            self.manifest.record(relative, KINDS[path.suffix], path.stat().st_size)
+    
+    def _read(self, path: Path, reader) -> Optional[Any]:
+        """reader(path), counting the hit; None if the entry is gone (evicted or never written)"""
+        try:
+            value = reader(path)
+        except FileNotFoundError:
+            # Only write when a stale row exists: a cold lookup stays read-only
+            relative = self._relative(path)
+            if self.manifest.contains(relative):
+                self.manifest.remove(relative)
+            return None
+        self._hit(path)
+        return value
+    
     def _get_prompt_hash(self, prompt: str) -> str:
-        """Generate unique hash for a prompt."""
-        return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+        """Generate unique hash for a prompt (case/whitespace/punctuation-insensitive)."""
+        return hashlib.sha256(canonicalize(prompt).encode()).hexdigest()[:16]
     
     def _get_cache_key(self, prompt: str, params: Optional[Dict] = None) -> str:
         """Generate cache key from prompt and parameters."""
-        key_data = {"prompt": prompt}
+        key_data = {"prompt": canonicalize(prompt)}
         if params:
             # Only cache based on parameters that affect embeddings
             relevant_params = {
-                k: v for k, v in params.items() 
+                k: v for k, v in params.items()
                 if k in ["cfg_scale", "flow_reverse"]
             }
             key_data.update(relevant_params)
@@ -48,52 +286,110 @@ class GenerationCache:
         key_str = json.dumps(key_data, sort_keys=True)
         return hashlib.sha256(key_str.encode()).hexdigest()[:16]
     
+    def _is_tensor_map(self, data: Any) -> bool:
+        return isinstance(data, dict) and bool(data) and all(
+            value is None or hasattr(value, "dtype") and hasattr(value, "shape")
+            for value in data.values()
+        )
+    
     def get_embedding(self, prompt: str, params: Optional[Dict] = None) -> Optional[Any]:
         """Retrieve cached text embeddings if available."""
         cache_key = self._get_cache_key(prompt, params)
-        cache_file = self.embeddings_dir / f"{cache_key}.pkl"
+        tensor_file = self.embeddings_dir / f"{cache_key}.hvt"
+        json_file = self.embeddings_dir / f"{cache_key}.json"
         
-        if cache_file.exists():
-            try:
-                with open(cache_file, 'rb') as f:
-                    data = pickle.load(f)
-                    logger.info(f"Cache HIT for prompt: {prompt[:50]}...")
-                    return data
-            except Exception as e:
-                logger.warning(f"Failed to load cache: {e}")
-                return None
+        try:
+            data = self._read(tensor_file, lambda path: tensor_format.load(path, as_="numpy")[0])
+            if data is None:
+                data = self._read(json_file, lambda path: json.loads(path.read_text()))
+        except Exception as e:
+            logger.warning(f"Failed to load cache: {e}")
+            return None
         
-        logger.info(f"Cache MISS for prompt: {prompt[:50]}...")
-        return None
+        if data is None:
+            logger.info(f"Cache MISS for prompt: {prompt[:50]}...")
+            return None
+        logger.info(f"Cache HIT for prompt: {prompt[:50]}...")
+        return data
     
     def set_embedding(self, prompt: str, embedding_data: Any, params: Optional[Dict] = None):
-        """Store text embeddings in cache."""
+        """Store text embeddings in cache (a dict of arrays, or JSON-serializable data)."""
         cache_key = self._get_cache_key(prompt, params)
-        cache_file = self.embeddings_dir / f"{cache_key}.pkl"
         
         try:
-            with open(cache_file, 'wb') as f:
-                pickle.dump(embedding_data, f)
+            if self._is_tensor_map(embedding_data):
+                self._write(self.embeddings_dir / f"{cache_key}.hvt", tensor_format.pack(embedding_data))
+            else:
+                self._write(self.embeddings_dir / f"{cache_key}.json", json.dumps(embedding_data).encode())
             logger.info(f"Cached embeddings for: {prompt[:50]}...")
         except Exception as e:
             logger.warning(f"Failed to cache embeddings: {e}")
     
-    def get_stats(self) -> Dict[str, int]:
-        """Get cache statistics."""
+    def embedding_key(self, prompt: str, encoder_version: str, **params) -> str:
+        """
+        Content address for prompt embeddings.
+        
+        Keyed by the canonical prompt, the text encoder version and any call
+        parameters that change the encoder output, so a model or template
+        change never reuses stale tensors.
+        """
+        key_data = {"prompt": canonicalize(prompt), "encoder_version": encoder_version, **params}
+        key_str = json.dumps(key_data, sort_keys=True, default=str)
+        return hashlib.sha256(key_str.encode()).hexdigest()
+    
+    def embedding_tensors_path(self, key: str) -> Path:
+        return self.embeddings_dir / f"{key}.hvt"
+    
+    def get_embedding_tensors(self, key: str, device: Any = "cpu") -> Optional[tuple]:
+        """
+        Load cached encoder outputs by content address, or None on a miss.
+        
+        The file is memory-mapped and the tensors are views into it, so the
+        only copy is the one onto `device`.
+        """
+        try:
+            return self._read(
+                self.embedding_tensors_path(key),
+                lambda path: tensor_format.as_sequence(*tensor_format.load(path, device=device)),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load embedding tensors {key[:12]}: {e}")
+            return None
+    
+    def set_embedding_tensors(self, key: str, tensors: Any):
+        """Store encoder outputs (a tuple of tensors, None allowed) by content address."""
+        try:
+            self._write(self.embedding_tensors_path(key), tensor_format.pack_sequence(tuple(tensors)))
+        except Exception as e:
+            logger.warning(f"Failed to cache embedding tensors {key[:12]}: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics (from the manifest's running totals; no directory walk)."""
+        totals = self.manifest.totals()
+        size = sum(size for _, size in totals.values())
         return {
-            "embeddings_cached": len(list(self.embeddings_dir.glob("*.pkl"))),
-            "latents_cached": len(list(self.latents_dir.glob("*.pkl"))),
-            "total_size_mb": sum(
-                f.stat().st_size for f in self.cache_dir.rglob("*.pkl")
-            ) // (1024 * 1024)
+            "embeddings_cached": totals.get("embedding", (0, 0))[0],
+            "embedding_tensors_cached": totals.get("embedding_tensors", (0, 0))[0],
+            "total_size_mb": size // (1024 * 1024),
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "eviction_policy": self.policy,
+            "evictions": self.manifest.counter("evictions"),
         }
     
     def clear(self):
         """Clear all caches."""
-        for cache_file in self.embeddings_dir.glob("*.pkl"):
-            cache_file.unlink()
-        for cache_file in self.latents_dir.glob("*.pkl"):
-            cache_file.unlink()
+        # Swap the directory out in one rename and delete the old tree in the
+        # background, instead of unlinking every file before returning
+        trash = self.embeddings_dir.with_name(f".{self.embeddings_dir.name}.{time.time_ns()}.deleted")
+        try:
+            self.embeddings_dir.rename(trash)
+        except FileNotFoundError:
+            trash = None
+        self.embeddings_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest.clear()
+        if trash is not None:
+            threading.Thread(target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True}, daemon=True).start()
         logger.info("Cache cleared")
 
 
@@ -105,5 +401,5 @@ def get_cache() -> GenerationCache:
     """Get or create global cache instance."""
     global _cache_instance
     if _cache_instance is None:
-        _cache_instance = GenerationCache()
+        _cache_instance = GenerationCache(os.getenv("CACHE_DIR", "/opt/hunyuan-video/cache"))
     return _cache_instance
@@ -1,38 +1,128 @@
 """
 Embedding Cache Manager with Redis
 Provides 15-20% speedup by caching text embeddings
+
+Lookups go through three tiers:
+- L1: in-process LRU, bounded by bytes (L1_CACHE_MAX_BYTES)
+- L2: Redis, shared by every API process
+- L3: GenerationCache's disk directory, shared with the warm worker
+A hit in a lower tier is promoted into the tiers above it, and a set writes
+through to all of them, so a prompt looked up twice in a row (generation, then
+/api/optimization/analyze) costs one network round trip at most. Hits are
+counted per tier in get_stats() and hunyuan_cache_tier_hits_total.
+
+Keys use the canonical prompt (prompt_index.canonicalize), so case, spacing
+and punctuation differences share an entry. With PROMPT_SIMILARITY_THRESHOLD
+set, a miss falls back to the most similar cached prompt above the threshold
+(PromptIndex, persisted in CACHE_DIR/prompt_index.txt).
+
+The Redis client is binary-safe (no response decoding): metadata is JSON
+encoded and decoded here. The embedding tensors themselves are read and
+written by the warm worker, straight from GenerationCache on disk.
 """
+import asyncio
 import os
 import json
 import hashlib
-from typing import Optional, Dict, Any
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
 import redis.asyncio as redis
 
+from cache import GenerationCache
+from metrics import CACHE_LOOKUPS, CACHE_TIER_HITS
+from prompt_index import PromptIndex, canonicalize
+
+TIERS = ("l1", "l2", "l3")
+
+
+class MemoryCache:
+    """LRU of decoded values with byte-accounted eviction and per-entry expiry"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()  # key -> (value, size, expires)
+    
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires = entry
+        if expires <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any, size: int, ttl: float):
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size, time.monotonic() + ttl)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+    
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 class CacheManager:
     def __init__(self):
         self.redis_host = os.getenv("REDIS_HOST", "redis")
         self.redis_port = int(os.getenv("REDIS_PORT", "6379"))
         self.enabled = os.getenv("ENABLE_CACHE", "true").lower() == "true"
+        self.cache_dir = os.getenv("CACHE_DIR", "/opt/hunyuan-video/cache")
         self.redis_client = None
+        self.disk: Optional[GenerationCache] = None
+        self.memory = MemoryCache(int(os.getenv("L1_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
         self.ttl = 3600  # 1 hour cache TTL
-        
+        self.similarity_threshold = float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", "0"))
+        self.similar: Optional[PromptIndex] = None
+        self.tier_hits = {tier: 0 for tier in TIERS}
+        self.similar_hits = 0
+        self.misses = 0
+    
     async def connect(self):
-        """Initialize Redis connection"""
+        """Initialize Redis connection and the disk tier"""
         if not self.enabled:
             print("⚠️ Cache disabled via ENABLE_CACHE=false")
             return
-            
+        
+        try:
+            self.disk = GenerationCache(self.cache_dir)
+        except OSError as e:
+            print(f"⚠️ Disk cache unavailable at {self.cache_dir}: {e}")
+        
+        if self.similarity_threshold > 0:
+            index_path = Path(self.cache_dir) / "prompt_index.txt" if self.disk else None
+            self.similar = PromptIndex(self.similarity_threshold, path=index_path)
+            # Lookups use whatever has been indexed so far while the rest loads
+            asyncio.create_task(asyncio.to_thread(self.similar.load))
+        
         try:
             self.redis_client = await redis.from_url(
                 f"redis://{self.redis_host}:{self.redis_port}",
-                encoding="utf-8",
-                decode_responses=True
+                decode_responses=False
             )
             await self.redis_client.ping()
             print(f"✅ Redis cache connected at {self.redis_host}:{self.redis_port}")
         except Exception as e:
-            print(f"⚠️ Redis unavailable, cache disabled: {e}")
-            self.enabled = False
+            print(f"⚠️ Redis unavailable, using in-process and disk tiers only: {e}")
             self.redis_client = None
     
     async def disconnect(self):
@@ -41,55 +131,134 @@ class CacheManager:
             await self.redis_client.close()
     
     def _hash_prompt(self, prompt: str) -> str:
-        """Create deterministic hash for prompt"""
-        return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+        """Create deterministic hash for prompt (case/whitespace/punctuation-insensitive)"""
+        return hashlib.sha256(canonicalize(prompt).encode()).hexdigest()[:16]
     
-    async def get_embedding(self, prompt: str) -> Optional[Dict[str, Any]]:
-        """Retrieve cached embedding for prompt"""
-        if not self.enabled or not self.redis_client:
+    def _record(self, cache: str, tier: Optional[str]):
+        if tier:
+            self.tier_hits[tier] += 1
+            CACHE_TIER_HITS.labels(cache=cache, tier=tier).inc()
+            CACHE_LOOKUPS.labels(cache=cache, result="hit").inc()
+        else:
+            self.misses += 1
+            CACHE_LOOKUPS.labels(cache=cache, result="miss").inc()
+    
+    async def _redis_get(self, key: str) -> Optional[bytes]:
+        if not self.redis_client:
             return None
-            
         try:
-            key = f"embed:{self._hash_prompt(prompt)}"
-            cached = await self.redis_client.get(key)
-            
-            if cached:
-                print(f"🎯 Cache HIT for prompt: {prompt[:50]}...")
-                return json.loads(cached)
-            else:
-                print(f"❌ Cache MISS for prompt: {prompt[:50]}...")
-                return None
+            return await self.redis_client.get(key)
         except Exception as e:
+            CACHE_LOOKUPS.labels(cache="redis", result="error").inc()
             print(f"⚠️ Cache read error: {e}")
             return None
     
-    async def set_embedding(self, prompt: str, embedding_data: Dict[str, Any]):
-        """Store embedding in cache"""
-        if not self.enabled or not self.redis_client:
+    async def _redis_set(self, key: str, value: bytes, ttl: int):
+        if not self.redis_client:
             return
-            
         try:
-            key = f"embed:{self._hash_prompt(prompt)}"
-            value = json.dumps(embedding_data)
-            await self.redis_client.setex(key, self.ttl, value)
-            print(f"💾 Cached embedding for: {prompt[:50]}...")
+            await self.redis_client.setex(key, ttl, value)
         except Exception as e:
             print(f"⚠️ Cache write error: {e}")
     
+    async def _lookup_embedding(self, prompt: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(tier, metadata) for a prompt, promoting lower-tier hits; (None, None) on a miss"""
+        key = f"embed:{self._hash_prompt(prompt)}"
+        data = self.memory.get(key)
+        if data is not None:
+            return "l1", data
+        
+        tier, raw = "l2", await self._redis_get(key)
+        if raw is not None:
+            data = json.loads(raw)
+        elif self.disk:
+            tier, data = "l3", await asyncio.to_thread(self.disk.get_embedding, prompt)
+            if data is not None:
+                raw = json.dumps(data).encode()
+                await self._redis_set(key, raw, self.ttl)
+        if data is None:
+            return None, None
+        self.memory.set(key, data, len(raw), self.ttl)
+        return tier, data
+    
+    async def get_embedding(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """Retrieve cached embedding metadata for prompt (L1 -> Redis -> disk -> similar prompt)"""
+        if not self.enabled:
+            return None
+        
+        tier, data = await self._lookup_embedding(prompt)
+        if data is None and self.similar is not None:
+            match = self.similar.nearest(prompt)
+            if match and match[0] != canonicalize(prompt):
+                tier, data = await self._lookup_embedding(match[0])
+                if data is not None:
+                    self.similar_hits += 1
+                    print(f"🔁 Near-duplicate HIT ({match[1]:.2f}) for prompt: {prompt[:50]}...")
+        
+        self._record("embedding", tier)
+        if data is None:
+            print(f"❌ Cache MISS for prompt: {prompt[:50]}...")
+        elif tier != "l1":
+            print(f"🎯 Cache HIT ({tier}) for prompt: {prompt[:50]}...")
+        return data
+    
+    async def set_embedding(self, prompt: str, embedding_data: Dict[str, Any]):
+        """Store embedding metadata in every tier"""
+        if not self.enabled:
+            return
+        
+        key = f"embed:{self._hash_prompt(prompt)}"
+        value = json.dumps(embedding_data).encode()
+        self.memory.set(key, embedding_data, len(value), self.ttl)
+        await self._redis_set(key, value, self.ttl)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set_embedding, prompt, embedding_data)
+        if self.similar is not None:
+            self.similar.add(prompt)
+        print(f"💾 Cached embedding for: {prompt[:50]}...")
+    
+    def tier_stats(self) -> Dict[str, Any]:
+        """Where lookups were answered, plus L1 occupancy"""
+        hits = sum(self.tier_hits.values())
+        lookups = hits + self.misses
+        return {
+            "lookups": lookups,
+            "misses": self.misses,
+            "hit_rate": self._calculate_hit_rate(hits, self.misses),
+            **{tier: {
+                "hits": tier_hits,
+                "hit_share": round(tier_hits / lookups * 100, 2) if lookups else 0.0,
+            } for tier, tier_hits in self.tier_hits.items()},
+            "similar_hits": self.similar_hits,
+            "similar_index_entries": len(self.similar) if self.similar is not None else None,
+            "l1_entries": len(self.memory),
+            "l1_bytes": self.memory.bytes,
+            "l1_max_bytes": self.memory.max_bytes,
+            "l1_evictions": self.memory.evictions,
+            "l2_connected": self.redis_client is not None,
+            "l3_enabled": self.disk is not None,
+        }
+    
     async def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        if not self.enabled or not self.redis_client:
+        if not self.enabled:
             return {
                 "enabled": False,
                 "status": "disabled"
             }
         
+        stats = {"enabled": True, "tiers": self.tier_stats()}
+        if self.disk:
+            stats["disk"] = await asyncio.to_thread(self.disk.get_stats)
+        if not self.redis_client:
+            return {**stats, "status": "degraded", "error": "Redis unavailable"}
+        
         try:
             info = await self.redis_client.info("stats")
             keys = await self.redis_client.dbsize()
             
             return {
-                "enabled": True,
+                **stats,
                 "status": "healthy",
                 "total_keys": keys,
                 "keyspace_hits": info.get("keyspace_hits", 0),
@@ -101,7 +270,7 @@ class CacheManager:
             }
         except Exception as e:
             return {
-                "enabled": True,
+                **stats,
                 "status": "error",
                 "error": str(e)
             }
@@ -0,0 +1,381 @@
+"""
+Step Calibration
+Offline sweep that measures how few denoising steps each prompt class needs
+
+Every step cut from a job saves one step of GPU time (about 11-15 s at
+540p/720p), but the step table in adaptive_optimizer.py was tuned by
+hand. This harness renders a prompt suite at several step counts
+through a pluggable generator and scores each clip against the highest-step
+render of the same prompt and seed, using cheap CPU-side proxies on small
+grayscale frames:
+- similarity: mean per-frame SSIM against the reference
+- flicker: mean |f[t+1] - 2 f[t] + f[t-1]|, the frame-to-frame change that
+  steady motion does not explain, as a ratio to the reference's
+- sharpness: variance of the Laplacian, as a ratio to the reference's
+For each resolution and complexity level (AdaptiveOptimizer's), the policy is
+the fewest steps at which every prompt of that level passes the thresholds,
+and keeps passing at every higher step count in the sweep. The result is
+written as the step-policy file step_policy.py loads at API startup.
+
+Generators:
+- stub: a synthetic clip per prompt and seed whose blur and noise decay with
+  the step count (slower for complex prompts); exercises the harness without
+  a GPU, its policy says nothing about the real model
+- worker: a warm worker (worker.py) renders each clip; frames are decoded and
+  downscaled with ffmpeg (FFMPEG_COMMAND)
+
+Usage:
+    python calibrate_steps.py --generator stub --output /tmp/step_policy.json
+    python calibrate_steps.py --generator worker --resolutions 540p 720p
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import shlex
+import subprocess
+import time
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from adaptive_optimizer import ComplexityLevel, adaptive_optimizer
+from optimizer import TIER_RESOLUTIONS, get_optimal_resolution
+from runtime_estimator import runtime_estimator
+from step_policy import STEP_POLICY_VERSION, step_policy
+from worker import DEFAULT_WORKER_ADDRESS, WorkerClient
+
+# Frames are scored as 8-bit grayscale at this size (16:9, like every tier)
+ANALYSIS_WIDTH = 96
+ANALYSIS_HEIGHT = 54
+
+RESOLUTION_SHAPES = {resolution: get_optimal_resolution(tier) for tier, resolution in TIER_RESOLUTIONS.items()}
+
+DEFAULT_SWEEP = [20, 25, 30, 35, 40, 45, 50]
+
+DEFAULT_THRESHOLDS = {
+    "min_similarity": 0.95,
+    "max_flicker_ratio": 1.10,
+    "min_sharpness_ratio": 0.90,
+}
+
+# Spread over the complexity levels; replace with --prompts for real runs
+DEFAULT_PROMPTS = [
+    "A still life of a vase on a table",
+    "Portrait of an old man, soft light",
+    "A calm lake at dawn",
+    "A cat walks on the grass, realistic style.",
+    "A woman walking on the beach at sunset, cinematic",
+    "A red car driving along a coastal road with the sea behind it, tracking shot",
+    "Aerial drone shot of a busy city at sunset, cinematic, volumetric light",
+    "A crowded night marketplace with neon signs, people walking and dancing, handheld camera, 4k",
+    "Several dancers spinning and jumping in a festival crowd with fire and sparkles, "
+    "dramatic lighting, tracking shot, photorealistic, 8k, masterpiece",
+    "A dragon flying over a burning city with multiple knights riding and chasing it through "
+    "the traffic, lightning, god rays, orbit camera, hyperrealistic, ultra detailed, cinematic",
+]
+
+# One clip: grayscale frames of ANALYSIS_WIDTH x ANALYSIS_HEIGHT bytes
+Frames = List[bytes]
+
+
+# --- Quality proxies --------------------------------------------------------
+
+def flicker(frames: Frames) -> float:
+    """Mean absolute second temporal difference, 0..1 (0 for fewer than 3 frames)"""
+    if len(frames) < 3:
+        return 0.0
+    total = 0
+    for before, frame, after in zip(frames, frames[1:], frames[2:]):
+        total += sum(abs(a - 2 * b + c) for a, b, c in zip(before, frame, after))
+    return total / ((len(frames) - 2) * len(frames[0]) * 255)
+
+
+def sharpness(frames: Frames, width: int = ANALYSIS_WIDTH) -> float:
+    """Mean per-frame variance of the 4-neighbour Laplacian, on 0..1 intensities"""
+    total = 0.0
+    for frame in frames:
+        rows = [frame[y:y + width] for y in range(0, len(frame), width)]
+        count = sum_ = sum_sq = 0
+        for up, row, down in zip(rows, rows[1:], rows[2:]):
+            for value in (4 * c - l - r - u - d for c, l, r, u, d in
+                          zip(row[1:-1], row[:-2], row[2:], up[1:-1], down[1:-1])):
+                sum_ += value
+                sum_sq += value * value
+            count += width - 2
+        mean = sum_ / count
+        total += sum_sq / count - mean * mean
+    return total / len(frames) / 255 ** 2
+
+
+def similarity(frames: Frames, reference: Frames) -> float:
+    """Mean per-frame SSIM (from whole-frame statistics) against the reference"""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    scores = []
+    for a, b in zip(frames, reference):
+        n = len(a)
+        mean_a, mean_b = sum(a) / n, sum(b) / n
+        var_a = sum(x * x for x in a) / n - mean_a * mean_a
+        var_b = sum(y * y for y in b) / n - mean_b * mean_b
+        covariance = sum(x * y for x, y in zip(a, b)) / n - mean_a * mean_b
+        scores.append((2 * mean_a * mean_b + c1) * (2 * covariance + c2)
+                      / ((mean_a * mean_a + mean_b * mean_b + c1) * (var_a + var_b + c2)))
+    return sum(scores) / len(scores)
+
+
+def score(frames: Frames, reference: Frames, reference_flicker: float, reference_sharpness: float) -> Dict[str, float]:
+    # The epsilon keeps ratios finite for static, noise-free references
+    epsilon = 1e-3
+    return {
+        "similarity": round(similarity(frames, reference), 4),
+        "flicker_ratio": round((flicker(frames) + epsilon) / (reference_flicker + epsilon), 4),
+        "sharpness_ratio": round((sharpness(frames) + epsilon) / (reference_sharpness + epsilon), 4),
+    }
+
+
+def passes(scores: Dict[str, float], thresholds: Dict[str, float]) -> bool:
+    return (scores["similarity"] >= thresholds["min_similarity"]
+            and scores["flicker_ratio"] <= thresholds["max_flicker_ratio"]
+            and scores["sharpness_ratio"] >= thresholds["min_sharpness_ratio"])
+
+
+# --- Generators -------------------------------------------------------------
+
+LEVEL_ORDER = [level.value for level in ComplexityLevel]
+
+
+class StubGenerator:
+    """
+    GPU-free stand-in for the model. Each prompt and seed gets a fixed clip of
+    moving shapes; fewer steps leave more blur and per-frame noise, and complex
+    prompts (by AdaptiveOptimizer's level) and larger resolutions converge slower.
+    """
+    name = "stub"
+    RESOLUTION_FACTOR = {"preview": 0.85, "540p": 1.0, "720p": 1.15}
+
+    def generate(self, prompt: str, steps: int, seed: int, resolution: str, frames: int) -> Frames:
+        level, _ = adaptive_optimizer.analyze_prompt(prompt, log=False)
+        index = LEVEL_ORDER.index(level.value)
+        # Share of the clip not yet denoised
+        residual = math.exp(-steps / ((5 + 2.5 * index) * self.RESOLUTION_FACTOR.get(resolution, 1.0)))
+        clean, blurred = _stub_clip(prompt, seed, frames, index)
+        rng = random.Random(f"{prompt}|{seed}|{resolution}|{steps}")
+        amplitude = 0.6 * residual
+        clip = []
+        for sharp, soft in zip(clean, blurred):
+            noise = rng.randbytes(len(sharp))
+            clip.append(bytes(
+                min(255, max(0, int(s + residual * (b - s) + amplitude * (n - 128))))
+                for s, b, n in zip(sharp, soft, noise)
+            ))
+        return clip
+
+
+@lru_cache(maxsize=64)
+def _stub_clip(prompt: str, seed: int, frames: int, shapes: int) -> Tuple[Tuple[bytes, ...], Tuple[bytes, ...]]:
+    """(sharp, box-blurred) frames of a gradient with 2 + shapes moving squares"""
+    rng = random.Random(hashlib.sha256(f"{prompt}|{seed}".encode()).digest())
+    width, height = ANALYSIS_WIDTH, ANALYSIS_HEIGHT
+    slope = rng.uniform(0.5, 1.5)
+    boxes = [(rng.uniform(0, width), rng.uniform(0, height), rng.uniform(-1.5, 1.5), rng.uniform(-1, 1),
+              rng.randint(4, 12), rng.randint(0, 255)) for _ in range(2 + shapes)]
+    clean, blurred = [], []
+    for t in range(frames):
+        pixels = [int(40 + slope * (x + y)) for y in range(height) for x in range(width)]
+        for x0, y0, dx, dy, size, shade in boxes:
+            left, top = int(x0 + dx * t) % width, int(y0 + dy * t) % height
+            for y in range(top, min(top + size, height)):
+                pixels[y * width + left:y * width + min(left + size, width)] = [shade] * (min(left + size, width) - left)
+        clean.append(bytes(min(255, p) for p in pixels))
+        blurred.append(_box_blur(clean[-1], width))
+    return tuple(clean), tuple(blurred)
+
+
+def _box_blur(frame: bytes, width: int, radius: int = 2) -> bytes:
+    height = len(frame) // width
+    rows = [frame[y * width:(y + 1) * width] for y in range(height)]
+    horizontal = []
+    for row in rows:
+        horizontal.append([sum(row[max(0, x - radius):x + radius + 1]) // len(row[max(0, x - radius):x + radius + 1])
+                           for x in range(width)])
+    out = bytearray(len(frame))
+    for y in range(height):
+        window = horizontal[max(0, y - radius):y + radius + 1]
+        for x in range(width):
+            out[y * width + x] = sum(row[x] for row in window) // len(window)
+    return bytes(out)
+
+
+class WorkerGenerator:
+    """Renders on a warm worker and decodes the saved clip with ffmpeg"""
+    name = "worker"
+
+    def __init__(self, address: str, save_dir: Path, ffmpeg_command: List[str], timeout: float = 3600.0):
+        self.client = WorkerClient(address)
+        self.save_dir = save_dir
+        self.ffmpeg_command = ffmpeg_command
+        self.timeout = timeout
+
+    def generate(self, prompt: str, steps: int, seed: int, resolution: str, frames: int) -> Frames:
+        height, width = RESOLUTION_SHAPES[resolution]
+        params = {
+            "prompt": prompt, "height": height, "width": width, "video_length": frames,
+            "infer_steps": steps, "seed": seed, "cfg_scale": 6.0, "flow_reverse": True,
+            "save_path": str(self.save_dir / f"{uuid.uuid4()}"),
+        }
+        video = asyncio.run(self._generate(params))
+        return decode_frames(self.ffmpeg_command, video, self.timeout)
+
+    async def _generate(self, params: Dict[str, Any]) -> str:
+        async for event in self.client.generate(f"calibration-{uuid.uuid4()}", params):
+            if event["type"] == "done":
+                return event["video_path"]
+            if event["type"] == "error":
+                raise RuntimeError(f"Worker failed: {event['error']}")
+        raise RuntimeError("Worker closed the connection")
+
+
+def decode_frames(ffmpeg_command: List[str], video: str, timeout: float = 600.0) -> Frames:
+    """All frames of a clip as grayscale ANALYSIS_WIDTH x ANALYSIS_HEIGHT bytes"""
+    result = subprocess.run(
+        [*ffmpeg_command, "-v", "error", "-i", video,
+         "-vf", f"scale={ANALYSIS_WIDTH}:{ANALYSIS_HEIGHT},format=gray", "-f", "rawvideo", "-"],
+        capture_output=True, timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed on {video}: {result.stderr.decode(errors='replace')[-500:]}")
+    size = ANALYSIS_WIDTH * ANALYSIS_HEIGHT
+    return [result.stdout[i:i + size] for i in range(0, len(result.stdout) - size + 1, size)]
+
+
+# --- Calibration ------------------------------------------------------------
+
+def calibrate(generate: Callable[[str, int, int, str, int], Frames], prompts: List[str], sweep: List[int],
+              resolutions: List[str], seeds: List[int], frames: int,
+              thresholds: Dict[str, float] = DEFAULT_THRESHOLDS, log: Callable[[str], None] = print) -> Dict[str, Any]:
+    """
+    Run the sweep and derive the policy
+
+    Returns the step-policy file contents (without generator/created_at)
+    """
+    sweep = sorted(set(sweep))
+    reference_steps = sweep[-1]
+    levels = {prompt: adaptive_optimizer.analyze_prompt(prompt, log=False) for prompt in prompts}
+
+    # resolution -> level -> steps -> per (prompt, seed) scores
+    results: Dict[str, Dict[str, Dict[int, List[Dict[str, float]]]]] = {}
+    for resolution in resolutions:
+        for prompt in prompts:
+            level = levels[prompt][0].value
+            by_steps = results.setdefault(resolution, {}).setdefault(level, {})
+            for seed in seeds:
+                start = time.perf_counter()
+                reference = generate(prompt, reference_steps, seed, resolution, frames)
+                reference_flicker, reference_sharpness = flicker(reference), sharpness(reference)
+                by_steps.setdefault(reference_steps, []).append(
+                    {"similarity": 1.0, "flicker_ratio": 1.0, "sharpness_ratio": 1.0})
+                for steps in sweep[:-1]:
+                    clip = generate(prompt, steps, seed, resolution, frames)
+                    by_steps.setdefault(steps, []).append(
+                        score(clip, reference, reference_flicker, reference_sharpness))
+                log(f"📐 {resolution} {level:<12} seed {seed} {time.perf_counter() - start:6.1f}s  {prompt[:50]}")
+
+    policy: Dict[str, Dict[str, int]] = {}
+    measurements: Dict[str, Dict[str, Any]] = {}
+    savings: Dict[str, Dict[str, Any]] = {}
+    for resolution, by_level in results.items():
+        # Savings are quoted for a full-length (129 frame) job
+        seconds_per_step = runtime_estimator.predict(resolution, 129, 1)["seconds_per_step"]
+        for level, by_steps in by_level.items():
+            # Fewest steps from which every higher step count passes too
+            chosen = reference_steps
+            for steps in reversed(sweep):
+                if not all(passes(s, thresholds) for s in by_steps[steps]):
+                    break
+                chosen = steps
+            policy.setdefault(resolution, {})[level] = chosen
+            measurements.setdefault(resolution, {})[level] = {
+                str(steps): {
+                    "min_similarity": min(s["similarity"] for s in scores),
+                    "max_flicker_ratio": max(s["flicker_ratio"] for s in scores),
+                    "min_sharpness_ratio": min(s["sharpness_ratio"] for s in scores),
+                    "passed": sum(passes(s, thresholds) for s in scores),
+                    "clips": len(scores),
+                }
+                for steps, scores in sorted(by_steps.items())
+            }
+            hand_picked = next(steps for level_, steps in levels.values() if level_.value == level)
+            savings.setdefault(resolution, {})[level] = {
+                "hand_picked_steps": hand_picked,
+                "calibrated_steps": chosen,
+                "gpu_seconds_saved_per_job": round((hand_picked - chosen) * seconds_per_step, 1),
+            }
+
+    return {
+        "version": STEP_POLICY_VERSION,
+        "policy": policy,
+        "prompts": len(prompts),
+        "sweep": sweep,
+        "seeds": seeds,
+        "frames": frames,
+        "thresholds": thresholds,
+        "savings": savings,
+        "measurements": measurements,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate denoising steps per resolution and prompt complexity")
+    parser.add_argument("--generator", choices=["stub", "worker"], default="stub")
+    parser.add_argument("--socket", default=os.getenv("WORKER_ADDRESS", DEFAULT_WORKER_ADDRESS),
+                        help="Warm worker address (worker generator)")
+    parser.add_argument("--save-dir", default="/opt/hunyuan-video/results/calibration",
+                        help="Where the worker saves the clips (visible to ffmpeg)")
+    parser.add_argument("--prompts", help="Prompt suite, one prompt per line (default: built-in suite)")
+    parser.add_argument("--sweep", type=int, nargs="+", default=DEFAULT_SWEEP,
+                        help="Step counts to render; the largest is the reference")
+    parser.add_argument("--resolutions", nargs="+", choices=sorted(RESOLUTION_SHAPES),
+                        default=list(TIER_RESOLUTIONS.values()))
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--frames", type=int, default=33, help="video_length of each clip")
+    parser.add_argument("--min-similarity", type=float, default=DEFAULT_THRESHOLDS["min_similarity"])
+    parser.add_argument("--max-flicker-ratio", type=float, default=DEFAULT_THRESHOLDS["max_flicker_ratio"])
+    parser.add_argument("--min-sharpness-ratio", type=float, default=DEFAULT_THRESHOLDS["min_sharpness_ratio"])
+    parser.add_argument("--output", default=str(step_policy.path), help="Step-policy file (STEP_POLICY_PATH)")
+    args = parser.parse_args()
+
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        prompts = [line.strip() for line in Path(args.prompts).read_text().splitlines() if line.strip()]
+
+    if args.generator == "worker":
+        generator = WorkerGenerator(args.socket, Path(args.save_dir),
+                                    shlex.split(os.getenv("FFMPEG_COMMAND", "docker exec hunyuan-video ffmpeg")))
+    else:
+        generator = StubGenerator()
+
+    thresholds = {
+        "min_similarity": args.min_similarity,
+        "max_flicker_ratio": args.max_flicker_ratio,
+        "min_sharpness_ratio": args.min_sharpness_ratio,
+    }
+    result = calibrate(generator.generate, prompts, args.sweep, args.resolutions, args.seeds, args.frames, thresholds)
+    result = {"generator": generator.name, "created_at": datetime.now().isoformat(), **result}
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    partial = output.with_name(f".{output.name}.partial")
+    partial.write_text(json.dumps(result, indent=2))
+    partial.replace(output)
+
+    print(json.dumps({"policy": result["policy"], "savings": result["savings"]}, indent=2))
+    print(f"💾 Step policy written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Health Monitor
+Container and worker state polled in the background for /api/health
+
+The health endpoint used to run `docker inspect` with subprocess.run inside
+the request, blocking the event loop (and every WebSocket broadcast) on each
+load balancer probe. The monitor polls every HEALTH_CHECK_INTERVAL seconds
+instead:
+- the model container's state, with `docker inspect` as an async subprocess
+  under a timeout
+- every warm worker's ping: loaded, busy, GPU memory, jobs completed and its
+  last successful job. Devices that do not answer are marked unhealthy, so
+  the scheduler stops placing jobs on them until they answer again
+The endpoint returns the last snapshot, its age and live queue counters, with
+no I/O. A snapshot older than HEALTH_STALE_AFTER seconds (default three
+intervals) reports status "stale".
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from metrics import SUBPROCESS_FAILURES
+from worker_pool import WorkerPool, worker_pool
+
+CONTAINER_NAME = "hunyuan-video"
+
+
+class HealthMonitor:
+    def __init__(self, pool: WorkerPool = worker_pool, container: str = CONTAINER_NAME):
+        self.pool = pool
+        self.container = container
+        self.interval = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+        self.stale_after = float(os.getenv("HEALTH_STALE_AFTER", str(self.interval * 3)))
+        self.command_timeout = 5.0
+        self.container_state: Dict[str, Any] = {}
+        self.worker_state: Dict[str, Dict[str, Any]] = {}  # address -> last ping (None if unreachable)
+        self.last_jobs: Dict[str, Dict[str, Any]] = {}     # device name -> last completed job
+        self.checked_at: Optional[float] = None
+        self.check_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Run a first check, then keep polling in the background"""
+        await self.check()
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                # Keep polling; the snapshot goes stale and the endpoint says so
+                print(f"⚠️ Health check failed: {e}")
+
+    async def check(self):
+        start = time.monotonic()
+        await asyncio.gather(self._check_container(), self._check_workers())
+        self.checked_at = time.time()
+        self.check_seconds = round(time.monotonic() - start, 3)
+
+    async def _check_container(self):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "docker", "inspect", "-f", "{{.State.Running}} {{.State.Status}} {{.State.StartedAt}}",
+                self.container,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+        except OSError as e:
+            SUBPROCESS_FAILURES.labels(command="docker_inspect").inc()
+            self.container_state = {"running": False, "error": str(e)}
+            return
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=self.command_timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            SUBPROCESS_FAILURES.labels(command="docker_inspect").inc()
+            self.container_state = {"running": False, "error": "docker inspect timed out"}
+            return
+        if process.returncode != 0:
+            SUBPROCESS_FAILURES.labels(command="docker_inspect").inc()
+            self.container_state = {"running": False, "error": "container not found"}
+            return
+        fields = stdout.decode().split()
+        self.container_state = {
+            "running": bool(fields) and fields[0] == "true",
+            "status": fields[1] if len(fields) > 1 else None,
+            "started_at": fields[2] if len(fields) > 2 else None,
+        }
+
+    async def _check_workers(self):
+        clients = {device.address: device.client for device in self.pool.devices}
+        results = await asyncio.gather(*(client.ping() for client in clients.values()))
+        self.worker_state = dict(zip(clients, results))
+        for device in self.pool.devices:
+            device.healthy = self.worker_state.get(device.address) is not None
+
+    def record_job(self, job: Dict[str, Any]):
+        """Remember a device's last completed job (called on job transitions)"""
+        if job["status"] == "completed" and job.get("worker"):
+            self.last_jobs[job["worker"]] = {
+                "job_id": job["job_id"],
+                "completed_at": job.get("completed_at"),
+                "duration": job.get("duration"),
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cached state; no I/O"""
+        age = time.time() - self.checked_at if self.checked_at is not None else None
+        container_running = bool(self.container_state.get("running"))
+        if age is None:
+            status = "starting"
+        elif age > self.stale_after:
+            status = "stale"
+        else:
+            status = "healthy" if container_running else "degraded"
+
+        workers = []
+        for device in self.pool.devices:
+            ping = self.worker_state.get(device.address)
+            workers.append({
+                **device.to_dict(),
+                "reachable": ping is not None,
+                "loaded": bool(ping and ping.get("loaded")),
+                "busy": bool(ping and ping.get("busy")),
+                "gpu": ping.get("gpu") if ping else None,
+                "worker_jobs_completed": ping.get("jobs_completed") if ping else None,
+                "worker_last_success_at": _isoformat(ping.get("last_success_at")) if ping else None,
+                "last_completed_job": self.last_jobs.get(device.name),
+            })
+
+        return {
+            "status": status,
+            "container_running": container_running,
+            "container": self.container_state,
+            "checked_at": _isoformat(self.checked_at),
+            "staleness_seconds": round(age, 3) if age is not None else None,
+            "check_seconds": self.check_seconds,
+            "workers_healthy": sum(1 for w in workers if w["reachable"]),
+            "workers": workers,
+        }
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+# Global health monitor instance
+health_monitor = HealthMonitor()
@@ -0,0 +1,348 @@
+"""
+Job Store
+Durable job history with indexed, paginated queries
+
+Jobs used to live only in a module-level dict, so a restart lost all history
+and every listing scanned every job. The store keeps:
+- In-flight records (queued/processing) in memory as plain dicts, so the
+  generation tasks keep mutating them in place on the hot path
+- Every record in a backend, written through when a job's status changes;
+  step-by-step progress stays in memory
+- Terminal records only in the backend; reads fetch them by primary key
+
+Listing is newest first with keyset pagination: the cursor encodes the last
+row's (created_at, job_id), so each page is one indexed range query however
+large the history grows.
+
+Backends: SQLite (default, JOB_DB_PATH) or JOB_STORE=memory for an in-memory
+SQLite database that is discarded on exit. Other backends subclass JobStore
+and implement the _write/_read/_delete/_query/_counts/_completed_summary/
+_completed_durations/_requeue_processing/_find_completed methods.
+"""
+import base64
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Fields reset when an interrupted job goes back to the queue
+RECOVERY_RESET = {
+    "status": "queued",
+    "progress": 0,
+    "started_at": None,
+    "worker": None,
+    "queue_position": None,
+    "step": None,
+    "total_steps": None,
+    "seconds_per_step": None,
+    "eta_seconds": None,
+}
+
+
+def encode_cursor(created_at: str, job_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{job_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Raises ValueError for a malformed cursor"""
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, job_id
+
+
+class JobStore:
+    """In-flight records in memory, written through to a backend"""
+
+    def __init__(self):
+        # job_id -> record for queued/processing jobs
+        self.live: Dict[str, dict] = {}
+        self._persisted_status: Dict[str, str] = {}
+        # Called with (previous status or None, record) on each status change,
+        # and with the record when a job is deleted; set by the app
+        self.on_transition: Optional[Callable[[Optional[str], dict], None]] = None
+        self.on_delete: Optional[Callable[[dict], None]] = None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        if job_id in self.live:
+            return self.live[job_id]
+        return self._read(job_id)
+
+    def save(self, job_id: str, force: bool = False):
+        """
+        Persist an in-flight job if its status changed since the last write
+
+        Terminal jobs are written and dropped from memory. Jobs that are not
+        in memory (e.g. deleted while running) are ignored.
+        """
+        record = self.live.get(job_id)
+        if record is None:
+            return
+        status = record["status"]
+        previous = self._persisted_status.get(job_id)
+        if force or previous != status:
+            self._write(record)
+            self._persisted_status[job_id] = status
+            if previous != status and self.on_transition:
+                self.on_transition(previous, record)
+        if status in TERMINAL_STATUSES:
+            self.live.pop(job_id, None)
+            self._persisted_status.pop(job_id, None)
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> Optional[dict]:
+        """
+        Set fields on a job without a status change (e.g. files added after it
+        finished); returns the record, or None if the job is gone
+        """
+        record = self.live.get(job_id)
+        if record is not None:
+            record.update(fields)
+            if job_id in self._persisted_status:
+                self._write(record)
+            return record
+        record = self._read(job_id)
+        if record is None:
+            return None
+        record.update(fields)
+        self._write(record)
+        return record
+
+    def revive(self, record: dict):
+        """Bring a finished job back in flight (e.g. a retry); its next save reports the transition"""
+        self.live[record["job_id"]] = record
+        self._persisted_status[record["job_id"]] = record["status"]
+
+    def delete(self, job_id: str) -> bool:
+        record = self.get(job_id)
+        persisted = job_id in self._persisted_status or job_id not in self.live
+        self.live.pop(job_id, None)
+        self._persisted_status.pop(job_id, None)
+        deleted = self._delete(job_id)
+        if record and persisted and self.on_delete:
+            self.on_delete(record)
+        return deleted or record is not None
+
+    def list(self, status: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+             cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of jobs, newest first
+
+        Returns:
+            (records, next_cursor); next_cursor is None on the last page
+
+        Raises:
+            ValueError: malformed cursor
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = decode_cursor(cursor) if cursor else None
+        # Fetch one extra row to know whether another page exists
+        rows = self._query(status, limit + 1, after)
+        # In-flight rows carry their status at the last write; use the live copy
+        records = [self.live.get(row["job_id"], row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last["created_at"], last["job_id"])
+        return records, next_cursor
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        return self._counts()
+
+    def completed_summary(self) -> Dict[str, float]:
+        """count, total_duration, cache_hits and total_steps over completed jobs"""
+        return self._completed_summary()
+
+    def completed_durations(self) -> Iterator[float]:
+        """Duration of every completed job (for rebuilding histograms)"""
+        return self._completed_durations()
+
+    def find_completed(self, request_key: str) -> Optional[dict]:
+        """Newest completed job submitted with this request key (see singleflight)"""
+        return self._find_completed(request_key)
+
+    def recover(self) -> List[dict]:
+        """
+        Requeue jobs interrupted by a crash or restart
+
+        Jobs left processing go back to queued; every queued job is loaded
+        into memory and returned oldest first so the caller can resubmit it.
+        """
+        requeued = self._requeue_processing(RECOVERY_RESET)
+        records, cursor = [], None
+        while True:
+            page, cursor = self.list(status="queued", limit=MAX_PAGE_SIZE, cursor=cursor)
+            records.extend(page)
+            if not cursor:
+                break
+        records.reverse()
+        for record in records:
+            self.live[record["job_id"]] = record
+            self._persisted_status[record["job_id"]] = record["status"]
+        if records:
+            print(f"♻️ Recovered {len(records)} queued job(s), {requeued} interrupted mid-generation")
+        return records
+
+    # Backend interface
+
+    def _write(self, record: dict):
+        raise NotImplementedError
+
+    def _read(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def _delete(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def _query(self, status: Optional[str], limit: int,
+               after: Optional[Tuple[str, str]]) -> List[dict]:
+        raise NotImplementedError
+
+    def _counts(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def _completed_summary(self) -> Dict[str, float]:
+        raise NotImplementedError
+
+    def _completed_durations(self) -> Iterator[float]:
+        raise NotImplementedError
+
+    def _requeue_processing(self, reset: Dict[str, Any]) -> int:
+        raise NotImplementedError
+
+    def _find_completed(self, request_key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+
+class SqliteJobStore(JobStore):
+    """
+    SQLite backend: one row per job, the full record as JSON plus indexed columns
+
+    WAL mode keeps readers and the writer from blocking each other, and
+    synchronous=NORMAL avoids an fsync per status change.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            batch_id TEXT,
+            duration REAL,
+            request_key TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at, job_id);
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at, job_id);
+        CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id);
+    """
+
+    def __init__(self, path: str = "/opt/hunyuan-video/results/jobs.db"):
+        super().__init__()
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Only used from the event loop thread; the flag lets TestClient/uvicorn
+        # open it in one thread and serve from another
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "request_key" not in columns:
+            # Databases created before request deduplication
+            self.db.execute("ALTER TABLE jobs ADD COLUMN request_key TEXT")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_request_key ON jobs (request_key, status, created_at)"
+        )
+
+    def close(self):
+        self.db.close()
+
+    def _write(self, record: dict):
+        self.db.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, created_at, batch_id, duration, request_key, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (record["job_id"], record["status"], record["created_at"], record.get("batch_id"),
+             record.get("duration"), record.get("request_key"), json.dumps(record))
+        )
+
+    def _read(self, job_id: str) -> Optional[dict]:
+        row = self.db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def _delete(self, job_id: str) -> bool:
+        return self.db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount > 0
+
+    def _query(self, status: Optional[str], limit: int,
+               after: Optional[Tuple[str, str]]) -> List[dict]:
+        clauses, args = [], []
+        if status:
+            clauses.append("status = ?")
+            args.append(status)
+        if after:
+            clauses.append("(created_at < ? OR (created_at = ? AND job_id < ?))")
+            args.extend([after[0], after[0], after[1]])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.db.execute(
+            f"SELECT data FROM jobs {where} ORDER BY created_at DESC, job_id DESC LIMIT ?",
+            (*args, limit)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def _counts(self) -> Dict[str, int]:
+        rows = self.db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _completed_summary(self) -> Dict[str, float]:
+        row = self.db.execute(
+            "SELECT COUNT(*) AS count, "
+            "COALESCE(SUM(duration), 0) AS total_duration, "
+            "COALESCE(SUM(json_extract(data, '$.optimization.cache_hit')), 0) AS cache_hits, "
+            "COALESCE(SUM(COALESCE(json_extract(data, '$.optimization.final_steps'), 30)), 0) AS total_steps "
+            "FROM jobs WHERE status = 'completed'"
+        ).fetchone()
+        return dict(row)
+
+    def _completed_durations(self) -> Iterator[float]:
+        cursor = self.db.execute(
+            "SELECT duration FROM jobs WHERE status = 'completed' AND duration IS NOT NULL"
+        )
+        return (row["duration"] for row in cursor)
+
+    def _requeue_processing(self, reset: Dict[str, Any]) -> int:
+        rows = self.db.execute("SELECT data FROM jobs WHERE status = 'processing'").fetchall()
+        for row in rows:
+            self._write({**json.loads(row["data"]), **reset})
+        return len(rows)
+
+    def _find_completed(self, request_key: str) -> Optional[dict]:
+        row = self.db.execute(
+            "SELECT data FROM jobs WHERE request_key = ? AND status = 'completed' "
+            "ORDER BY created_at DESC LIMIT 1",
+            (request_key,)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+
+def create_job_store() -> JobStore:
+    """Backend selected by JOB_STORE (sqlite or memory)"""
+    backend = os.getenv("JOB_STORE", "sqlite").lower()
+    if backend == "memory":
+        return SqliteJobStore(":memory:")
+    if backend != "sqlite":
+        raise ValueError(f"Unknown JOB_STORE backend: {backend}")
+    return SqliteJobStore(os.getenv("JOB_DB_PATH", "/opt/hunyuan-video/results/jobs.db"))
+
+
+# Global job store instance
+job_store = create_job_store()
@@ -0,0 +1,106 @@
+"""
+Latent Cache
+Intermediate and final denoising latents, for resuming and refining jobs
+
+The warm worker saves the latents every `checkpoint_every` steps under a key of
+(prompt embedding key, seed, resolution, length, scheduler settings):
+- a job that fails or is preempted and is retried with the same parameters
+  resumes from its last checkpoint instead of step 0
+- the final (fully denoised) latents of a run are kept, so a higher-resolution
+  run of the same prompt and seed can start from them upsampled and partially
+  re-noised instead of from pure noise
+
+Files use tensor_format and are written atomically. Total size is capped at
+max_bytes; the least recently used files are evicted first.
+"""
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import tensor_format
+
+
+class LatentCache:
+    def __init__(self, directory: str, max_bytes: int = 20 * 1024 ** 3, checkpoint_every: int = 10):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.checkpoint_every = checkpoint_every
+        self._lock = threading.Lock()
+        # file name -> [size, last access]; rebuilt from the directory at startup
+        self._files: Dict[str, list] = {}
+        for path in self.directory.glob("*.hvt"):
+            stat = path.stat()
+            self._files[path.name] = [stat.st_size, stat.st_atime]
+        self.bytes = sum(size for size, _ in self._files.values())
+        self.evictions = 0
+
+    @staticmethod
+    def key(prompt_key: str, seed: int, height: int, width: int, video_length: int,
+            scheduler: Dict[str, Any]) -> str:
+        """Content address of a run's latents"""
+        key_data = {
+            "prompt": prompt_key, "seed": seed, "height": height, "width": width,
+            "video_length": video_length, "scheduler": scheduler,
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key: str, kind: str) -> Path:
+        return self.directory / f"{key}.{kind}.hvt"
+
+    def save(self, key: str, kind: str, latents: Any, meta: Optional[Dict[str, Any]] = None):
+        """Store latents ("checkpoint" or "final"), replacing any previous entry of that kind"""
+        path = self._path(key, kind)
+        data = tensor_format.pack({"latents": latents}, meta)
+        with self._lock:
+            tensor_format.write_atomic(path, data)
+            previous = self._files.get(path.name)
+            self.bytes += len(data) - (previous[0] if previous else 0)
+            self._files[path.name] = [len(data), time.time()]
+            self._evict()
+
+    def load(self, key: str, kind: str, device: Any = None) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """(latents, meta) or None; the tensor is a view of the memory-mapped file until moved"""
+        path = self._path(key, kind)
+        with self._lock:
+            entry = self._files.get(path.name)
+            if entry is None:
+                return None
+            entry[1] = time.time()
+        try:
+            tensors, meta = tensor_format.load(path, device=device)
+        except (OSError, ValueError):
+            self.discard(key, kind)
+            return None
+        return tensors["latents"], meta
+
+    def discard(self, key: str, kind: str):
+        path = self._path(key, kind)
+        with self._lock:
+            entry = self._files.pop(path.name, None)
+            if entry:
+                self.bytes -= entry[0]
+            path.unlink(missing_ok=True)
+
+    def _evict(self):
+        """Drop least recently used files until under budget (lock held)"""
+        while self.bytes > self.max_bytes and len(self._files) > 1:
+            name = min(self._files, key=lambda n: self._files[n][1])
+            size, _ = self._files.pop(name)
+            self.bytes -= size
+            self.evictions += 1
+            (self.directory / name).unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "checkpoint_every": self.checkpoint_every,
+            }
+
@@ -3,23 +3,43 @@ HunyuanVideo Web UI - FastAPI Backend with Optimization
 Modern API for video generation with Redis caching and adaptive generation
 """
 import asyncio
-import json
 import os
+import random
+import shutil
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-import aiofiles
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
-import subprocess
 
 # Import optimization modules
 from cache_manager import cache_manager
 from adaptive_optimizer import adaptive_optimizer
+from worker import worker_client
+from progress import ProgressParser, ProgressTracker
+from broadcaster import broadcaster
+from health import health_monitor
+from job_store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, job_store
+from result_store import ResultStore
+from stats import stats_aggregator
+from metrics import (
+    JOBS_DEDUPLICATED, SUBPROCESS_FAILURES, bind_gauges, job_labels, observe_job,
+    render as render_metrics
+)
+from postprocess import ARTIFACT_FILES, ARTIFACTS, post_processor
+from runtime_estimator import runtime_estimator
+from step_policy import step_policy
+from streaming import PLAYLIST_MEDIA_TYPE, live_streams
+from worker_pool import Placement, worker_pool
+from scheduler import scheduler, QueueFullError, TIER_PRIORITY
+from singleflight import MIRRORED_FIELDS, request_key, single_flight
+from batching import (
+    batch_progress, batch_status, default_batch_size, group_micro_batches,
+    shape_key, throughput_report
+)
 
 app = FastAPI(title="HunyuanVideo API", version="2.0.0")
 
@@ -30,27 +50,61 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configuration
 RESULTS_DIR = Path("/opt/hunyuan-video/results")
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-# In-memory job queue and status
-jobs: Dict[str, dict] = {}
-active_connections: List[WebSocket] = []
+# Finished videos, stored once by content and served with Range/ETag support
+result_store = ResultStore(RESULTS_DIR)
+
+# In-flight jobs (queued/processing), mutated in place and written through to
+# the job store on status changes; finished jobs are read from the store
+jobs: Dict[str, dict] = job_store.live
+batches: Dict[str, dict] = {}
+
+# Runs still going for a job that was deleted: run id -> follower it was handed to
+run_owners: Dict[str, str] = {}
+
+# Run state a follower takes over with the run, besides the mirrored fields
+RUN_FIELDS = ("estimate", "queued_estimate", "warm_worker", "worker_type", "time_to_first_step")
+
+# Most recent jobs sent to a dashboard when it connects
+SNAPSHOT_JOBS = 200
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     await cache_manager.connect()
+    await scheduler.start()
+    await health_monitor.start()
+    await post_processor.start()
+    job_store.on_transition = record_transition
+    job_store.on_delete = stats_aggregator.record_delete
+    post_processor.on_artifact = record_artifact
+    bind_gauges(scheduler, worker_pool, post_processor)
+    runtime_estimator.load(job_store)
+    step_policy.load()
+    scheduler.on_change = refresh_queue_etas
+    await requeue_recovered_jobs()
+    broadcaster.snapshot_source = lambda: job_store.list(limit=SNAPSHOT_JOBS)[0]
+    worker_status = await worker_client.ping()
+    if worker_status:
+        print(f"🔥 Warm worker connected ({worker_status['backend']} backend)")
+    else:
+        print("⚠️ Warm worker unavailable, falling back to docker exec per job")
     print("🚀 HunyuanVideo API started with optimizations enabled")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    await health_monitor.stop()
+    await post_processor.stop()
+    await scheduler.stop()
     await cache_manager.disconnect()
     print("👋 HunyuanVideo API shutdown complete")
 
@@ -64,6 +118,10 @@ class VideoRequest(BaseModel):
     cfg_scale: float = Field(6.0, description="Classifier-free guidance scale")
     flow_reverse: bool = Field(True, description="Enable flow reversal")
     quality_tier: str = Field("auto", description="Quality tier: preview/standard/premium/auto")
+    upscale_from: Optional[str] = Field(None, description="Completed job to refine from (same prompt and seed, lower resolution)")
+    upscale_strength: float = Field(0.6, ge=0.05, le=1.0, description="Share of the steps re-run when refining")
+    draft: bool = Field(False, description="Render a quick preview-resolution draft; approve it with POST /api/jobs/{id}/refine")
+    refine_size: Optional[str] = Field(None, description="Resolution an approved draft is refined at (set from video_size)")
 
 
 class JobStatus(BaseModel):
@@ -75,170 +133,629 @@ class JobStatus(BaseModel):
     completed_at: Optional[str] = None
     video_path: Optional[str] = None
     thumbnail_path: Optional[str] = None
+    sprite_path: Optional[str] = None
+    sprite: Optional[dict] = None
+    preview_path: Optional[str] = None
+    draft: bool = False
+    refine_size: Optional[str] = None
+    refined_by: Optional[str] = None
+    stream_segments: Optional[int] = None
     error: Optional[str] = None
     duration: Optional[float] = None
+    queue_position: Optional[int] = None
+    batch_id: Optional[str] = None
+    step: Optional[int] = None
+    total_steps: Optional[int] = None
+    seconds_per_step: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    starts_in_seconds: Optional[float] = None
+    estimate: Optional[dict] = None
+    optimization: Optional[dict] = None
+
+
+class BatchRequest(BaseModel):
+    items: List[VideoRequest] = Field(..., description="Shots to generate")
+    max_batch_size: Optional[int] = Field(None, ge=1, description="Max shots per micro-batch (default BATCH_MAX_SIZE)")
+
+
+class BatchStatus(BaseModel):
+    batch_id: str
+    status: str  # queued, processing, completed, partial, failed
+    progress: int
+    created_at: str
+    micro_batches: List[List[str]]
+    jobs: List[JobStatus]
+    throughput: dict
+
+
+def record_transition(previous: Optional[str], job: dict):
+    """Job store hook: update stats and, for finished jobs, stage metrics"""
+    stats_aggregator.record_transition(previous, job)
+    if job["status"] in ("completed", "failed"):
+        observe_job(job)
+        health_monitor.record_job(job)
 
 
 async def broadcast_status(job_id: str):
-    """Broadcast job status to all connected WebSocket clients"""
+    """Persist status changes and publish to subscribed WebSocket clients (coalesced, non-blocking)"""
     if job_id in jobs:
-        message = json.dumps({
-            "type": "status_update",
-            "job": jobs[job_id]
-        })
-        disconnected = []
-        for connection in active_connections:
+        job = jobs[job_id]
+        job_store.save(job_id)
+        broadcaster.publish(job_id, job)
+        if single_flight.followers(job_id) or job["status"] in ("completed", "failed"):
+            mirror_followers(job_id, job)
+
+
+def mirror_followers(leader_id: str, leader: dict):
+    """Copy a leader's progress onto the jobs attached to it; on completion they share its video"""
+    finished = leader["status"] in ("completed", "failed")
+    followers = single_flight.finish(leader_id) if finished else single_flight.followers(leader_id)
+    for follower_id in followers:
+        follower = jobs.get(follower_id)
+        if follower is None:
+            continue
+        follower.update({field: leader.get(field) for field in MIRRORED_FIELDS})
+        if leader.get("optimization") is not None:
+            follower["optimization"] = {**leader["optimization"], "deduplicated_from": leader_id}
+        if leader["status"] == "completed":
+            adopt_result(follower, leader)
+        job_store.save(follower_id)
+        broadcaster.publish(follower_id, follower)
+
+
+def adopt_result(job: dict, source: dict):
+    """
+    Complete a job with another job's video
+
+    The files are hard-linked into the job's own result directory (the video
+    as another reference to its result store object), so either job can be
+    deleted without breaking the other. Artifacts the source is still
+    post-processing are linked as they become ready.
+    """
+    result_dir = RESULTS_DIR / job["job_id"]
+    result_dir.mkdir(parents=True, exist_ok=True)
+    digest = source.get("video_digest")
+    path = source.get("video_path")
+    job["video_path"] = None
+    if path:
+        target = result_dir / Path(path).name
+        if digest and result_store.link(digest, target):
+            job.update({"video_path": str(target), "video_digest": digest})
+        else:
+            # Not in the result store (ingest failed): link the source's file itself
             try:
-                await connection.send_text(message)
-            except:
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for conn in disconnected:
-            active_connections.remove(conn)
+                link_or_copy(Path(path), target)
+                job["video_path"] = str(target)
+            except OSError as e:
+                print(f"⚠️ Could not share {Path(path).name} with job {job['job_id'][:8]}: {e}")
+    for artifact in ARTIFACTS:
+        job[f"{artifact}_path"] = None
+        if source.get(f"{artifact}_path"):
+            job.update(link_artifact(job["job_id"], {
+                f"{artifact}_path": source[f"{artifact}_path"], "sprite": source.get("sprite")
+            }))
+    post_processor.share(source["job_id"], job["job_id"])
+    job["status"] = "completed"
+    job["progress"] = 100
+    job["completed_at"] = datetime.now().isoformat()
+    job["duration"] = (
+        datetime.fromisoformat(job["completed_at"]) - datetime.fromisoformat(job["created_at"])
+    ).total_seconds()
+
+
+def link_or_copy(source: Path, target: Path):
+    """Hard-link source at target, or copy it where a link is not possible"""
+    if target == source or target.exists():
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        if not source.exists():
+            raise
+        shutil.copyfile(source, target)
+
+
+def link_artifact(job_id: str, fields: dict) -> dict:
+    """Fields for a job with another job's artifact hard-linked into its own directory"""
+    fields = dict(fields)
+    for name, value in fields.items():
+        if name.endswith("_path") and value:
+            target = RESULTS_DIR / job_id / Path(value).name
+            try:
+                if target != Path(value):
+                    os.link(value, target)
+                fields[name] = str(target)
+            except FileExistsError:
+                fields[name] = str(target)
+            except OSError:
+                fields[name] = None
+    return fields
+
 
+def record_artifact(job_id: str, artifact: str, fields: dict):
+    """Post-processor hook: an artifact is on disk, so the job may name it now"""
+    job = job_store.update(job_id, link_artifact(job_id, fields))
+    if job is not None:
+        broadcaster.publish(job_id, job)
 
-async def run_generation(job_id: str, request: VideoRequest):
-    """Execute video generation with optimization"""
+
+def run_job(run_id: str) -> Optional[dict]:
+    """The job a run reports to (see run_owners); None once it was deleted"""
+    return jobs.get(run_owners.get(run_id, run_id))
+
+
+async def apply_progress(job_id: str, tracker: ProgressTracker, step: int, total: int,
+                         seconds_per_step: Optional[float] = None,
+                         remaining_seconds: Optional[float] = None):
+    """Record a denoising step on the job; broadcast only if something visible changed"""
+    job = run_job(job_id)
+    if job is None:
+        return
+    if "time_to_first_step" not in job and job.get("started_at"):
+        job["time_to_first_step"] = round(
+            (datetime.now() - datetime.fromisoformat(job["started_at"])).total_seconds(), 3
+        )
+    if tracker.update(step, total, seconds_per_step, remaining_seconds):
+        job.update(tracker.fields())
+        await broadcast_status(job["job_id"])
+
+
+def worker_params(job_id: str, request: VideoRequest, optimized: dict,
+                  video_height: int, video_width: int) -> dict:
+    """Generation parameters in the warm worker's protocol format"""
+    return {
+        "prompt": request.prompt,
+        "height": video_height,
+        "width": video_width,
+        "video_length": request.video_length,
+        "infer_steps": optimized["infer_steps"],
+        "seed": request.seed,
+        "cfg_scale": optimized["cfg_scale"],
+        "flow_reverse": optimized["flow_reverse"],
+        "save_path": str(RESULTS_DIR / job_id),
+        **upscale_params(request),
+    }
+
+
+def upscale_params(request: VideoRequest) -> dict:
+    """Tell the worker to start from the source job's cached final latents"""
+    source = job_store.get(request.upscale_from) if request.upscale_from else None
+    if not source:
+        return {}
+    height, width = resolution_for(source["params"]["video_size"])
+    return {"init_from": {"height": height, "width": width, "strength": request.upscale_strength}}
+
+
+def record_worker_result(job_id: str, result: dict):
+    """Store the worker's stage timings and whether the prompt embeddings came from its cache"""
+    job = run_job(job_id)
+    if job is None:
+        return
+    job["worker_timings"] = result.get("timings", {})
+    embedding = result.get("embedding_cache")
+    if embedding and job.get("optimization") is not None:
+        job["optimization"]["cache_hit"] = embedding["hit"]
+        job["optimization"]["embedding_cache"] = embedding
+        if embedding["hit"]:
+            saved = job["worker_timings"].get("encode")
+            print(f"🎯 Embedding cache hit: text encoders skipped (loaded in {saved}s)")
+    latents = result.get("latent_cache")
+    if latents and job.get("optimization") is not None:
+        job["optimization"]["latent_cache"] = latents
+        if latents.get("resumed_from_step"):
+            print(f"⏩ Resumed from latent checkpoint at step {latents['resumed_from_step']}")
+
+
+async def record_stream(job_id: str, event: dict):
+    """The worker has encoded more of the video; /api/stream/{job_id} can play it already"""
+    job = run_job(job_id)
+    if job is None:
+        return
+    job["stream_path"] = event["video_path"]
+    job["stream_segments"] = event["segments"]
+    await broadcast_status(job["job_id"])
+
+
+async def run_on_worker(job_id: str, request: VideoRequest, optimized: dict,
+                        video_height: int, video_width: int, client) -> Tuple[int, str]:
+    """Run a job on the warm worker; returns (returncode, error) like a subprocess"""
+    params = worker_params(job_id, request, optimized, video_height, video_width)
+    
+    tracker = ProgressTracker()
+    
+    async for event in client.generate(job_id, params):
+        if event["type"] == "step":
+            await apply_progress(job_id, tracker, event["step"], event["total"])
+        elif event["type"] == "segment":
+            await record_stream(job_id, event)
+        elif event["type"] == "done":
+            record_worker_result(job_id, event)
+            return 0, ""
+        elif event["type"] == "error":
+            return 1, event["error"]
+    
+    return 1, "Worker returned no result"
+
+
+async def run_subprocess(job_id: str, request: VideoRequest, optimized: dict,
+                         video_height: int, video_width: int) -> Tuple[int, str]:
+    """Fallback: run sample_video.py in a fresh process (pays the full model load)"""
+    cmd = [
+        "docker", "exec", "-w", "/workspace/repo", "hunyuan-video",
+        "python", "sample_video.py",
+        "--model-base", "/workspace/repo",
+        "--video-size", str(video_height), str(video_width),
+        "--video-length", str(request.video_length),
+        "--infer-steps", str(optimized["infer_steps"]),
+        "--prompt", request.prompt,
+        "--embedded-cfg-scale", str(optimized["cfg_scale"]),
+        "--save-path", f"/opt/hunyuan-video/results/{job_id}",
+        "--use-cpu-offload"
+    ]
+    
+    if request.seed is not None:
+        cmd.extend(["--seed", str(request.seed)])
+    
+    if optimized["flow_reverse"]:
+        cmd.append("--flow-reverse")
+    
     try:
-        # Check embedding cache first
-        cache_hit = False
-        cached_data = await cache_manager.get_embedding(request.prompt)
-        if cached_data:
-            cache_hit = True
-            print(f"✅ Using cached embeddings for: {request.prompt[:50]}...")
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except OSError:
+        SUBPROCESS_FAILURES.labels(command="sample_video").inc()
+        raise
+    
+    tracker = ProgressTracker()
+    stderr_tail = ""
+    
+    # Monitor progress; tqdm writes to stderr with \r redraws, so read raw chunks
+    async def read_stream(stream, keep_tail: bool):
+        nonlocal stderr_tail
+        parser = ProgressParser(expected_total=optimized["infer_steps"])
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                break
+            text = chunk.decode(errors="replace")
+            if keep_tail:
+                stderr_tail = (stderr_tail + text)[-2000:]
+            for update in parser.feed(text):
+                await apply_progress(job_id, tracker, **update)
+        for update in parser.flush():
+            await apply_progress(job_id, tracker, **update)
+    
+    await asyncio.gather(
+        read_stream(process.stdout, keep_tail=False),
+        read_stream(process.stderr, keep_tail=True),
+        process.wait()
+    )
+    
+    if process.returncode == 0:
+        return 0, ""
+    SUBPROCESS_FAILURES.labels(command="sample_video").inc()
+    return process.returncode, stderr_tail
+
+
+def resolution_for(video_size: str) -> Tuple[int, int]:
+    """Map a resolution label to (height, width)"""
+    if video_size == "preview":
+        return 272, 480  # optimizer.get_optimal_resolution's preview tier
+    if video_size == "540p":
+        return 544, 960
+    return 720, 1280  # 720p
+
+
+def queue_tier(request: VideoRequest) -> str:
+    """Scheduler priority tier; drafts wait for approval, so they go first like previews"""
+    return "preview" if request.draft else request.quality_tier
+
+
+def as_draft(request: VideoRequest):
+    """Render a draft request at preview resolution; it is refined at the requested one"""
+    if request.draft and request.refine_size is None:
+        request.refine_size = request.video_size if request.video_size != "preview" else "540p"
+        request.video_size = "preview"
+
+
+def estimate_job(request: VideoRequest, steps: int, worker_type: Optional[str] = None,
+                 warm: bool = True) -> dict:
+    """Expected run time with its interval (worker_type None: not placed yet)"""
+    if request.upscale_from:
+        # A refine pass re-runs only part of the schedule
+        steps = max(1, round(steps * request.upscale_strength))
+    return runtime_estimator.predict(request.video_size, request.video_length, steps, worker_type, warm)
+
+
+def estimate_queued(request: VideoRequest) -> dict:
+    """Estimate for a job about to be queued; its steps come from the prompt analysis"""
+    optimized = adaptive_optimizer.optimize_parameters(
+        prompt=request.prompt,
+        video_size=request.video_size,
+        infer_steps=request.infer_steps,
+        quality_tier=request.quality_tier,
+        video_length=request.video_length,
+        log=False,
+        draft=request.draft
+    )
+    return estimate_job(request, optimized["infer_steps"])
+
+
+def refresh_queue_etas():
+    """Scheduler hook: current position, start and finish estimates for every waiting job"""
+    etas = scheduler.queue_etas(lambda entry_id: (jobs.get(entry_id) or {}).get("eta_seconds"))
+    for entry_id, (position, wait) in etas.items():
+        for job_id in scheduler.members(entry_id):
+            job = jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+            update = {
+                "queue_position": position,
+                "starts_in_seconds": round(wait),
+                "eta_seconds": round(wait + (job.get("estimate") or {}).get("seconds", 0)),
+            }
+            if any(job.get(field) != value for field, value in update.items()):
+                job.update(update)
+                broadcaster.publish(job_id, job)
+
+
+async def finalize_job(job_id: str, request: VideoRequest, optimized: dict, prompt_cached: bool,
+                       run_dir: Optional[Path] = None):
+    """
+    Record a successful run: locate the video, cache metadata, queue post-processing
+
+    run_dir is where the run wrote its output when that is not the job's own
+    directory (a run handed over from a deleted job); the video is moved in.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    
+    # Find generated video (not a preview clip from an earlier attempt)
+    result_dir = RESULTS_DIR / job_id
+    videos = [
+        video for video in (run_dir or result_dir).glob("*.mp4")
+        if not video.name.startswith(".") and video.name not in ARTIFACT_FILES.values()
+    ]
+    
+    if not videos:
+        job["status"] = "failed"
+        job["error"] = "No video file generated"
+        return
+    video = videos[0]
+    
+    # Store by content; an output identical to an earlier one shares its file
+    try:
+        job["video_digest"] = await asyncio.to_thread(result_store.ingest, video)
+    except OSError as e:
+        print(f"⚠️ Could not add {video.name} to the result store: {e}")
+    
+    if run_dir is not None and run_dir != result_dir:
+        result_dir.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(link_or_copy, video, result_dir / video.name)
+        video = result_dir / video.name
+        shutil.rmtree(run_dir, ignore_errors=True)
+    
+    job["status"] = "completed"
+    job["progress"] = 100
+    job["video_path"] = str(video)
+    job["completed_at"] = datetime.now().isoformat()
+    
+    # Remember the prompt for /api/optimization/analyze (the tensors are cached by the worker)
+    if not prompt_cached:
+        await cache_manager.set_embedding(request.prompt, {
+            "timestamp": datetime.now().isoformat(),
+            "steps": optimized["infer_steps"],
+            "complexity": optimized["complexity"]
+        })
+    
+    # Thumbnail, sprite sheet and preview clip; each is set on the job once it is on disk
+    video_height, video_width = resolution_for(request.video_size)
+    post_processor.submit(
+        job_id, video, request.video_length, video_height, video_width, job_labels(job)
+    )
+    
+    # Compare with the estimate and refine the model
+    runtime_estimator.observe(job)
+    estimate = job.get("estimate") or {}
+    print(f"✅ Generation complete: {job['duration']:.1f}s (estimated {estimate.get('seconds')}s)")
+
+
+async def run_generation(job_id: str, request: VideoRequest, placement: Placement):
+    """
+    Execute video generation with optimization on the placed worker
+
+    job_id names the run (its worker request and output directory). If the
+    job is deleted while running, the run either reports to the follower it
+    was handed to or is cancelled, so the record is looked up after every wait.
+    """
+    try:
+        job = run_job(job_id)
+        if job is None:
+            return
+        job["status"] = "processing"
+        job["queue_position"] = None
+        job["starts_in_seconds"] = None
+        job["worker"] = placement.device.name
+        job["worker_type"] = placement.device.kind
+        job["started_at"] = datetime.now().isoformat()
+        await broadcast_status(job["job_id"])
+        
+        # Prompt metadata from earlier runs; the warm worker reports the real
+        # embedding cache hit when it finishes
+        prompt_cached = await cache_manager.get_embedding(request.prompt) is not None
         
         # Get optimized parameters
         optimized = adaptive_optimizer.optimize_parameters(
             prompt=request.prompt,
             video_size=request.video_size,
             infer_steps=request.infer_steps,
-            quality_tier=request.quality_tier
+            quality_tier=request.quality_tier,
+            video_length=request.video_length,
+            draft=request.draft
         )
         
+        # Now that the device is known, re-estimate for its GPU type (the
+        # estimator's accuracy is scored against the one it was queued with)
+        warm = await placement.client.is_available()
+        job = run_job(job_id)
+        if job is None:
+            return
+        job["warm_worker"] = warm
+        job["queued_estimate"] = job.get("estimate")
+        job["estimate"] = estimate_job(request, optimized["infer_steps"], placement.device.kind, warm)
+        job["eta_seconds"] = job["estimate"]["seconds"]
+        
         # Store optimization metadata
-        jobs[job_id]["optimization"] = {
-            "cache_hit": cache_hit,
+        job["optimization"] = {
+            "cache_hit": False,
             "complexity": optimized["complexity"],
             "final_steps": optimized["infer_steps"],
-            "estimated_time": optimized["estimated_time_min"],
+            "estimated_time": round(job["estimate"]["seconds"] / 60, 1),
             "quality_tier": request.quality_tier
         }
         
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress"] = 10
-        await broadcast_status(job_id)
+        job["progress"] = 10
+        await broadcast_status(job["job_id"])
         
-        # Map resolution to height/width
-        if request.video_size == "540p":
-            video_height, video_width = 544, 960
-        else:  # 720p
-            video_height, video_width = 720, 1280
+        video_height, video_width = resolution_for(request.video_size)
         
-        # Build command with optimized parameters
-        cmd = [
-            "docker", "exec", "-w", "/workspace/repo", "hunyuan-video",
-            "python", "sample_video.py",
-            "--model-base", "/workspace/repo",
-            "--video-size", str(video_height), str(video_width),
-            "--video-length", str(request.video_length),
-            "--infer-steps", str(optimized["infer_steps"]),
-            "--prompt", request.prompt,
-            "--embedded-cfg-scale", str(optimized["cfg_scale"]),
-            "--save-path", f"/opt/hunyuan-video/results/{job_id}",
-            "--use-cpu-offload"
-        ]
+        # Run generation
+        start_time = datetime.now()
+        print(f"🎬 Starting generation: {optimized['infer_steps']} steps, {job['optimization']['estimated_time']}min estimated")
         
-        if request.seed is not None:
-            cmd.extend(["--seed", str(request.seed)])
+        if warm:
+            returncode, error = await run_on_worker(
+                job_id, request, optimized, video_height, video_width, placement.client
+            )
+        else:
+            returncode, error = await run_subprocess(job_id, request, optimized, video_height, video_width)
         
-        if optimized["flow_reverse"]:
-            cmd.append("--flow-reverse")
+        job = run_job(job_id)
+        if job is None:
+            # Deleted and cancelled; drop whatever the run still wrote
+            shutil.rmtree(RESULTS_DIR / job_id, ignore_errors=True)
+            return
+        job["duration"] = (datetime.now() - start_time).total_seconds()
         
-        # Run generation
-        start_time = datetime.now()
-        print(f"🎬 Starting generation: {optimized['infer_steps']} steps, {optimized['estimated_time_min']}min estimated")
+        if returncode == 0:
+            await finalize_job(job["job_id"], request, optimized, prompt_cached, run_dir=RESULTS_DIR / job_id)
+        else:
+            job["status"] = "failed"
+            job["error"] = error[:500]
         
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        await broadcast_status(job["job_id"])
         
-        # Monitor progress
-        async def read_output():
-            while True:
-                line = await process.stdout.readline()
-                if not line:
-                    break
-                line_str = line.decode().strip()
-                
-                # Parse progress from output
-                if "%" in line_str or "step" in line_str.lower():
-                    # Simple progress estimation
-                    if jobs[job_id]["progress"] < 90:
-                        jobs[job_id]["progress"] += 2
-                        await broadcast_status(job_id)
+    except Exception as e:
+        job = run_job(job_id)
+        if job is None:
+            return
+        job["status"] = "failed"
+        job["error"] = str(e)
+        await broadcast_status(job["job_id"])
+    finally:
+        run_owners.pop(job_id, None)
+
+
+async def run_batch_generation(micro_batch_id: str, job_ids: List[str], requests: List[VideoRequest],
+                               optimized: List[dict], placement: Placement):
+    """Execute a micro-batch of same-shape jobs in one worker request"""
+    # Skip shots deleted while queued
+    kept = [i for i, job_id in enumerate(job_ids) if job_id in jobs]
+    job_ids = [job_ids[i] for i in kept]
+    requests = [requests[i] for i in kept]
+    optimized = [optimized[i] for i in kept]
+    if not job_ids:
+        return
+    
+    try:
+        prompts_cached = {}
+        warm = await placement.client.is_available()
+        for job_id, request, opt in zip(job_ids, requests, optimized):
+            prompts_cached[job_id] = await cache_manager.get_embedding(request.prompt) is not None
+            estimate = estimate_job(request, opt["infer_steps"], placement.device.kind, warm)
+            jobs[job_id].update({
+                "status": "processing",
+                "queue_position": None,
+                "starts_in_seconds": None,
+                "worker": placement.device.name,
+                "worker_type": placement.device.kind,
+                "warm_worker": warm,
+                "queued_estimate": jobs[job_id].get("estimate"),
+                "estimate": estimate,
+                "started_at": datetime.now().isoformat(),
+                "progress": 10,
+            })
+            jobs[job_id]["optimization"] = {
+                "cache_hit": False,
+                "complexity": opt["complexity"],
+                "final_steps": opt["infer_steps"],
+                "estimated_time": round(estimate["seconds"] / 60, 1),
+                "quality_tier": requests[0].quality_tier
+            }
+            await broadcast_status(job_id)
         
-        await asyncio.gather(read_output(), process.wait())
+        video_height, video_width = resolution_for(requests[0].video_size)
+        print(f"🎞️ Starting micro-batch {micro_batch_id[:8]}: {len(job_ids)} shots")
         
-        duration = (datetime.now() - start_time).total_seconds()
-        jobs[job_id]["duration"] = duration
+        if not warm:
+            # No warm worker: fall back to one process per shot
+            for job_id, request, opt in zip(job_ids, requests, optimized):
+                start_time = datetime.now()
+                returncode, error = await run_subprocess(job_id, request, opt, video_height, video_width)
+                jobs[job_id]["duration"] = (datetime.now() - start_time).total_seconds()
+                if returncode == 0:
+                    await finalize_job(job_id, request, opt, prompts_cached[job_id])
+                else:
+                    jobs[job_id]["status"] = "failed"
+                    jobs[job_id]["error"] = error[:500]
+                await broadcast_status(job_id)
+            return
         
-        if process.returncode == 0:
-            # Find generated video
-            result_dir = RESULTS_DIR / job_id
-            videos = list(result_dir.glob("*.mp4"))
-            
-            if videos:
-                jobs[job_id]["status"] = "completed"
-                jobs[job_id]["progress"] = 100
-                jobs[job_id]["video_path"] = str(videos[0])
-                jobs[job_id]["completed_at"] = datetime.now().isoformat()
-                
-                # Cache embedding metadata for future use
-                if not cache_hit:
-                    await cache_manager.set_embedding(request.prompt, {
-                        "timestamp": datetime.now().isoformat(),
-                        "steps": optimized["infer_steps"],
-                        "complexity": optimized["complexity"]
-                    })
-                
-                # Generate thumbnail (first frame)
-                thumbnail_path = result_dir / "thumbnail.jpg"
-                await asyncio.create_subprocess_exec(
-                    "docker", "exec", "hunyuan-video",
-                    "ffmpeg", "-i", f"/opt/hunyuan-video/results/{job_id}/{videos[0].name}",
-                    "-vframes", "1", "-f", "image2",
-                    f"/opt/hunyuan-video/results/{job_id}/thumbnail.jpg",
-                    stdout=asyncio.subprocess.DEVNULL,
-                    stderr=asyncio.subprocess.DEVNULL
-                )
-                jobs[job_id]["thumbnail_path"] = str(thumbnail_path)
-                
-                print(f"✅ Generation complete: {duration:.1f}s (estimated {optimized['estimated_time_min']*60}s)")
-            else:
+        items = [
+            worker_params(job_id, request, opt, video_height, video_width)
+            for job_id, request, opt in zip(job_ids, requests, optimized)
+        ]
+        trackers = {job_id: ProgressTracker() for job_id in job_ids}
+        async for event in placement.client.generate_batch(micro_batch_id, items):
+            if "item" in event:
+                index = event["item"]
+                job_id = job_ids[index]
+                if job_id not in jobs:
+                    continue
+            if event["type"] == "step":
+                await apply_progress(job_id, trackers[job_id], event["step"], event["total"])
+            elif event["type"] == "segment":
+                await record_stream(job_id, event)
+            elif event["type"] == "item_done":
+                jobs[job_id]["duration"] = event.get("duration")
+                record_worker_result(job_id, event)
+                await finalize_job(job_id, requests[index], optimized[index], prompts_cached[job_id])
+                await broadcast_status(job_id)
+            elif event["type"] == "item_error":
                 jobs[job_id]["status"] = "failed"
-                jobs[job_id]["error"] = "No video file generated"
-        else:
-            stderr = await process.stderr.read()
-            jobs[job_id]["status"] = "failed"
-            jobs[job_id]["error"] = stderr.decode()[:500]
-        
-        await broadcast_status(job_id)
+                jobs[job_id]["error"] = event["error"][:500]
+                await broadcast_status(job_id)
+            elif event["type"] == "error":
+                raise RuntimeError(event["error"])
         
     except Exception as e:
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
-        await broadcast_status(job_id)
+        for job_id in job_ids:
+            if jobs.get(job_id, {}).get("status") in ("queued", "processing"):
+                jobs[job_id]["status"] = "failed"
+                jobs[job_id]["error"] = str(e)
+                await broadcast_status(job_id)
 
 
-@app.post("/api/generate", response_model=JobStatus)
-async def generate_video(request: VideoRequest, background_tasks: BackgroundTasks):
-    """Queue a new video generation job"""
-    job_id = str(uuid.uuid4())
-    
-    jobs[job_id] = {
+def new_job_record(job_id: str, request: VideoRequest, **extra) -> dict:
+    """Initial record for a queued job"""
+    # Pin the seed so a retry or restart resumes from the worker's latent checkpoints
+    if request.seed is None:
+        request.seed = random.randint(0, 2 ** 31 - 1)
+    return {
         "job_id": job_id,
         "status": "queued",
         "prompt": request.prompt,
@@ -249,155 +766,617 @@ async def generate_video(request: VideoRequest, background_tasks: BackgroundTask
         "thumbnail_path": None,
         "error": None,
         "duration": None,
-        "params": request.dict()
+        "queue_position": None,
+        "draft": request.draft,
+        "refine_size": request.refine_size,
+        "params": request.dict(),
+        **extra
     }
+
+
+async def requeue_recovered_jobs():
+    """Resubmit jobs that were queued or running when the server last stopped"""
+    recovered = job_store.recover()
+    stats_aggregator.load(job_store)
+    for record in recovered:
+        job_id = record["job_id"]
+        request = VideoRequest(**record["params"])
+        key = record.get("request_key")
+        leader_id = single_flight.leader(key, seeded=True) if key else None
+        if leader_id:
+            single_flight.attach(leader_id, job_id)
+            continue
+        record["estimate"] = estimate_queued(request)
+        try:
+            record["queue_position"] = await scheduler.submit(
+                job_id,
+                queue_tier(request),
+                lambda placement, j=job_id, r=request: run_generation(j, r, placement),
+                video_size=request.video_size,
+                estimated_seconds=record["estimate"]["seconds"]
+            )
+        except (QueueFullError, ValueError) as e:
+            record["status"] = "failed"
+            record["error"] = f"Could not requeue after restart: {e}"
+            await broadcast_status(job_id)
+            continue
+        if key:
+            single_flight.lead(key, job_id)
+
+
+@app.post("/api/generate", response_model=JobStatus)
+async def generate_video(request: VideoRequest):
+    """Queue a new video generation job, or attach it to an identical one (see singleflight)"""
+    job_id = str(uuid.uuid4())
+    as_draft(request)
+    key, seeded = None, request.seed is not None
+    if single_flight.enabled:
+        key = request_key(request.dict())
+        deduplicated = deduplicate(job_id, request, key, seeded)
+        if deduplicated:
+            return JobStatus(**deduplicated)
+    
+    # Only deterministic (seeded) jobs are found again once finished
+    jobs[job_id] = new_job_record(job_id, request, request_key=key if seeded else None)
+    jobs[job_id]["estimate"] = estimate_queued(request)
+    
+    try:
+        position = await scheduler.submit(
+            job_id,
+            queue_tier(request),
+            lambda placement: run_generation(job_id, request, placement),
+            video_size=request.video_size,
+            estimated_seconds=jobs[job_id]["estimate"]["seconds"]
+        )
+    except QueueFullError as e:
+        del jobs[job_id]
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+    except ValueError as e:
+        del jobs[job_id]
+        raise HTTPException(status_code=400, detail=str(e))
     
-    background_tasks.add_task(run_generation, job_id, request)
+    jobs[job_id]["queue_position"] = position
+    job_store.save(job_id)
+    if key:
+        single_flight.lead(key, job_id)
     
     return JobStatus(**jobs[job_id])
 
 
+def deduplicate(job_id: str, request: VideoRequest, key: str, seeded: bool) -> Optional[dict]:
+    """Record for a job served by a stored video or an in-flight run, or None to run it"""
+    done = job_store.find_completed(key) if seeded else None
+    if done and done.get("video_path") and Path(done["video_path"]).exists():
+        record = new_job_record(job_id, request, request_key=key)
+        record["started_at"] = record["created_at"]
+        record["optimization"] = {**(done.get("optimization") or {}), "deduplicated_from": done["job_id"]}
+        adopt_result(record, done)
+        jobs[job_id] = record
+        job_store.save(job_id)
+        broadcaster.publish(job_id, record)
+        JOBS_DEDUPLICATED.labels(kind="completed").inc()
+        print(f"♻️ Identical job {done['job_id'][:8]} already completed; reusing its video")
+        return record
+    
+    leader_id = single_flight.leader(key, seeded)
+    leader = jobs.get(leader_id) if leader_id else None
+    if leader is None:
+        return None
+    # Same seed as the leader, so the record describes the video it gets
+    request.seed = leader["params"]["seed"]
+    record = new_job_record(job_id, request, request_key=key if seeded else None)
+    record.update({field: leader.get(field) for field in MIRRORED_FIELDS})
+    if leader.get("optimization") is not None:
+        record["optimization"] = {**leader["optimization"], "deduplicated_from": leader_id}
+    jobs[job_id] = record
+    single_flight.attach(leader_id, job_id)
+    job_store.save(job_id)
+    JOBS_DEDUPLICATED.labels(kind="in_flight").inc()
+    print(f"🔗 Attached to identical in-flight job {leader_id[:8]}")
+    return record
+
+
+async def promote_follower(key: str, followers: List[str], run_id: Optional[str] = None,
+                           previous: Optional[dict] = None):
+    """
+    Hand a deleted leader's run to its first follower; the others follow the new leader
+
+    A run that has started (run_id) keeps going and reports to the new leader,
+    which takes over the deleted leader's run state; one that has not is
+    queued again under the new leader's id.
+    """
+    followers = [job_id for job_id in followers if job_id in jobs]
+    if not followers:
+        return
+    leader_id = followers[0]
+    leader = jobs[leader_id]
+    if run_id is not None:
+        run_owners[run_id] = leader_id
+        leader.update({field: previous.get(field) for field in (*MIRRORED_FIELDS, *RUN_FIELDS) if field in previous})
+        if previous.get("optimization") is not None:
+            leader["optimization"] = {
+                name: value for name, value in previous["optimization"].items() if name != "deduplicated_from"
+            }
+        lead_followers(key, leader_id, followers[1:])
+        await broadcast_status(leader_id)
+        print(f"🔀 Run {run_id[:8]} handed over to {leader_id[:8]}")
+        return
+    request = VideoRequest(**leader["params"])
+    leader.update({field: None for field in MIRRORED_FIELDS})
+    leader.update({"status": "queued", "progress": 0, "optimization": None, "estimate": estimate_queued(request)})
+    try:
+        leader["queue_position"] = await scheduler.submit(
+            leader_id,
+            queue_tier(request),
+            lambda placement: run_generation(leader_id, request, placement),
+            video_size=request.video_size,
+            estimated_seconds=leader["estimate"]["seconds"]
+        )
+    except (QueueFullError, ValueError) as e:
+        for job_id in followers:
+            jobs[job_id].update({"status": "failed", "error": f"Could not requeue: {e}"})
+            await broadcast_status(job_id)
+        return
+    lead_followers(key, leader_id, followers[1:])
+    await broadcast_status(leader_id)
+
+
+def lead_followers(key: str, leader_id: str, followers: List[str]):
+    """Make leader_id the in-flight run for key, with followers attached to it"""
+    single_flight.lead(key, leader_id)
+    for job_id in followers:
+        single_flight.attach(leader_id, job_id)
+
+
+@app.post("/api/generate/batch", response_model=BatchStatus)
+async def generate_batch(request: BatchRequest):
+    """Queue a storyboard; shots with matching shape parameters share micro-batches"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    
+    max_size = request.max_batch_size or default_batch_size()
+    batch_id = str(uuid.uuid4())
+    
+    # Resolve adaptive parameters up front so grouping uses the final shape
+    # (prompt keywords for the whole storyboard in one pass)
+    item_ids, keyed, resolved = [], [], {}
+    features = adaptive_optimizer.analyze_prompts([item.prompt for item in request.items])
+    for item, item_features in zip(request.items, features):
+        job_id = str(uuid.uuid4())
+        as_draft(item)
+        optimized = adaptive_optimizer.optimize_parameters(
+            prompt=item.prompt,
+            video_size=item.video_size,
+            infer_steps=item.infer_steps,
+            quality_tier=item.quality_tier,
+            video_length=item.video_length,
+            features=item_features,
+            draft=item.draft
+        )
+        item_ids.append(job_id)
+        keyed.append((job_id, shape_key(
+            item.video_size, item.video_length, optimized["infer_steps"],
+            optimized["cfg_scale"], optimized["flow_reverse"]
+        )))
+        resolved[job_id] = (item, optimized)
+    
+    micro_batches = group_micro_batches(keyed, max_size)
+    if scheduler.queue_depth + len(micro_batches) > scheduler.max_queue_depth:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Batch needs {len(micro_batches)} queue slots; queue is near its cap",
+            headers={"Retry-After": "60"}
+        )
+    
+    for job_id in item_ids:
+        item, optimized = resolved[job_id]
+        jobs[job_id] = new_job_record(job_id, item, batch_id=batch_id)
+        jobs[job_id]["estimate"] = estimate_job(item, optimized["infer_steps"])
+    
+    for members in micro_batches:
+        micro_batch_id = str(uuid.uuid4())
+        requests = [resolved[job_id][0] for job_id in members]
+        optimized = [resolved[job_id][1] for job_id in members]
+        # The most urgent tier in the group sets its priority
+        tier = min((queue_tier(r) for r in requests), key=lambda t: TIER_PRIORITY.get(t, 1))
+        try:
+            await scheduler.submit(
+                micro_batch_id,
+                tier,
+                lambda placement, b=micro_batch_id, m=members, r=requests, o=optimized:
+                    run_batch_generation(b, m, r, o, placement),
+                video_size=requests[0].video_size,
+                estimated_seconds=sum(jobs[job_id]["estimate"]["seconds"] for job_id in members),
+                members=members
+            )
+        except ValueError as e:
+            for job_id in members:
+                jobs[job_id]["status"] = "failed"
+                jobs[job_id]["error"] = str(e)
+        for job_id in members:
+            job_store.save(job_id)
+    
+    batches[batch_id] = {
+        "batch_id": batch_id,
+        "job_ids": item_ids,
+        "micro_batches": micro_batches,
+        "created_at": datetime.now().isoformat()
+    }
+    return batch_summary(batch_id)
+
+
+@app.get("/api/batches/{batch_id}", response_model=BatchStatus)
+async def get_batch(batch_id: str):
+    """Get per-item status and throughput for a batch"""
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_summary(batch_id)
+
+
+def batch_summary(batch_id: str) -> dict:
+    batch = batches[batch_id]
+    batch_jobs = [job for job in map(job_store.get, batch["job_ids"]) if job]
+    
+    # One-at-a-time baseline: recent completed single jobs with the same shape
+    first = batch_jobs[0] if batch_jobs else None
+    reference = []
+    if first:
+        shape = (first["params"]["video_size"], first["params"]["video_length"],
+                 first.get("optimization", {}).get("final_steps"))
+        recent, _ = job_store.list(status="completed", limit=MAX_PAGE_SIZE)
+        reference = [
+            j["duration"] for j in recent
+            if not j.get("batch_id") and j["status"] == "completed" and j.get("duration")
+            and (j["params"]["video_size"], j["params"]["video_length"],
+                 j.get("optimization", {}).get("final_steps")) == shape
+        ]
+    
+    return {
+        "batch_id": batch_id,
+        "status": batch_status(batch_jobs),
+        "progress": batch_progress(batch_jobs) or 0,
+        "created_at": batch["created_at"],
+        "micro_batches": batch["micro_batches"],
+        "jobs": [JobStatus(**j) for j in batch_jobs],
+        "throughput": throughput_report(batch_jobs, reference)
+    }
+
+
 @app.get("/api/jobs", response_model=List[JobStatus])
-async def list_jobs():
-    """Get all jobs"""
-    return [JobStatus(**job) for job in jobs.values()]
+async def list_jobs(
+    response: Response,
+    status: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    List jobs, newest first, one page at a time
+    
+    When more jobs exist, the X-Next-Cursor response header holds the cursor
+    for the next page.
+    """
+    try:
+        page, next_cursor = job_store.list(status=status, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [JobStatus(**job) for job in page]
 
 
 @app.get("/api/jobs/{job_id}", response_model=JobStatus)
 async def get_job(job_id: str):
     """Get job status"""
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    return JobStatus(**jobs[job_id])
+    return JobStatus(**job)
+
+
+@app.post("/api/jobs/{job_id}/retry", response_model=JobStatus)
+async def retry_job(job_id: str):
+    """Requeue a failed job; the warm worker resumes it from its last latent checkpoint"""
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "failed":
+        raise HTTPException(status_code=400, detail="Only failed jobs can be retried")
+    
+    request = VideoRequest(**job["params"])
+    previous = {key: job.get(key) for key in ("error", "completed_at", "duration", "progress")}
+    job_store.revive(job)
+    job.update({
+        "status": "queued", "progress": 0, "error": None, "completed_at": None, "duration": None,
+        "retries": job.get("retries", 0) + 1, "estimate": estimate_queued(request),
+    })
+    
+    try:
+        job["queue_position"] = await scheduler.submit(
+            job_id,
+            queue_tier(request),
+            lambda placement: run_generation(job_id, request, placement),
+            video_size=request.video_size,
+            estimated_seconds=job["estimate"]["seconds"]
+        )
+    except QueueFullError as e:
+        # Unchanged in the store; saving the failed status drops it from memory again
+        job.update({"status": "failed", "retries": job["retries"] - 1, **previous})
+        job_store.save(job_id)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+    
+    await broadcast_status(job_id)
+    return JobStatus(**job)
+
+
+@app.post("/api/jobs/{job_id}/upscale", response_model=JobStatus)
+async def upscale_job(job_id: str, video_size: str = "720p",
+                      strength: float = Query(0.6, ge=0.05, le=1.0)):
+    """Queue a higher-resolution run of a finished job that starts from its cached latents"""
+    source = job_store.get(job_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if source["status"] != "completed":
+        raise HTTPException(status_code=400, detail="Only completed jobs can be upscaled")
+    return await generate_video(refine_request(source, video_size, strength))
+
+
+@app.post("/api/jobs/{job_id}/refine", response_model=JobStatus)
+async def refine_job(job_id: str, video_size: Optional[str] = None,
+                     strength: float = Query(0.6, ge=0.05, le=1.0)):
+    """
+    Approve a finished draft: render it at full resolution (its refine_size
+    unless given) from the draft's latents, with the same seed and cached
+    prompt embeddings. Approving twice returns the same refine job.
+    """
+    draft = job_store.get(job_id)
+    if not draft:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not draft.get("draft"):
+        raise HTTPException(status_code=400, detail="Only drafts can be refined; use /upscale")
+    if draft["status"] != "completed":
+        raise HTTPException(status_code=400, detail="The draft has not finished")
+    refined = job_store.get(draft["refined_by"]) if draft.get("refined_by") else None
+    if refined:
+        return JobStatus(**refined)
+    
+    status = await generate_video(refine_request(draft, video_size or draft.get("refine_size") or "540p", strength))
+    draft = job_store.update(job_id, {"refined_by": status.job_id})
+    if draft is not None:
+        broadcaster.publish(job_id, draft)
+    return status
+
+
+def refine_request(source: dict, video_size: str, strength: float) -> VideoRequest:
+    """A run of a finished job's prompt and seed at another resolution, starting from its latents"""
+    return VideoRequest(**{
+        **source["params"],
+        "video_size": video_size,
+        "draft": False,
+        "refine_size": None,
+        "upscale_from": source["job_id"],
+        "upscale_strength": strength,
+    })
 
 
 @app.delete("/api/jobs/{job_id}")
 async def delete_job(job_id: str):
     """Delete a job and its files"""
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    # Delete files
+    # Drop it from the queue if it has not started
+    scheduler.cancel(job_id)
+    broadcaster.forget(job_id)
+    post_processor.discard(job_id)
+    live_streams.discard(job_id)
+    key, followers = single_flight.drop(job_id)
+    
+    # A run that has started goes to the first follower, or is stopped
+    run_id = next((run for run, owner in run_owners.items() if owner == job_id), job_id)
+    placement = scheduler.pool.placement(run_id)
+    if followers:
+        await promote_follower(key, followers, run_id if placement else None, job)
+    if placement and run_owners.get(run_id, run_id) == job_id:
+        run_owners.pop(run_id, None)
+        await placement.client.cancel(run_id)
+    
+    # Delete files (unless a handed-over run is still writing to them)
     result_dir = RESULTS_DIR / job_id
-    if result_dir.exists():
-        import shutil
+    if result_dir.exists() and job_id not in run_owners:
         shutil.rmtree(result_dir)
+    if job.get("video_digest"):
+        result_store.release(job["video_digest"])
     
-    del jobs[job_id]
+    job_store.delete(job_id)
     return {"message": "Job deleted"}
 
 
-@app.get("/api/video/{job_id}")
-async def get_video(job_id: str):
-    """Download generated video"""
-    if job_id not in jobs or not jobs[job_id].get("video_path"):
+@app.api_route("/api/video/{job_id}", methods=["GET", "HEAD"])
+async def get_video(job_id: str, request: Request):
+    """Download generated video (supports Range, ETag/If-None-Match)"""
+    job = job_store.get(job_id)
+    if not job or not job.get("video_path"):
         raise HTTPException(status_code=404, detail="Video not found")
     
-    video_path = Path(jobs[job_id]["video_path"])
-    if not video_path.exists():
+    try:
+        return await result_store.serve(
+            request, Path(job["video_path"]), digest=job.get("video_digest"),
+            media_type="video/mp4", filename=f"{job_id}.mp4"
+        )
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Video file not found")
+
+
+def stream_source(job: dict) -> Tuple[Optional[str], bool]:
+    """(video file, finished) behind a job's live stream: the file being encoded, then the video"""
+    if job["status"] == "processing":
+        return job.get("stream_path"), False
+    return job.get("video_path"), True
+
+
+@app.get("/api/stream/{job_id}/index.m3u8")
+async def get_stream_playlist(job_id: str):
+    """HLS playlist of the video's encoded fragments, growing until the job finishes"""
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
     
-    return FileResponse(
-        video_path,
-        media_type="video/mp4",
-        filename=f"{job_id}.mp4"
-    )
+    path, finished = stream_source(job)
+    playlist = None
+    if path:
+        playlist = await asyncio.to_thread(live_streams.playlist, job_id, Path(path), finished)
+    if playlist is None:
+        raise HTTPException(status_code=404, detail="No video fragments yet")
+    return Response(playlist, media_type=PLAYLIST_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+
+
+@app.api_route("/api/stream/{job_id}/video.mp4", methods=["GET", "HEAD"])
+async def get_stream_video(job_id: str, request: Request):
+    """The video the playlist's byte ranges point into, readable while it is written (supports Range)"""
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    path, finished = stream_source(job)
+    if not path:
+        raise HTTPException(status_code=404, detail="Video not found")
+    try:
+        return await result_store.serve(
+            request, Path(path), digest=job.get("video_digest") if finished else None,
+            media_type="video/mp4", live=not finished
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video file not found")
 
 
-@app.get("/api/thumbnail/{job_id}")
-async def get_thumbnail(job_id: str):
+@app.api_route("/api/thumbnail/{job_id}", methods=["GET", "HEAD"])
+async def get_thumbnail(job_id: str, request: Request):
     """Get video thumbnail"""
-    if job_id not in jobs or not jobs[job_id].get("thumbnail_path"):
+    job = job_store.get(job_id)
+    if not job or not job.get("thumbnail_path"):
         raise HTTPException(status_code=404, detail="Thumbnail not found")
     
-    thumb_path = Path(jobs[job_id]["thumbnail_path"])
-    if not thumb_path.exists():
+    try:
+        return await result_store.serve(request, Path(job["thumbnail_path"]), media_type="image/jpeg")
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Thumbnail file not found")
+
+
+@app.api_route("/api/sprite/{job_id}", methods=["GET", "HEAD"])
+async def get_sprite(job_id: str, request: Request):
+    """Get the scrub sprite sheet (grid in the job's "sprite" field)"""
+    job = job_store.get(job_id)
+    if not job or not job.get("sprite_path"):
+        raise HTTPException(status_code=404, detail="Sprite sheet not found")
     
-    return FileResponse(thumb_path, media_type="image/jpeg")
+    try:
+        return await result_store.serve(request, Path(job["sprite_path"]), media_type="image/jpeg")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Sprite sheet file not found")
+
+
+@app.api_route("/api/preview/{job_id}", methods=["GET", "HEAD"])
+async def get_preview(job_id: str, request: Request):
+    """Get the low-bitrate preview clip (supports Range)"""
+    job = job_store.get(job_id)
+    if not job or not job.get("preview_path"):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    
+    try:
+        return await result_store.serve(request, Path(job["preview_path"]), media_type="video/mp4")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Preview file not found")
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket for real-time updates"""
+async def websocket_endpoint(websocket: WebSocket, protocol: int = 1, since: Optional[int] = None):
+    """
+    WebSocket for real-time updates
+    
+    protocol=1 sends full job records; protocol=2 sends a snapshot and then
+    per-field deltas, and resumes from `since` on reconnect.
+    """
     await websocket.accept()
-    active_connections.append(websocket)
+    connection = broadcaster.connect(websocket, protocol=protocol, since=since)
     
     try:
-        # Send current jobs on connect
-        await websocket.send_text(json.dumps({
-            "type": "initial_state",
-            "jobs": list(jobs.values())
-        }))
-        
-        # Keep connection alive
+        # Keep connection alive and apply subscription requests
         while True:
-            await websocket.receive_text()
+            broadcaster.handle_client_message(connection, await websocket.receive_text())
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        broadcaster.disconnect(connection)
 
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint"""
-    # Check if Docker container is running
-    try:
-        result = subprocess.run(
-            ["docker", "inspect", "-f", "{{.State.Running}}", "hunyuan-video"],
-            capture_output=True,
-            text=True
-        )
-        container_running = result.stdout.strip() == "true"
-    except:
-        container_running = False
-    
+    """Health check endpoint (state polled in the background by the health monitor; no I/O here)"""
     return {
-        "status": "healthy" if container_running else "degraded",
-        "container_running": container_running,
-        "active_jobs": sum(1 for j in jobs.values() if j["status"] == "processing"),
-        "total_jobs": len(jobs)
+        **health_monitor.snapshot(),
+        "active_jobs": stats_aggregator.counts.get("processing", 0),
+        "total_jobs": stats_aggregator.total,
+        "queue_depth": scheduler.queue_depth,
+        "max_concurrency": scheduler.concurrency,
     }
 
 
 @app.get("/api/stats")
 async def get_stats():
-    """Get generation statistics"""
-    completed = [j for j in jobs.values() if j["status"] == "completed"]
+    """Get generation statistics (maintained incrementally on job state changes)"""
+    stats = stats_aggregator
+    counts = stats.counts
+    completed_count = stats.completed
     
-    # Get cache stats
-    cache_stats = await cache_manager.get_stats()
+    # Get cache stats (Redis INFO, refreshed at most every STATS_CACHE_TTL seconds)
+    cache_stats = await stats.cache_stats(cache_manager.get_stats)
     
     # Calculate optimization metrics
-    cache_hits = sum(1 for j in completed if j.get("optimization", {}).get("cache_hit"))
-    avg_steps = sum(j.get("optimization", {}).get("final_steps", 30) for j in completed) / len(completed) if completed else 30
+    cache_hits = stats.cache_hits
+    avg_steps = stats.completed_steps / completed_count if completed_count else 30
     
     return {
-        "total_generations": len(jobs),
-        "completed": len(completed),
-        "failed": sum(1 for j in jobs.values() if j["status"] == "failed"),
-        "in_progress": sum(1 for j in jobs.values() if j["status"] == "processing"),
-        "queued": sum(1 for j in jobs.values() if j["status"] == "queued"),
-        "avg_duration": sum(j.get("duration", 0) for j in completed) / len(completed) if completed else 0,
-        "total_duration": sum(j.get("duration", 0) for j in completed),
+        "total_generations": stats.total,
+        "completed": completed_count,
+        "failed": counts.get("failed", 0),
+        "in_progress": counts.get("processing", 0),
+        "queued": counts.get("queued", 0),
+        "avg_duration": stats.completed_duration / completed_count if completed_count else 0,
+        "total_duration": stats.completed_duration,
+        "duration_histogram": stats.histogram,
+        "windows": stats.window_stats(),
         "optimization": {
             "cache_enabled": cache_stats.get("enabled", False),
             "cache_hits": cache_hits,
-            "cache_hit_rate": round((cache_hits / len(completed) * 100) if completed else 0, 1),
+            "cache_hit_rate": round((cache_hits / completed_count * 100) if completed_count else 0, 1),
             "avg_steps": round(avg_steps, 1),
             "adaptive_enabled": adaptive_optimizer.enabled
         },
-        "cache_stats": cache_stats
+        "cache_stats": cache_stats,
+        "deduplication": single_flight.get_stats(),
+        "postprocessing": post_processor.get_stats(),
+        "runtime_estimator": runtime_estimator.get_stats(),
+        "step_policy": step_policy.get_stats()
     }
 
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus/OpenMetrics exposition of pipeline timings, counters and gauges"""
+    body, content_type = render_metrics(request.headers.get("accept", ""))
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
 @app.get("/api/optimization/analyze")
-async def analyze_prompt(prompt: str, quality_tier: str = "auto"):
-    """Analyze a prompt and return optimization recommendations"""
+async def analyze_prompt(prompt: str, quality_tier: str = "auto", video_size: str = "540p",
+                         video_length: int = 129, draft: bool = False):
+    """Analyze a prompt and return optimization recommendations with a learned time estimate"""
     optimized = adaptive_optimizer.optimize_parameters(
         prompt=prompt,
-        video_size="540p",
+        video_size="preview" if draft else video_size,
         infer_steps=0,
-        quality_tier=quality_tier
+        quality_tier=quality_tier,
+        video_length=video_length,
+        draft=draft
     )
     
     return {
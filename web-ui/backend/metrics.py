@@ -0,0 +1,143 @@
+"""
+Metrics
+Prometheus/OpenMetrics instrumentation for the generation pipeline, served at /metrics
+
+Per-job histograms are labeled by resolution, quality tier and prompt
+complexity, and observed once when a job finishes, so every label is known:
+- hunyuan_queue_wait_seconds          submitted -> started on a worker
+- hunyuan_time_to_first_step_seconds  started -> first denoising step
+- hunyuan_seconds_per_step            mean denoising step time
+- hunyuan_encode_seconds              text encoders (warm worker only)
+- hunyuan_vae_decode_seconds          VAE decode (warm worker only)
+- hunyuan_thumbnail_seconds           ffmpeg thumbnail extraction
+Post-processing time is also kept per artifact (hunyuan_postprocess_seconds:
+thumbnail, sprite sheet, preview clip), next to the post-processing queue depth.
+- hunyuan_generation_seconds          total generation time
+Counters cover job outcomes, deduplicated requests, cache hits/misses (and the
+tier that hit) and failed subprocesses; gauges for queue depth and workers are read at scrape time.
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.openmetrics.exposition import (
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE,
+    generate_latest as generate_openmetrics,
+)
+
+JOB_LABELS = ("resolution", "tier", "complexity")
+
+QUEUE_WAIT = Histogram(
+    "hunyuan_queue_wait_seconds", "Time from submission until a worker starts the job",
+    JOB_LABELS, buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+TIME_TO_FIRST_STEP = Histogram(
+    "hunyuan_time_to_first_step_seconds", "Time from job start until the first denoising step",
+    JOB_LABELS, buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+SECONDS_PER_STEP = Histogram(
+    "hunyuan_seconds_per_step", "Mean denoising step time per job",
+    JOB_LABELS, buckets=(0.5, 1, 2, 4, 6, 8, 10, 12, 15, 20, 30, 45, 60),
+)
+ENCODE_SECONDS = Histogram(
+    "hunyuan_encode_seconds", "Text encoder time per job",
+    JOB_LABELS, buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+VAE_DECODE_SECONDS = Histogram(
+    "hunyuan_vae_decode_seconds", "VAE decode time per job",
+    JOB_LABELS, buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+THUMBNAIL_SECONDS = Histogram(
+    "hunyuan_thumbnail_seconds", "Thumbnail extraction time per job",
+    JOB_LABELS, buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+POSTPROCESS_SECONDS = Histogram(
+    "hunyuan_postprocess_seconds", "Time to produce one post-processing artifact",
+    ("artifact",), buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+GENERATION_SECONDS = Histogram(
+    "hunyuan_generation_seconds", "Total generation time per job",
+    JOB_LABELS, buckets=(30, 60, 120, 180, 300, 450, 600, 900, 1200, 1800, 3600),
+)
+
+JOBS_FINISHED = Counter(
+    "hunyuan_jobs_finished_total", "Jobs that reached a terminal status",
+    JOB_LABELS + ("status",),
+)
+JOBS_DEDUPLICATED = Counter(
+    "hunyuan_jobs_deduplicated_total", "Jobs served by another job's run (in_flight) or stored video (completed)",
+    ("kind",),
+)
+CACHE_LOOKUPS = Counter(
+    "hunyuan_cache_lookups_total", "Cache lookups by result (hit/miss/error)",
+    ("cache", "result"),
+)
+CACHE_TIER_HITS = Counter(
+    "hunyuan_cache_tier_hits_total", "Cache hits by the tier that answered (l1 memory, l2 Redis, l3 disk)",
+    ("cache", "tier"),
+)
+SUBPROCESS_FAILURES = Counter(
+    "hunyuan_subprocess_failures_total", "Subprocesses that failed to start or exited non-zero",
+    ("command",),
+)
+
+QUEUE_DEPTH = Gauge("hunyuan_queue_depth", "Jobs waiting for a GPU")
+ACTIVE_JOBS = Gauge("hunyuan_active_jobs", "Jobs running on workers")
+ACTIVE_WORKERS = Gauge("hunyuan_workers_active", "Workers running at least one job")
+HEALTHY_WORKERS = Gauge("hunyuan_workers_healthy", "Workers that answered the last health check")
+POSTPROCESS_QUEUE = Gauge("hunyuan_postprocess_queue_depth", "Finished videos waiting for thumbnails and previews")
+
+
+def bind_gauges(scheduler, pool, post_processor):
+    """Read queue and worker gauges from the scheduler, pool and post-processor at scrape time"""
+    QUEUE_DEPTH.set_function(lambda: scheduler.queue_depth)
+    ACTIVE_JOBS.set_function(lambda: scheduler.active_count)
+    ACTIVE_WORKERS.set_function(lambda: sum(1 for d in pool.devices if d.active_jobs))
+    HEALTHY_WORKERS.set_function(lambda: sum(1 for d in pool.devices if d.healthy))
+    POSTPROCESS_QUEUE.set_function(lambda: post_processor.queue_depth)
+
+
+def job_labels(job: Dict[str, Any]) -> Dict[str, str]:
+    params = job.get("params") or {}
+    return {
+        "resolution": params.get("video_size", "unknown"),
+        "tier": params.get("quality_tier", "unknown"),
+        "complexity": (job.get("optimization") or {}).get("complexity", "unknown"),
+    }
+
+
+def _seconds_between(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    if not start or not end:
+        return None
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+
+
+def observe_job(job: Dict[str, Any]):
+    """Record a finished job's stage timings and outcome"""
+    labels = job_labels(job)
+    JOBS_FINISHED.labels(status=job["status"], **labels).inc()
+
+    queue_wait = _seconds_between(job.get("created_at"), job.get("started_at"))
+    if queue_wait is not None:
+        QUEUE_WAIT.labels(**labels).observe(queue_wait)
+    if job["status"] != "completed":
+        return
+
+    timings = job.get("worker_timings") or {}
+    observations: Tuple[Tuple[Histogram, Optional[float]], ...] = (
+        (TIME_TO_FIRST_STEP, job.get("time_to_first_step")),
+        (SECONDS_PER_STEP, job.get("seconds_per_step")),
+        (ENCODE_SECONDS, timings.get("encode")),
+        (VAE_DECODE_SECONDS, timings.get("vae_decode")),
+        (GENERATION_SECONDS, job.get("duration")),
+    )
+    for histogram, value in observations:
+        if value is not None:
+            histogram.labels(**labels).observe(value)
+
+
+def render(accept: str = "") -> Tuple[bytes, str]:
+    """Exposition body and content type; OpenMetrics if the scraper asks for it"""
+    if "application/openmetrics-text" in accept:
+        return generate_openmetrics(REGISTRY), OPENMETRICS_CONTENT_TYPE
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -6,10 +6,15 @@ Analyzes prompts to determine optimal inference parameters:
 - Resolution recommendations
 - Quality tier suggestions
 """
-import re
 from typing import Dict, Tuple
 from enum import Enum
 
+from prompt_analyzer import prompt_analyzer
+
+# Seconds of fixed per-job overhead on top of denoising
+MODEL_LOAD_OVERHEAD = 30   # fresh sample_video.py process loads the model
+WARM_WORKER_OVERHEAD = 2   # warm worker already has the model resident
+
 
 class ComplexityLevel(Enum):
     """Prompt complexity levels."""
@@ -25,6 +30,21 @@ class QualityTier(Enum):
     PREMIUM = "premium"      # Premium: 720p, 40 steps, ~10 min
 
 
+# Base time per step (seconds) at 129 frames - calibrated from H100 performance
+BASE_SECONDS_PER_STEP = {
+    QualityTier.PREVIEW: 6,    # Fast
+    QualityTier.STANDARD: 11,  # Medium
+    QualityTier.PREMIUM: 14,   # Slow (higher res)
+}
+
+# Resolution label each tier renders at (calibrate_steps.py and the runtime estimator use these)
+TIER_RESOLUTIONS = {
+    QualityTier.PREVIEW: "preview",
+    QualityTier.STANDARD: "540p",
+    QualityTier.PREMIUM: "720p",
+}
+
+
 def analyze_prompt_complexity(prompt: str) -> ComplexityLevel:
     """
     Analyze prompt to determine complexity level.
@@ -33,31 +53,16 @@ def analyze_prompt_complexity(prompt: str) -> ComplexityLevel:
     Moderate: Some motion, simple actions
     Complex: Multiple subjects, complex motion, effects
     """
-    prompt_lower = prompt.lower()
-    
-    # Complexity indicators
-    complex_keywords = [
-        "action", "fighting", "running", "chase", "explosion",
-        "particles", "effects", "transformation", "morphing",
-        "multiple", "crowd", "many", "dynamic", "fast",
-        "spinning", "rotating", "flying through"
-    ]
-    
-    simple_keywords = [
-        "still", "static", "portrait", "close-up", "sunset",
-        "landscape", "simple", "minimal", "calm", "peaceful",
-        "sitting", "standing", "looking"
-    ]
-    
-    # Count indicators
-    complex_count = sum(1 for keyword in complex_keywords if keyword in prompt_lower)
-    simple_count = sum(1 for keyword in simple_keywords if keyword in prompt_lower)
+    # Keyword counts per category (see prompt_analyzer.py)
+    features = prompt_analyzer.analyze(prompt)
+    complex_count = features.counts["action"]
+    simple_count = features.counts["calm"]
     
     # Word count as complexity factor
-    word_count = len(prompt.split())
+    word_count = features.word_count
     
     # Multiple subjects
-    has_multiple_subjects = any(word in prompt_lower for word in ["and", "with", "multiple"])
+    has_multiple_subjects = features.counts["subjects"] > 0
     
     # Determine complexity
     if complex_count >= 2 or (complex_count >= 1 and has_multiple_subjects):
@@ -118,35 +123,31 @@ def get_optimal_resolution(quality_tier: QualityTier) -> Tuple[int, int]:
 def estimate_generation_time(
     complexity: ComplexityLevel,
     quality_tier: QualityTier,
-    video_length: int = 129
+    video_length: int = 129,
+    warm_worker: bool = False
 ) -> float:
     """
-    Estimate generation time in seconds.
+    Estimate generation time in seconds from the static table (the runtime
+    estimator's prior; it learns the real costs from completed jobs).
     
     Args:
         complexity: Prompt complexity level
         quality_tier: Quality tier
         video_length: Number of frames
+        warm_worker: True if a warm worker (model already loaded) runs the job
         
     Returns:
         Estimated time in seconds
     """
-    # Base time per step (seconds) - calibrated from H100 performance
-    base_time_per_step = {
-        QualityTier.PREVIEW: 6,    # Fast
-        QualityTier.STANDARD: 11,  # Medium
-        QualityTier.PREMIUM: 14,   # Slow (higher res)
-    }
-    
     steps = get_optimal_steps(complexity, quality_tier)
-    base_time = steps * base_time_per_step[quality_tier]
+    base_time = steps * BASE_SECONDS_PER_STEP[quality_tier]
     
     # Frame length adjustment (minor)
     if video_length > 129:
         base_time *= (video_length / 129) * 1.1
     
-    # Model loading overhead
-    overhead = 30
+    # Model loading overhead (skipped when a warm worker runs the job)
+    overhead = WARM_WORKER_OVERHEAD if warm_worker else MODEL_LOAD_OVERHEAD
     
     return base_time + overhead
 
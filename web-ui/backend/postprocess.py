@@ -0,0 +1,307 @@
+"""
+Post-processing
+Thumbnails, scrub sprite sheets and preview clips made by a bounded worker pool
+
+The thumbnail ffmpeg run used to be started without being awaited, and the
+job's thumbnail_path was set right away, so the gallery's first request for
+it got a 404 or half a JPEG. Finished videos now go through a queue served by
+POSTPROCESS_WORKERS tasks. Each job gets, in order:
+- thumbnail   first frame, THUMBNAIL_WIDTH wide (thumbnail.jpg)
+- sprite      SPRITE_FRAMES evenly spaced frames tiled into one JPEG, for
+              hover-seek in the gallery (sprite.jpg, grid described in the
+              job's "sprite" field)
+- preview     a small low-bitrate clip without audio (preview.mp4)
+Every artifact is written under a temporary name and renamed into place once
+ffmpeg exits cleanly, and only then reported through on_artifact, so a job
+never names a file that is missing or partial.
+
+ffmpeg runs in the model container (FFMPEG_COMMAND) with POSTPROCESS_THREADS
+threads each, and at most POSTPROCESS_WORKERS jobs are processed at once, so
+post-processing uses a bounded share of the host's CPUs however many jobs
+finish together. Run this module for the benchmark behind the defaults:
+    python postprocess.py
+"""
+import asyncio
+import math
+import os
+import shlex
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import POSTPROCESS_SECONDS, SUBPROCESS_FAILURES, THUMBNAIL_SECONDS
+
+ARTIFACTS = ("thumbnail", "sprite", "preview")
+ARTIFACT_FILES = {"thumbnail": "thumbnail.jpg", "sprite": "sprite.jpg", "preview": "preview.mp4"}
+
+# sample_video.py writes every video at 24 fps
+VIDEO_FPS = 24
+
+SPRITE_COLUMNS = 5
+SPRITE_TILE_WIDTH = 160
+
+# (job_id, artifact, fields to set on the job)
+ArtifactCallback = Callable[[str, str, Dict[str, Any]], None]
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def sprite_layout(frames: int, height: int, width: int, tiles: int) -> Dict[str, Any]:
+    """Grid for a sprite sheet of up to `tiles` frames sampled evenly from a video"""
+    every = max(1, math.ceil(frames / tiles))
+    count = max(1, math.ceil(frames / every))
+    columns = min(SPRITE_COLUMNS, count)
+    return {
+        "every": every,
+        "frames": count,
+        "columns": columns,
+        "rows": math.ceil(count / columns),
+        "tile_width": SPRITE_TILE_WIDTH,
+        "tile_height": _even(SPRITE_TILE_WIDTH * height / width),
+        "interval_seconds": round(every / VIDEO_FPS, 3),
+    }
+
+
+class PostProcessor:
+    def __init__(self, command: Optional[List[str]] = None, workers: Optional[int] = None):
+        self.command = command or shlex.split(os.getenv("FFMPEG_COMMAND", "docker exec hunyuan-video ffmpeg"))
+        self.workers = workers or int(os.getenv("POSTPROCESS_WORKERS", "2"))
+        self.threads = int(os.getenv("POSTPROCESS_THREADS", "2"))
+        self.timeout = float(os.getenv("POSTPROCESS_TIMEOUT", "300"))
+        self.thumbnail_width = int(os.getenv("THUMBNAIL_WIDTH", "640"))
+        self.sprite_frames = int(os.getenv("SPRITE_FRAMES", "25"))
+        self.preview_width = int(os.getenv("PREVIEW_WIDTH", "320"))
+        self.preview_bitrate = os.getenv("PREVIEW_BITRATE", "300k")
+        # Set by the app
+        self.on_artifact: Optional[ArtifactCallback] = None
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # job_id -> jobs that receive its artifacts (itself first, then jobs sharing its video)
+        self._listeners: Dict[str, List[str]] = {}
+        self._active = 0
+        self._done: Dict[str, int] = {artifact: 0 for artifact in ARTIFACTS}
+        self._failed: Dict[str, int] = {artifact: 0 for artifact in ARTIFACTS}
+        self._seconds: Dict[str, float] = {artifact: 0.0 for artifact in ARTIFACTS}
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id: str, video: Path, frames: int, height: int, width: int,
+               labels: Optional[Dict[str, str]] = None):
+        """Queue a finished video; its artifacts are reported one by one as they are ready"""
+        self._listeners[job_id] = [job_id]
+        self._queue.put_nowait((job_id, Path(video), frames, height, width, labels or {}))
+
+    def share(self, source_id: str, job_id: str) -> bool:
+        """Also report source_id's remaining artifacts to job_id; False if none are pending"""
+        listeners = self._listeners.get(source_id)
+        if listeners is None:
+            return False
+        listeners.append(job_id)
+        return True
+
+    def discard(self, job_id: str):
+        """Stop reporting to a deleted job; its own pending work is skipped"""
+        self._listeners.pop(job_id, None)
+        for listeners in self._listeners.values():
+            if job_id in listeners:
+                listeners.remove(job_id)
+
+    async def _work(self):
+        while True:
+            job_id, video, frames, height, width, labels = await self._queue.get()
+            self._active += 1
+            try:
+                await self._process(job_id, video, frames, height, width, labels)
+            except Exception as e:
+                print(f"⚠️ Post-processing failed for {job_id}: {e}")
+            finally:
+                self._active -= 1
+                self._listeners.pop(job_id, None)
+                self._queue.task_done()
+
+    async def _process(self, job_id: str, video: Path, frames: int, height: int, width: int,
+                       labels: Dict[str, str]):
+        layout = sprite_layout(frames, height, width, self.sprite_frames)
+        for artifact in ARTIFACTS:
+            if job_id not in self._listeners:
+                return  # deleted meanwhile
+            target = video.parent / ARTIFACT_FILES[artifact]
+            partial = target.with_name(f".{target.stem}.partial{target.suffix}")
+            start = time.monotonic()
+            ok = await self._ffmpeg(artifact, video, partial, layout)
+            if not ok or not partial.exists() or partial.stat().st_size == 0:
+                self._failed[artifact] += 1
+                SUBPROCESS_FAILURES.labels(command=f"ffmpeg_{artifact}").inc()
+                partial.unlink(missing_ok=True)
+                continue
+            os.replace(partial, target)
+            elapsed = time.monotonic() - start
+            self._done[artifact] += 1
+            self._seconds[artifact] += elapsed
+            POSTPROCESS_SECONDS.labels(artifact=artifact).observe(elapsed)
+            if artifact == "thumbnail" and labels:
+                THUMBNAIL_SECONDS.labels(**labels).observe(elapsed)
+
+            fields: Dict[str, Any] = {f"{artifact}_path": str(target)}
+            if artifact == "sprite":
+                fields["sprite"] = {k: v for k, v in layout.items() if k != "every"}
+            for listener in list(self._listeners.get(job_id, [])):
+                if self.on_artifact:
+                    self.on_artifact(listener, artifact, fields)
+
+    def _arguments(self, artifact: str, video: Path, output: Path, layout: Dict[str, Any]) -> List[str]:
+        args = ["-nostdin", "-y", "-loglevel", "error", "-threads", str(self.threads), "-i", str(video)]
+        if artifact == "thumbnail":
+            args += ["-frames:v", "1", "-vf", f"scale={self.thumbnail_width}:-2", "-q:v", "3"]
+        elif artifact == "sprite":
+            args += [
+                "-vf",
+                f"select='not(mod(n\\,{layout['every']}))',"
+                f"scale={layout['tile_width']}:{layout['tile_height']},"
+                f"tile={layout['columns']}x{layout['rows']}",
+                "-frames:v", "1", "-vsync", "vfr", "-q:v", "4",
+            ]
+        else:
+            args += [
+                "-an", "-vf", f"scale={self.preview_width}:-2,fps=12",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "32",
+                "-maxrate", self.preview_bitrate, "-bufsize", self.preview_bitrate,
+                "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            ]
+        return args + ["-threads", str(self.threads), str(output)]
+
+    async def _ffmpeg(self, artifact: str, video: Path, output: Path, layout: Dict[str, Any]) -> bool:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self.command, *self._arguments(artifact, video, output, layout),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+        except OSError:
+            return False
+        try:
+            return await asyncio.wait_for(process.wait(), timeout=self.timeout) == 0
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "queue_depth": self.queue_depth,
+            "active": self._active,
+            "artifacts": {
+                artifact: {
+                    "completed": self._done[artifact],
+                    "failed": self._failed[artifact],
+                    "avg_seconds": round(self._seconds[artifact] / self._done[artifact], 3)
+                    if self._done[artifact] else None,
+                }
+                for artifact in ARTIFACTS
+            },
+        }
+
+
+# Global post-processor instance
+post_processor = PostProcessor()
+
+
+async def benchmark(video: Path, jobs: int, workers: int) -> Dict[str, Any]:
+    """
+    Post-process `jobs` copies of a video with a local ffmpeg while a CPU-bound
+    thread stands in for the host side of a running generation; reports
+    artifact latency and how much the stand-in and the event loop slowed down
+    """
+    import hashlib
+    import shutil
+    import tempfile
+    import threading
+
+    def generation_proxy(stop: threading.Event, counts: List[int]):
+        block = os.urandom(1 << 20)
+        while not stop.is_set():
+            hashlib.sha256(block).digest()
+            counts[0] += 1
+
+    async def proxy_rate(seconds: float, during: Optional[asyncio.Future] = None) -> Tuple[float, float]:
+        """Proxy iterations per second and the worst event loop lag, over `seconds` or until `during` ends"""
+        stop, counts = threading.Event(), [0]
+        thread = threading.Thread(target=generation_proxy, args=(stop, counts))
+        start = time.monotonic()
+        thread.start()
+        worst_lag = 0.0
+        while (during is None and time.monotonic() - start < seconds) or (during is not None and not during.done()):
+            tick = time.monotonic()
+            await asyncio.sleep(0.01)
+            worst_lag = max(worst_lag, time.monotonic() - tick - 0.01)
+        stop.set()
+        thread.join()
+        return counts[0] / (time.monotonic() - start), worst_lag
+
+    baseline, _ = await proxy_rate(3.0)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="postprocess-bench-"))
+    processor = PostProcessor(command=["ffmpeg"], workers=workers)
+    ready: Dict[str, float] = {}
+    submitted = time.monotonic()
+    processor.on_artifact = lambda job_id, artifact, fields: ready.setdefault(
+        f"{job_id}/{artifact}", time.monotonic() - submitted
+    )
+    await processor.start()
+    for i in range(jobs):
+        job_dir = work_dir / f"job-{i}"
+        job_dir.mkdir()
+        shutil.copyfile(video, job_dir / "video.mp4")
+        processor.submit(f"job-{i}", job_dir / "video.mp4", frames=129, height=720, width=1280)
+    drained = asyncio.ensure_future(processor._queue.join())
+    during, worst_lag = await proxy_rate(0, drained)
+    elapsed = time.monotonic() - submitted
+    await processor.stop()
+    shutil.rmtree(work_dir)
+
+    thumbnails = sorted(v for k, v in ready.items() if k.endswith("/thumbnail"))
+    return {
+        "workers": workers,
+        "jobs": jobs,
+        "elapsed_s": round(elapsed, 2),
+        "jobs_per_min": round(jobs / elapsed * 60, 1),
+        "thumbnail_p50_s": round(thumbnails[len(thumbnails) // 2], 2) if thumbnails else None,
+        "thumbnail_max_s": round(thumbnails[-1], 2) if thumbnails else None,
+        "artifacts_ready": len(ready),
+        "generation_proxy_slowdown": round(1 - during / baseline, 3),
+        "event_loop_max_lag_ms": round(worst_lag * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    # Pool size sweep on a synthetic 129-frame 720p clip (needs ffmpeg on PATH)
+    import subprocess
+    import tempfile
+
+    clip = Path(tempfile.mkdtemp(prefix="postprocess-clip-")) / "clip.mp4"
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"testsrc2=size=1280x720:rate={VIDEO_FPS}", "-frames:v", "129",
+         "-c:v", "libx264", "-crf", "18", "-pix_fmt", "yuv420p", str(clip)],
+        check=True
+    )
+    print({"cpus": os.cpu_count(), "threads_per_worker": PostProcessor().threads})
+    for pool_size in (1, 2, 4):
+        print(asyncio.run(benchmark(clip, jobs=8, workers=pool_size)))
@@ -0,0 +1,158 @@
+"""
+Progress Tracking
+Step-accurate progress, seconds-per-step and ETA for generation jobs
+
+sample_video.py reports denoising progress through tqdm on stderr, e.g.
+    " 40%|████      | 20/50 [01:23<02:05,  4.17s/it]"
+tqdm redraws the bar with carriage returns, so a whole run can arrive as one
+"line". ProgressParser splits on both \\r and \\n and extracts the k/N counter,
+rate and remaining time. ProgressTracker turns step updates (parsed or reported
+directly by the warm worker) into job fields and says whether anything visible
+changed, so callers only broadcast real updates.
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+# "20/50 [01:23<02:05,  4.17s/it]" or "20/50 [00:10<00:25,  1.95it/s]"
+TQDM_PATTERN = re.compile(
+    r"(?P<step>\d+)/(?P<total>\d+)\s*"
+    r"\[(?P<elapsed>[\d:]+)<(?P<remaining>[\d:?]+)"
+    r"(?:,\s*(?P<rate>[\d.]+)\s*(?P<unit>s/it|it/s))?"
+)
+
+# Share of the progress bar covered by denoising; the rest is setup and saving
+DENOISE_START = 10
+DENOISE_END = 95
+
+
+def _clock_to_seconds(value: str) -> Optional[float]:
+    """Convert tqdm's [HH:]MM:SS to seconds"""
+    if "?" in value:
+        return None
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class ProgressParser:
+    """
+    Incremental parser for tqdm output; feed raw chunks as they arrive
+
+    Args:
+        expected_total: If set, ignore bars with a different total (such as
+            "Loading checkpoint shards: 4/4") so only denoising steps count
+    """
+
+    def __init__(self, expected_total: Optional[int] = None):
+        self.expected_total = expected_total
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Parse a chunk of output
+
+        Returns:
+            One dict per complete tqdm update: step, total, and when tqdm
+            printed them, seconds_per_step and remaining_seconds
+        """
+        self._buffer += chunk
+        *segments, self._buffer = re.split(r"[\r\n]", self._buffer)
+        return [update for update in map(self.parse_segment, segments) if self._accept(update)]
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Parse whatever remains after the stream closes"""
+        segment, self._buffer = self._buffer, ""
+        update = self.parse_segment(segment)
+        return [update] if self._accept(update) else []
+
+    def _accept(self, update: Optional[Dict[str, Any]]) -> bool:
+        if not update:
+            return False
+        return self.expected_total is None or update["total"] == self.expected_total
+
+    @staticmethod
+    def parse_segment(segment: str) -> Optional[Dict[str, Any]]:
+        match = TQDM_PATTERN.search(segment)
+        if not match:
+            return None
+
+        update: Dict[str, Any] = {
+            "step": int(match.group("step")),
+            "total": int(match.group("total")),
+            "seconds_per_step": None,
+            "remaining_seconds": _clock_to_seconds(match.group("remaining")),
+        }
+        rate = match.group("rate")
+        if rate and float(rate) > 0:
+            rate_value = float(rate)
+            update["seconds_per_step"] = rate_value if match.group("unit") == "s/it" else 1 / rate_value
+        return update
+
+
+class ProgressTracker:
+    """Turns step updates into job progress fields"""
+
+    def __init__(self):
+        self.step = 0
+        self.total = 0
+        self.seconds_per_step: Optional[float] = None
+        self.eta_seconds: Optional[float] = None
+        self._first_step_at: Optional[float] = None
+        self._first_step = 0
+        self._last_fields: Dict[str, Any] = {}
+
+    @property
+    def fraction(self) -> float:
+        return self.step / self.total if self.total else 0.0
+
+    @property
+    def progress(self) -> int:
+        return DENOISE_START + int((DENOISE_END - DENOISE_START) * self.fraction)
+
+    def update(self, step: int, total: int, seconds_per_step: Optional[float] = None,
+               remaining_seconds: Optional[float] = None) -> bool:
+        """
+        Record a step update
+
+        Seconds per step is measured from wall time between the first and latest
+        step seen (so model load before step 1 is excluded) unless the source
+        reports its own rate.
+
+        Returns:
+            True if the job-visible fields changed
+        """
+        now = time.time()
+        if total != self.total or step < self.step:
+            # New progress bar (e.g. next item in a batch)
+            self._first_step_at, self._first_step = now, step
+        elif self._first_step_at is None:
+            self._first_step_at, self._first_step = now, step
+
+        self.step, self.total = step, total
+
+        if seconds_per_step is None and step > self._first_step:
+            seconds_per_step = (now - self._first_step_at) / (step - self._first_step)
+        if seconds_per_step is not None:
+            self.seconds_per_step = seconds_per_step
+
+        if remaining_seconds is None and self.seconds_per_step is not None:
+            remaining_seconds = self.seconds_per_step * (total - step)
+        self.eta_seconds = remaining_seconds
+
+        fields = self.fields()
+        # ETA ticks every step; only count it as a change when it moves by a second
+        comparable = dict(fields, eta_seconds=None if fields["eta_seconds"] is None else int(fields["eta_seconds"]))
+        changed = comparable != self._last_fields
+        self._last_fields = comparable
+        return changed
+
+    def fields(self) -> Dict[str, Any]:
+        return {
+            "progress": self.progress,
+            "step": self.step,
+            "total_steps": self.total,
+            "seconds_per_step": None if self.seconds_per_step is None else round(self.seconds_per_step, 2),
+            "eta_seconds": None if self.eta_seconds is None else round(self.eta_seconds, 1),
+        }
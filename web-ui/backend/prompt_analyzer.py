@@ -0,0 +1,176 @@
+"""
+Prompt Analyzer
+One compiled keyword matcher behind every prompt-complexity heuristic
+
+adaptive_optimizer.py and optimizer.py each scanned their own keyword lists
+with `keyword in prompt_lower`, one scan per keyword. That matched substrings
+("and" in "sand", "pan" in "japan"), counted any "," as a subject, and never
+matched the mixed-case "POV" against the lowercased text. All categories now
+live in CATEGORIES and are compiled once into a word-level matcher:
+- a prompt is split into casefolded words by one regex findall, so keywords
+  match whole words only, in any case
+- one-word keywords are found by a single set intersection with the prompt's
+  words, not one scan per keyword
+- multi-word keywords are indexed by their first word and compared word by
+  word only where that word occurs (so "god   rays" and "close up" match)
+analyze() returns how many distinct keywords of each category a prompt
+contains. analyze_many() scores a whole storyboard and analyzes repeated
+prompts once.
+
+Run this module for the microbenchmark against the per-keyword scans:
+    python prompt_analyzer.py
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+CATEGORIES: Dict[str, List[str]] = {
+    # adaptive_optimizer.py scoring
+    "motion": [
+        "walking", "running", "flying", "moving", "dancing", "jumping",
+        "swimming", "driving", "riding", "chasing", "racing", "spinning",
+    ],
+    "scene": [
+        "crowd", "crowded", "city", "busy", "complex", "detailed", "intricate",
+        "marketplace", "festival", "traffic", "cityscape", "panorama",
+    ],
+    "camera": [
+        "zoom", "zooming", "pan", "panning", "tracking", "dolly", "crane", "orbit",
+        "orbiting", "flythrough", "POV", "handheld", "gimbal",
+    ],
+    "lighting": [
+        "sunset", "sunrise", "lightning", "fire", "neon", "sparkles",
+        "glow", "glowing", "dramatic lighting", "god rays", "volumetric",
+    ],
+    "quality": [
+        "photorealistic", "hyperrealistic", "cinematic", "8k", "4k",
+        "high detail", "ultra detailed", "masterpiece", "professional",
+    ],
+    "subjects": ["and", "with", "multiple", "several", "many"],
+    # optimizer.py tiers
+    "action": [
+        "action", "fighting", "running", "chase", "explosion",
+        "particles", "effects", "transformation", "morphing",
+        "multiple", "crowd", "many", "dynamic", "fast",
+        "spinning", "rotating", "flying through",
+    ],
+    "calm": [
+        "still", "static", "portrait", "close-up", "sunset",
+        "landscape", "simple", "minimal", "calm", "peaceful",
+        "sitting", "standing", "looking",
+    ],
+}
+
+_WORD = re.compile(r"\w+")
+
+
+class PromptFeatures(NamedTuple):
+    counts: Dict[str, int]  # category -> distinct keywords found
+    word_count: int
+
+
+def _words(text: str) -> Tuple[str, ...]:
+    return tuple(_WORD.findall(text.casefold()))
+
+
+class PromptAnalyzer:
+    def __init__(self, categories: Dict[str, List[str]] = CATEGORIES):
+        self.categories = list(categories)
+        # keyword (as a tuple of words) -> categories it belongs to
+        self._keywords: Dict[Tuple[str, ...], List[str]] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                self._keywords.setdefault(_words(keyword), []).append(category)
+        # One-word keywords are found by a set intersection; longer ones are
+        # only looked for when their first word occurs
+        self._single = frozenset(words[0] for words in self._keywords if len(words) == 1)
+        self._phrases: Dict[str, List[Tuple[str, ...]]] = {}
+        for words in self._keywords:
+            if len(words) > 1:
+                self._phrases.setdefault(words[0], []).append(words)
+        self._phrase_starts = frozenset(self._phrases)
+
+    def keywords(self, prompt: str) -> Set[Tuple[str, ...]]:
+        """Distinct keywords in a prompt, as word tuples"""
+        words = _words(prompt)
+        vocabulary = set(words)
+        found = {(word,) for word in self._single.intersection(vocabulary)}
+        if not self._phrase_starts.isdisjoint(vocabulary):
+            for index, word in enumerate(words):
+                for phrase in self._phrases.get(word, ()):
+                    if words[index:index + len(phrase)] == phrase:
+                        found.add(phrase)
+        return found
+
+    def analyze(self, prompt: str) -> PromptFeatures:
+        counts = dict.fromkeys(self.categories, 0)
+        for keyword in self.keywords(prompt):
+            for category in self._keywords[keyword]:
+                counts[category] += 1
+        return PromptFeatures(counts, len(prompt.split()))
+
+    def analyze_many(self, prompts: Iterable[str]) -> List[PromptFeatures]:
+        """Features for many prompts (e.g. a storyboard); repeated prompts are analyzed once"""
+        seen: Dict[str, PromptFeatures] = {}
+        results = []
+        for prompt in prompts:
+            features = seen.get(prompt)
+            if features is None:
+                features = seen[prompt] = self.analyze(prompt)
+            results.append(features)
+        return results
+
+
+# Global analyzer instance
+prompt_analyzer = PromptAnalyzer()
+
+
+if __name__ == "__main__":
+    # Per-keyword substring scans (the previous analyze_prompt) vs. the compiled
+    # matcher, one prompt at a time and as one storyboard
+    import random
+    import time
+
+    rng = random.Random(1)
+    keyword_pool = [k for keywords in CATEGORIES.values() for k in keywords]
+    filler = ("a the of on in cat dog woman man street beach forest sand brand android "
+              "japan thousand candle window golden slowly bright morning rain").split()
+
+    def make_prompt() -> str:
+        words = rng.choices(filler, k=rng.randint(8, 40)) + rng.sample(keyword_pool, rng.randint(0, 5))
+        rng.shuffle(words)
+        return ", ".join(" ".join(words[i:i + 6]) for i in range(0, len(words), 6))
+
+    def legacy_counts(prompt: str) -> Dict[str, int]:
+        prompt_lower = prompt.lower()
+        counts = {}
+        for category in ("motion", "scene", "camera", "lighting", "quality", "action", "calm"):
+            counts[category] = sum(1 for kw in CATEGORIES[category] if kw in prompt_lower)
+        counts["subjects"] = sum(1 for word in ["and", ",", "with", "multiple", "several", "many"] if word in prompt_lower)
+        counts["words"] = len(prompt.split())
+        return counts
+
+    prompts = [make_prompt() for _ in range(10_000)]
+    results = {"prompts": len(prompts)}
+    for name, run in (
+        ("legacy_scans", lambda: [legacy_counts(p) for p in prompts]),
+        ("compiled_single", lambda: [prompt_analyzer.analyze(p) for p in prompts]),
+        ("compiled_batch", lambda: prompt_analyzer.analyze_many(prompts)),
+    ):
+        start = time.perf_counter()
+        output = run()
+        elapsed = time.perf_counter() - start
+        results[f"{name}_us_per_prompt"] = round(elapsed / len(prompts) * 1e6, 2)
+        results[name] = output
+
+    legacy, compiled = results.pop("legacy_scans"), results.pop("compiled_single")
+    batch = results.pop("compiled_batch")
+    assert batch == compiled, "batch and single-prompt analysis disagree"
+    # Substring matches ("and" in "sand") and the "," subject make the old
+    # counts differ; how often, per category
+    results["prompts_counted_differently"] = {
+        category: sum(1 for old, new in zip(legacy, compiled) if old[category] != new.counts[category])
+        for category in CATEGORIES
+    }
+    results["speedup_single"] = round(results["legacy_scans_us_per_prompt"] / results["compiled_single_us_per_prompt"], 2)
+    results["speedup_batch"] = round(results["legacy_scans_us_per_prompt"] / results["compiled_batch_us_per_prompt"], 2)
+    print(results)
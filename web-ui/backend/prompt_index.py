@@ -0,0 +1,169 @@
+"""
+Prompt Index
+Canonical prompt keys and near-duplicate lookup for the embedding/latent caches
+
+canonicalize() folds Unicode forms, case, whitespace and punctuation, so
+"A cat on a sofa" and "a cat on a sofa." share one cache key.
+
+PromptIndex finds the most similar cached prompt above a similarity threshold
+(Jaccard similarity of word unigrams + bigrams of the canonical prompts).
+Prompts are sketched with MinHash and the sketch is split into BANDS bands of
+ROWS values (LSH banding): two prompts become candidates when any band
+matches, then candidates are re-scored exactly. The lookup cost depends on the
+prompt length and the few colliding candidates, not on the number of entries,
+so it stays sub-millisecond at 100k+ prompts on one CPU core with no numpy.
+
+Text-encoder outputs are deliberately not the vectors being indexed: finding a
+neighbour by them would mean running the encoders first, which is exactly the
+cost a cache hit avoids.
+"""
+import hashlib
+import random
+import re
+import struct
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+BANDS = 10
+ROWS = 5
+SKETCH_SIZE = BANDS * ROWS
+
+_HASHES = struct.Struct(f"<{SKETCH_SIZE}I")
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def canonicalize(prompt: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive form of a prompt"""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def shingles(canonical: str) -> Set[str]:
+    """Word unigrams and bigrams of a canonical prompt"""
+    words = canonical.split()
+    return set(words).union(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def sketch(features: Set[str]) -> List[int]:
+    """MinHash signature: per hash function, the minimum over the features"""
+    if not features:
+        return [0] * SKETCH_SIZE
+    # One SHAKE digest per feature yields all SKETCH_SIZE hash values at once
+    rows = [_HASHES.unpack(hashlib.shake_128(f.encode()).digest(_HASHES.size)) for f in features]
+    return list(map(min, zip(*rows)))
+
+
+class PromptIndex:
+    """Near-duplicate prompt lookup; optionally persisted as one prompt per line"""
+
+    def __init__(self, threshold: float = 0.85, path: Optional[Union[str, Path]] = None):
+        self.threshold = threshold
+        self.path = Path(path) if path else None
+        self._prompts: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._buckets: Dict[int, Union[int, List[int]]] = {}  # band hash -> id, or ids on collision
+
+    def load(self) -> int:
+        """Index the prompts persisted at path (about 5k/s, so run it off the event loop)"""
+        if not self.path or not self.path.exists():
+            return 0
+        with open(self.path, encoding="utf-8") as f:
+            return sum(self._insert(line.rstrip("\n")) for line in f)
+
+    def __len__(self) -> int:
+        return len(self._prompts)
+
+    def _band_keys(self, signature: List[int]) -> List[int]:
+        return [hash((band,) + tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+    def _insert(self, canonical: str) -> bool:
+        if not canonical or canonical in self._ids:
+            return False
+        entry_id = len(self._prompts)
+        self._prompts.append(canonical)
+        self._ids[canonical] = entry_id
+        for key in self._band_keys(sketch(shingles(canonical))):
+            existing = self._buckets.get(key)
+            if existing is None:
+                self._buckets[key] = entry_id
+            elif isinstance(existing, list):
+                existing.append(entry_id)
+            else:
+                self._buckets[key] = [existing, entry_id]
+        return True
+
+    def add(self, prompt: str):
+        """Index a prompt that now has a cache entry"""
+        canonical = canonicalize(prompt)
+        if self._insert(canonical) and self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(canonical + "\n")
+
+    def nearest(self, prompt: str) -> Optional[Tuple[str, float]]:
+        """Most similar indexed prompt (canonical form) and its similarity, if above threshold"""
+        canonical = canonicalize(prompt)
+        if canonical in self._ids:
+            return canonical, 1.0
+
+        features = shingles(canonical)
+        candidates: Set[int] = set()
+        for key in self._band_keys(sketch(features)):
+            bucket = self._buckets.get(key)
+            if isinstance(bucket, list):
+                candidates.update(bucket)
+            elif bucket is not None:
+                candidates.add(bucket)
+
+        best: Optional[Tuple[str, float]] = None
+        for entry_id in candidates:
+            candidate = self._prompts[entry_id]
+            similarity = jaccard(features, shingles(candidate))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+
+if __name__ == "__main__":
+    # Lookup latency and recall at 100k prompts drawn from a Zipf-distributed vocabulary
+    import time
+
+    rng = random.Random(1)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "do", "pa", "qui"]
+    vocabulary = list({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(20000)})[:5000]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def make_prompt() -> str:
+        return " ".join(rng.choices(vocabulary, weights, k=rng.randint(12, 30)))
+
+    index = PromptIndex(threshold=0.8)
+    prompts = [make_prompt() for _ in range(100_000)]
+    start = time.perf_counter()
+    for prompt in prompts:
+        index.add(prompt)
+    build = time.perf_counter() - start
+
+    queries = rng.sample(prompts, 2000)
+    variants = {
+        "exact": queries,
+        "canonical": [q.upper().replace(" ", ", ", 1) + "." for q in queries],
+        "one_word_added": [f"{q} {rng.choice(vocabulary)}" for q in queries],
+        "unrelated": [make_prompt() for _ in queries],
+    }
+    results = {}
+    for name, batch in variants.items():
+        start = time.perf_counter()
+        found = [index.nearest(q) for q in batch]
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "lookup_ms": round(elapsed / len(batch) * 1000, 3),
+            "found": round(sum(1 for f in found if f) / len(batch), 3),
+        }
+    print({"entries": len(index), "build_s": round(build, 2), **results})
@@ -0,0 +1,286 @@
+"""
+Result Store
+Content-addressed storage for generated videos, served with HTTP caching
+
+A finished video is hashed (SHA-256) and stored once, as
+RESULTS_DIR/objects/<2 hex>/<digest><suffix>. A SQLite index
+(RESULTS_DIR/results.db) keeps each object's size, media type and how many
+jobs reference it. The job's own directory keeps a hard link to the object
+under the original file name (the thumbnail ffmpeg run and the sample_video.py
+layout expect it there), so an identical output costs a directory entry, not
+another copy. The object is unlinked when its last job is deleted.
+
+serve() answers a GET/HEAD for a stored file:
+- strong ETag: the content digest (mtime + size for files outside the store)
+- If-None-Match -> 304
+- a single Range (bytes=a-b, a-, -n) -> 206 with Content-Range, 416 when
+  unsatisfiable; If-Range with another validator gets the whole file
+- Cache-Control: immutable, since a job's output never changes (no-cache
+  for a video the worker is still writing, served with live=True)
+- the body goes out via the ASGI pathsend extension when the server offers
+  it (sendfile), else in 1 MiB chunks read off the event loop. Behind the
+  nginx frontend, which marks proxied requests with X-Results-Accel, the
+  response is an X-Accel-Redirect and nginx sends the file itself.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+
+CHUNK_SIZE = 1024 * 1024
+
+MEDIA_TYPES = {".mp4": "video/mp4", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+
+class StoredObject(NamedTuple):
+    digest: str
+    path: Path
+    size: int
+    media_type: str
+
+
+class ResultStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS objects (
+            digest TEXT PRIMARY KEY,
+            suffix TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            media_type TEXT NOT NULL,
+            refs INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = int(os.getenv("RESULTS_MAX_AGE", str(365 * 24 * 3600)))
+        # Called from request handlers and from worker threads (ingest)
+        self.db = sqlite3.connect(str(self.root / "results.db"), check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        # digest -> object, so serving a video never touches SQLite
+        self._objects: Dict[str, StoredObject] = {}
+
+    def _object_path(self, digest: str, suffix: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}{suffix}"
+
+    def get(self, digest: str) -> Optional[StoredObject]:
+        stored = self._objects.get(digest)
+        if stored is None:
+            with self._lock:
+                row = self.db.execute("SELECT * FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            stored = StoredObject(digest, self._object_path(digest, row["suffix"]), row["size"], row["media_type"])
+            self._objects[digest] = stored
+        return stored
+
+    def ingest(self, path: Path) -> str:
+        """
+        Store a finished output and return its digest (blocking; run it in a thread)
+
+        When identical content is already stored, `path` is replaced by a
+        link to the existing object and its own copy is freed.
+        """
+        path = Path(path)
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        size = path.stat().st_size
+        target = self._object_path(digest, path.suffix)
+        with self._lock:
+            if target.exists():
+                _replace_with_link(target, path)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                _replace_with_link(path, target)
+            row = self.db.execute("SELECT refs FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE objects SET refs = refs + 1 WHERE digest = ?", (digest,))
+                return digest
+            self.db.execute(
+                "INSERT OR REPLACE INTO objects (digest, suffix, size, media_type, refs, created_at) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                (digest, path.suffix, size, MEDIA_TYPES.get(path.suffix, "application/octet-stream"), time.time())
+            )
+        return digest
+
+    def link(self, digest: str, path: Path) -> bool:
+        """Reference a stored object from another job's directory; False if it is gone"""
+        stored = self.get(digest)
+        if stored is None:
+            return False
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            try:
+                _replace_with_link(stored.path, path)
+            except FileNotFoundError:
+                return False
+            self.db.execute("UPDATE objects SET refs = refs + 1 WHERE digest = ?", (digest,))
+        return True
+
+    def release(self, digest: str):
+        """Drop one job's reference; the object is deleted with its last one"""
+        with self._lock:
+            row = self.db.execute("SELECT suffix, refs FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return
+            if row["refs"] > 1:
+                self.db.execute("UPDATE objects SET refs = refs - 1 WHERE digest = ?", (digest,))
+                return
+            self.db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            self._objects.pop(digest, None)
+            self._object_path(digest, row["suffix"]).unlink(missing_ok=True)
+
+    async def serve(self, request: Request, path: Path, digest: Optional[str] = None,
+                    media_type: Optional[str] = None, filename: Optional[str] = None,
+                    live: bool = False) -> Response:
+        """
+        Response for a stored file with ETag, conditional and Range handling
+
+        live=True is for a file that is still being written (see streaming.py):
+        it is not cacheable and its total length is reported as unknown.
+
+        Raises:
+            FileNotFoundError: the file is gone
+        """
+        stored = self.get(digest) if digest else None
+        if stored is not None:
+            size, etag = stored.size, f'"{digest}"'
+            media_type = media_type or stored.media_type
+        else:
+            stat = await anyio.to_thread.run_sync(os.stat, path)
+            size, etag = stat.st_size, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        media_type = media_type or MEDIA_TYPES.get(Path(path).suffix, "application/octet-stream")
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache" if live else f"public, max-age={self.max_age}, immutable",
+            "Accept-Ranges": "bytes",
+        }
+        if filename:
+            headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+        if etag in _etags(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+        accel = request.headers.get("x-results-accel")
+        if accel and not live:
+            # nginx serves the bytes (sendfile, Range) from its own mount of the results directory
+            relative = Path(path).resolve().relative_to(self.root.resolve()).as_posix()
+            return Response(status_code=200, media_type=media_type,
+                            headers={**headers, "X-Accel-Redirect": accel.rstrip("/") + "/" + relative})
+
+        byte_range = None
+        if_range = request.headers.get("if-range")
+        if "range" in request.headers and (if_range is None or if_range == etag):
+            byte_range = parse_range(request.headers["range"], size)
+            if byte_range == "unsatisfiable":
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        # Opened here so a missing file raises before any response starts
+        file = await anyio.open_file(path, "rb")
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{'*' if live else size}"
+            return FileRangeResponse(file, path, start, end, 206, headers, media_type)
+        return FileRangeResponse(file, path, 0, size - 1, 200, headers, media_type, pathsend=not live)
+
+
+def _replace_with_link(source: Path, path: Path):
+    """Make `path` a hard link to `source` (atomically replacing it), or a copy across filesystems"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.link")
+    try:
+        os.link(source, tmp)
+    except OSError as e:
+        if e.errno != 18:  # EXDEV
+            raise
+        import shutil
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, path)
+
+
+def _etags(header: Optional[str]) -> set:
+    if not header:
+        return set()
+    if header.strip() == "*":
+        return {"*"}
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) inclusive for a single byte range, None to ignore the header
+    (malformed, or several ranges: the whole file is a valid answer), or
+    "unsatisfiable"
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                return "unsatisfiable"
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Bytes start..end (inclusive) of an open file, which the response closes"""
+
+    def __init__(self, file, path: Path, start: int, end: int, status_code: int,
+                 headers: Dict[str, str], media_type: str, pathsend: bool = True):
+        self.file = file
+        self.path = Path(path)
+        self.start, self.end = start, end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        # pathsend sends the whole file as it is then; not for one that is still growing
+        self.pathsend = pathsend
+        self.init_headers({**headers, "Content-Length": str(max(end - start + 1, 0))})
+
+    async def __call__(self, scope, receive, send):
+        file = self.file
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"].upper() == "HEAD" or self.end < self.start:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            whole = self.status_code == 200 and self.pathsend
+            if whole and "http.response.pathsend" in scope.get("extensions", {}):
+                await send({"type": "http.response.pathsend", "path": str(self.path)})
+                return
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await file.aclose()
+
@@ -0,0 +1,245 @@
+"""
+Runtime Estimator
+Generation time learned from completed jobs, with prediction intervals
+
+adaptive_optimizer.py assumed a flat 15/18 s/step and optimizer.py used
+6/11/14 s/step plus overhead; the two disagreed by about 2x, and the measured
+duration of every job was thrown away. The estimator models, per resolution
+and worker type (the GPU model of the device, see worker_pool.py):
+    seconds_per_step = a + b * frames / 129
+    duration         = overhead + steps * seconds_per_step
+(a, b) are fitted by recursive least squares with a forgetting factor
+(ESTIMATOR_DECAY), so a job observed N jobs ago counts DECAY^N as much as the
+latest one and the model follows driver, kernel or hardware changes. The
+overhead (model load, encoders, VAE decode) is a decayed mean per worker type
+and warm/cold worker. Until a group has data, its prior is optimizer.py's
+step-cost table, so the first estimates match what the UI showed before.
+
+Each prediction comes with an ESTIMATOR_INTERVAL (default 90%) interval from
+the decayed residual variance and the fit's parameter uncertainty. Jobs keep
+the estimate they were queued with as queued_estimate (estimate is refined
+for the worker's GPU type once the job is placed); get_stats() reports how far
+those queue-time estimates were off and how often the interval held the
+actual duration.
+
+The model is rebuilt from the last ESTIMATOR_HISTORY completed jobs at startup.
+"""
+import math
+import os
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple
+
+from optimizer import BASE_SECONDS_PER_STEP, MODEL_LOAD_OVERHEAD, TIER_RESOLUTIONS, WARM_WORKER_OVERHEAD, QualityTier
+
+# Frame count the step costs are quoted for
+REFERENCE_FRAMES = 129
+
+RESOLUTION_TIERS = {resolution: tier for tier, resolution in TIER_RESOLUTIONS.items()}
+
+DEFAULT_WORKER_TYPE = "default"
+
+# Relative spread assumed before any job is observed
+PRIOR_SPREAD = 0.25
+
+
+class _DecayedMean:
+    """Mean and variance of a series with exponentially decaying weights"""
+
+    def __init__(self, mean: float, variance: float, decay: float):
+        self.mean = mean
+        self.variance = variance
+        self.decay = decay
+        self.weight = 1.0  # the prior counts as one observation
+
+    def update(self, value: float):
+        self.weight = self.decay * self.weight + 1
+        error = value - self.mean
+        self.mean += error / self.weight
+        self.variance += (error * error - self.variance) / self.weight
+
+
+class _StepCost:
+    """
+    seconds_per_step = a + b * (frames / REFERENCE_FRAMES), fitted by
+    recursive least squares with forgetting factor `decay`
+    """
+
+    def __init__(self, prior_seconds: float, decay: float):
+        self.decay = decay
+        self.theta = [0.0, prior_seconds]
+        # Parameter covariance in units of the residual variance; the identity
+        # weighs the prior like one observation
+        self.p = [[1.0, 0.0], [0.0, 1.0]]
+        # Decayed mean squared error, the prior counting as one observation
+        self.variance = (PRIOR_SPREAD * prior_seconds) ** 2
+        self.weight = 1.0
+        self.observations = 0
+
+    def predict(self, frames: int) -> Tuple[float, float]:
+        """(seconds per step, its variance for a new job)"""
+        x = (1.0, frames / REFERENCE_FRAMES)
+        mean = self.theta[0] + self.theta[1] * x[1]
+        spread = sum(x[i] * self.p[i][j] * x[j] for i in range(2) for j in range(2))
+        return mean, self.variance * (1 + spread)
+
+    def update(self, frames: int, seconds_per_step: float):
+        x = (1.0, frames / REFERENCE_FRAMES)
+        px = [self.p[0][0] * x[0] + self.p[0][1] * x[1], self.p[1][0] * x[0] + self.p[1][1] * x[1]]
+        denominator = self.decay + x[0] * px[0] + x[1] * px[1]
+        gain = [px[0] / denominator, px[1] / denominator]
+        error = seconds_per_step - (self.theta[0] + self.theta[1] * x[1])
+        self.theta = [self.theta[0] + gain[0] * error, self.theta[1] + gain[1] * error]
+        self.p = [[(self.p[i][j] - gain[i] * px[j]) / self.decay for j in range(2)] for i in range(2)]
+        # Directions no job excites (e.g. every job at 129 frames) would grow
+        # without bound under forgetting; keep the covariance within the prior's
+        trace = self.p[0][0] + self.p[1][1]
+        if trace > 2.0:
+            self.p = [[value * 2.0 / trace for value in row] for row in self.p]
+        self.weight = self.decay * self.weight + 1
+        self.variance += (error * error - self.variance) / self.weight
+        self.observations += 1
+
+
+class RuntimeEstimator:
+    def __init__(self):
+        self.decay = float(os.getenv("ESTIMATOR_DECAY", "0.95"))
+        self.history = int(os.getenv("ESTIMATOR_HISTORY", "500"))
+        self.interval = float(os.getenv("ESTIMATOR_INTERVAL", "0.9"))
+        self._z = NormalDist().inv_cdf(0.5 + self.interval / 2)
+        self._step_costs: Dict[Tuple[str, str], _StepCost] = {}
+        self._overheads: Dict[Tuple[str, bool], _DecayedMean] = {}
+
+        # How the estimates jobs were queued with compared with their durations
+        self.checked = 0
+        self.within_interval = 0
+        self.absolute_error = 0.0
+        self.relative_error = 0.0
+
+    def _step_cost(self, resolution: str, worker_type: str, create: bool = True) -> _StepCost:
+        key = (resolution, worker_type)
+        model = self._step_costs.get(key)
+        if model is None:
+            tier = RESOLUTION_TIERS.get(resolution, QualityTier.STANDARD)
+            model = _StepCost(BASE_SECONDS_PER_STEP[tier], self.decay)
+            if create:
+                self._step_costs[key] = model
+        return model
+
+    def _overhead(self, worker_type: str, warm: bool, create: bool = True) -> _DecayedMean:
+        key = (worker_type, warm)
+        model = self._overheads.get(key)
+        if model is None:
+            prior = WARM_WORKER_OVERHEAD if warm else MODEL_LOAD_OVERHEAD
+            model = _DecayedMean(prior, (PRIOR_SPREAD * prior) ** 2 + 1, self.decay)
+            if create:
+                self._overheads[key] = model
+        return model
+
+    def _worker_type(self, resolution: str, worker_type: Optional[str]) -> str:
+        """The given type, or the one with the most history at this resolution"""
+        if worker_type:
+            return worker_type
+        known = [(model.observations, key[1]) for key, model in self._step_costs.items() if key[0] == resolution]
+        return max(known)[1] if known else DEFAULT_WORKER_TYPE
+
+    def predict(self, resolution: str, frames: int, steps: int, worker_type: Optional[str] = None,
+                warm: bool = True) -> Dict[str, Any]:
+        """
+        Expected generation time in seconds, with the interval bounds
+
+        Args:
+            resolution: 540p/720p/preview
+            frames: video_length
+            steps: denoising steps
+            worker_type: GPU model; None for a job not placed yet
+            warm: whether a warm worker (model resident) runs it
+        """
+        worker_type = self._worker_type(resolution, worker_type)
+        # Groups without history answer with their prior and are not stored
+        step_cost = self._step_cost(resolution, worker_type, create=False)
+        overhead = self._overhead(worker_type, warm, create=False)
+        per_step, per_step_variance = step_cost.predict(frames)
+        seconds = overhead.mean + steps * per_step
+        spread = self._z * math.sqrt(steps * steps * per_step_variance + overhead.variance)
+        return {
+            "seconds": round(seconds, 1),
+            "low": round(max(seconds - spread, 0.0), 1),
+            "high": round(seconds + spread, 1),
+            "seconds_per_step": round(per_step, 2),
+            "worker_type": worker_type,
+            "observations": step_cost.observations,
+        }
+
+    def observe(self, job: Dict[str, Any], live: bool = True) -> bool:
+        """
+        Learn from a completed job; False if it says nothing about run time
+        (e.g. it reused another job's video)
+        """
+        params = job.get("params") or {}
+        optimization = job.get("optimization") or {}
+        steps = job.get("total_steps") or optimization.get("final_steps")
+        duration = job.get("duration")
+        if job.get("status") != "completed" or optimization.get("deduplicated_from") or not steps or not duration:
+            return False
+
+        # Scored against the estimate shown while the job waited, not the placement re-estimate
+        estimate = job.get("queued_estimate") or job.get("estimate")
+        if live and estimate:
+            self.checked += 1
+            self.within_interval += estimate["low"] <= duration <= estimate["high"]
+            self.absolute_error += abs(duration - estimate["seconds"])
+            self.relative_error += abs(duration - estimate["seconds"]) / duration
+
+        resolution = params.get("video_size", "540p")
+        frames = params.get("video_length", REFERENCE_FRAMES)
+        worker_type = job.get("worker_type") or DEFAULT_WORKER_TYPE
+        overhead = self._overhead(worker_type, job.get("warm_worker", True))
+        seconds_per_step = job.get("seconds_per_step")
+        # Resumed and refined runs denoise only part of their steps
+        partial = params.get("upscale_from") or (optimization.get("latent_cache") or {}).get("resumed_from_step")
+        if seconds_per_step is None:
+            if partial:
+                return False
+            seconds_per_step = max(duration - overhead.mean, 0.0) / steps
+        elif not partial:
+            overhead.update(max(duration - steps * seconds_per_step, 0.0))
+        self._step_cost(resolution, worker_type).update(frames, seconds_per_step)
+        return True
+
+    def load(self, store):
+        """Rebuild the model from the most recent completed jobs (oldest first)"""
+        recent: List[Dict[str, Any]] = []
+        cursor = None
+        while len(recent) < self.history:
+            page, cursor = store.list(status="completed", limit=min(500, self.history - len(recent)), cursor=cursor)
+            recent.extend(page)
+            if not cursor or not page:
+                break
+        for job in reversed(recent):
+            self.observe(job, live=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "decay": self.decay,
+            "interval": self.interval,
+            "models": {
+                f"{resolution}/{worker_type}": {
+                    "observations": model.observations,
+                    "seconds_per_step_at_129_frames": round(model.predict(REFERENCE_FRAMES)[0], 2),
+                    "residual_sd": round(math.sqrt(model.variance), 3),
+                }
+                for (resolution, worker_type), model in self._step_costs.items()
+            },
+            "overheads": {
+                f"{worker_type}/{'warm' if warm else 'cold'}": round(overhead.mean, 1)
+                for (worker_type, warm), overhead in self._overheads.items()
+            },
+            "checked_jobs": self.checked,
+            "mean_absolute_error_s": round(self.absolute_error / self.checked, 1) if self.checked else None,
+            "mean_relative_error": round(self.relative_error / self.checked, 3) if self.checked else None,
+            "interval_coverage": round(self.within_interval / self.checked, 3) if self.checked else None,
+        }
+
+
+# Global runtime estimator instance
+runtime_estimator = RuntimeEstimator()
@@ -0,0 +1,232 @@
+"""
+Job Scheduler
+Bounded, prioritized queue that limits concurrent generations per GPU
+
+Replaces fire-and-forget BackgroundTasks so simultaneous submissions wait
+their turn instead of starting concurrent GPU processes that OOM each other.
+- Priority by quality tier: preview runs before standard, standard before premium
+- FIFO within a tier
+- Admission control: submissions beyond the queue-depth cap are rejected
+- Placement through the worker pool: a job starts only when a device with
+  enough free VRAM is available, and a waiting 720p job doesn't block
+  smaller jobs that fit elsewhere
+- Queue ETAs: queue_etas() replays the queue in priority order over the job
+  slots, using each job's estimated run time (see runtime_estimator.py) and
+  the time left on running jobs
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from worker_pool import Placement, WorkerPool, worker_pool
+
+Runner = Callable[[Placement], Awaitable[None]]
+
+# Lower value runs first
+TIER_PRIORITY = {
+    "preview": 0,
+    "standard": 1,
+    "auto": 1,
+    "premium": 2,
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the queue is at its depth cap"""
+
+
+class JobScheduler:
+    def __init__(self, pool: WorkerPool = worker_pool):
+        self.pool = pool
+        self.max_queue_depth = int(os.getenv("MAX_QUEUE_DEPTH", "50"))
+
+        # Heap of (priority, sequence, job_id); runner and size kept alongside
+        self._heap: List[Tuple[int, int, str]] = []
+        self._runners: Dict[str, Tuple[Runner, str]] = {}
+        self._sequence = itertools.count()
+        self._active: Dict[str, asyncio.Task] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Expected run seconds, queued and running; when running jobs started
+        self._estimates: Dict[str, float] = {}
+        self._started: Dict[str, float] = {}
+        # Scheduler entries that run several jobs (micro-batches) -> their job IDs
+        self._members: Dict[str, List[str]] = {}
+        # Called after the queue changed (submit, cancel, start, finish); set by the app
+        self.on_change: Optional[Callable[[], None]] = None
+
+    @property
+    def concurrency(self) -> int:
+        return self.pool.capacity
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._runners)
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    async def start(self):
+        """Start the dispatcher; loads the pool config if nothing is registered"""
+        if not self.pool.devices:
+            self.pool.load_config()
+        self._changed = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        print(f"🗓️ Scheduler started: concurrency {self.concurrency}, queue cap {self.max_queue_depth}")
+
+    async def stop(self):
+        tasks = [self._dispatcher] if self._dispatcher else []
+        tasks.extend(self._active.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+        self._active = {}
+        self._started = {}
+
+    async def submit(self, job_id: str, quality_tier: str, run: Runner,
+                     video_size: str = "540p", estimated_seconds: float = 0.0,
+                     members: Optional[List[str]] = None) -> int:
+        """
+        Enqueue a job
+
+        Args:
+            job_id: Job identifier
+            quality_tier: preview/standard/premium/auto (sets priority)
+            run: Coroutine factory called with the job's Placement
+            video_size: Resolution, used for VRAM-aware placement
+            estimated_seconds: Expected run time, for queue ETAs
+            members: Job IDs the entry runs, if not just job_id (micro-batches)
+
+        Returns:
+            Queue position (0 = next to run)
+
+        Raises:
+            QueueFullError: queue is at max_queue_depth
+            ValueError: no device in the pool can ever fit the job
+        """
+        if self.queue_depth >= self.max_queue_depth:
+            raise QueueFullError(f"Queue is full ({self.max_queue_depth} jobs waiting)")
+        if not self.pool.can_ever_place(video_size):
+            raise ValueError(f"No worker has enough GPU memory for {video_size}")
+
+        priority = TIER_PRIORITY.get(quality_tier, TIER_PRIORITY["standard"])
+        heapq.heappush(self._heap, (priority, next(self._sequence), job_id))
+        self._runners[job_id] = (run, video_size)
+        self._estimates[job_id] = estimated_seconds
+        if members:
+            self._members[job_id] = members
+        self._changed.set()
+
+        return self.position(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Remove a job that has not started yet; returns True if it was queued"""
+        # Heap entry is dropped lazily when dispatched
+        if self._runners.pop(job_id, None) is None:
+            return False
+        self._estimates.pop(job_id, None)
+        self._members.pop(job_id, None)
+        if self._changed:
+            self._changed.set()
+        return True
+
+    def members(self, job_id: str) -> List[str]:
+        return self._members.get(job_id, [job_id])
+
+    def queue_etas(self, remaining: Optional[Callable[[str], Optional[float]]] = None
+                   ) -> Dict[str, Tuple[int, float]]:
+        """
+        (position, seconds until it starts) for every queued entry
+
+        Queued entries take the earliest free job slot in priority order;
+        `remaining` may give a running entry's measured time left (else its
+        estimate minus the time it has run). VRAM fit is not modeled, so a
+        720p job behind smaller ones may start later than this says.
+        """
+        now = time.monotonic()
+        slots = []
+        for job_id, started in self._started.items():
+            left = remaining(job_id) if remaining else None
+            if left is None:
+                left = self._estimates.get(job_id, 0.0) - (now - started)
+            slots.append(max(left, 0.0))
+        slots.sort()
+        slots = slots[:self.concurrency] + [0.0] * max(self.concurrency - len(slots), 0) or [0.0]
+        heapq.heapify(slots)
+
+        etas: Dict[str, Tuple[int, float]] = {}
+        for _, _, job_id in sorted(self._heap):
+            if job_id not in self._runners or job_id in etas:
+                continue
+            start = heapq.heappop(slots)
+            etas[job_id] = (len(etas), start)
+            heapq.heappush(slots, start + self._estimates.get(job_id, 0.0))
+        return etas
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Number of queued jobs ahead of this one"""
+        if job_id not in self._runners:
+            return None
+        entries = sorted(entry for entry in self._heap if entry[2] in self._runners)
+        for index, entry in enumerate(entries):
+            if entry[2] == job_id:
+                return index
+        return None
+
+    def _start_placeable(self):
+        """Start every queued job, in priority order, that fits on a device now"""
+        waiting = []
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            job_id = entry[2]
+            if job_id not in self._runners:
+                continue  # cancelled
+
+            run, video_size = self._runners[job_id]
+            placement = self.pool.try_place(job_id, video_size)
+            if placement is None:
+                waiting.append(entry)
+                continue
+
+            del self._runners[job_id]
+            self._started[job_id] = time.monotonic()
+            self._active[job_id] = asyncio.create_task(self._run(job_id, run, placement))
+
+        for entry in waiting:
+            heapq.heappush(self._heap, entry)
+
+    async def _run(self, job_id: str, run: Runner, placement: Placement):
+        succeeded = False
+        try:
+            await run(placement)
+            succeeded = True
+        except Exception as e:
+            # run_generation records its own failures; this only guards the scheduler
+            print(f"❌ Scheduler job {job_id[:8]} raised: {e}")
+        finally:
+            self.pool.release(job_id, succeeded)
+            self._active.pop(job_id, None)
+            self._started.pop(job_id, None)
+            self._estimates.pop(job_id, None)
+            self._members.pop(job_id, None)
+            self._changed.set()
+
+    async def _dispatch(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            self._start_placeable()
+            if self.on_change:
+                try:
+                    self.on_change()
+                except Exception as e:
+                    print(f"⚠️ Queue change hook failed: {e}")
+
+
+# Global scheduler instance
+scheduler = JobScheduler()
@@ -0,0 +1,105 @@
+"""
+Single-flight
+Identical generation requests share one GPU run
+
+request_key() hashes every VideoRequest field, with the prompt in canonical
+form (the embedding cache already serves canonical-equal prompts the same
+tensors). A request with a seed is deterministic:
+- while a job with its key is queued or running, later submissions attach to
+  it as followers: they get their own job IDs and records, mirror the
+  leader's progress and share its video when it completes
+- once a job with its key completed, a repeat returns the stored video
+  without queuing (the key is an indexed job store column)
+An unseeded request asks for a new random video, so it only attaches to an
+identical unseeded request submitted less than DEDUP_WINDOW_SECONDS earlier
+(a double-click) and never reuses a finished one.
+
+This module only tracks who follows whom; main.py mirrors the records.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from prompt_index import canonicalize
+
+# Copied from the leader's record onto its followers on every update
+MIRRORED_FIELDS = (
+    "status", "progress", "queue_position", "worker", "started_at", "step",
+    "total_steps", "seconds_per_step", "eta_seconds", "starts_in_seconds", "error",
+    "stream_path", "stream_segments",
+)
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    """Canonical hash of a generation request (VideoRequest.dict())"""
+    key_data = {**params, "prompt": canonicalize(params["prompt"])}
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_DEDUP", "true").lower() == "true"
+        self.window_seconds = float(os.getenv("DEDUP_WINDOW_SECONDS", "3"))
+        self._leaders: Dict[str, Tuple[str, float]] = {}  # key -> (leader job, submitted at)
+        self._keys: Dict[str, str] = {}                   # leader job -> key
+        self._followers: Dict[str, List[str]] = {}        # leader job -> follower jobs
+        self._leader_of: Dict[str, str] = {}              # follower job -> leader job
+
+    def leader(self, key: str, seeded: bool) -> Optional[str]:
+        """In-flight job a new request with this key should attach to"""
+        entry = self._leaders.get(key)
+        if entry is None:
+            return None
+        job_id, submitted = entry
+        if not seeded and time.monotonic() - submitted > self.window_seconds:
+            return None
+        return job_id
+
+    def lead(self, key: str, job_id: str):
+        self._leaders[key] = (job_id, time.monotonic())
+        self._keys[job_id] = key
+        self._followers[job_id] = []
+
+    def attach(self, leader_id: str, job_id: str):
+        self._followers[leader_id].append(job_id)
+        self._leader_of[job_id] = leader_id
+
+    def followers(self, leader_id: str) -> List[str]:
+        return self._followers.get(leader_id, [])
+
+    def finish(self, leader_id: str) -> List[str]:
+        """Forget a leader that reached a terminal status; returns its followers"""
+        key = self._keys.pop(leader_id, None)
+        if key is not None and self._leaders.get(key, (None,))[0] == leader_id:
+            del self._leaders[key]
+        followers = self._followers.pop(leader_id, [])
+        for job_id in followers:
+            self._leader_of.pop(job_id, None)
+        return followers
+
+    def drop(self, job_id: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Forget a deleted job
+
+        Returns (key, followers) when it was a leader, so the caller can hand
+        the run to a follower; a follower is just detached.
+        """
+        leader_id = self._leader_of.pop(job_id, None)
+        if leader_id is not None:
+            self._followers[leader_id].remove(job_id)
+            return None, []
+        key = self._keys.get(job_id)
+        return key, self.finish(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight_keys": len(self._leaders),
+            "attached_jobs": len(self._leader_of),
+        }
+
+
+# Global single-flight instance
+single_flight = SingleFlight()
@@ -0,0 +1,187 @@
+"""
+Stats Aggregator
+Incrementally maintained job statistics for /api/stats and /api/health
+
+Counters, running totals, duration histograms and cache hit counts are updated
+on each job state transition (reported by the job store), so the endpoints read
+precomputed numbers instead of scanning every job per request.
+
+Rolling windows (5 min / 1 h / 24 h) are rings of time buckets with running
+sums: expired buckets are subtracted as time moves on, so adding an event and
+reading a window are both O(1) amortized.
+
+The Redis INFO round trip for cache stats is cached for STATS_CACHE_TTL
+seconds and shared by every dashboard tab.
+"""
+import os
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+# Upper bounds (seconds) of the generation duration histogram buckets
+DURATION_BUCKETS = [30, 60, 120, 180, 300, 600, 900, 1200, 1800]
+
+# name -> (span seconds, bucket seconds)
+WINDOWS = {
+    "5m": (300, 10),
+    "1h": (3600, 60),
+    "24h": (86400, 900),
+}
+
+
+def histogram_bucket(duration: float) -> str:
+    index = bisect_left(DURATION_BUCKETS, duration)
+    return f"le_{DURATION_BUCKETS[index]}" if index < len(DURATION_BUCKETS) else "le_inf"
+
+
+def empty_histogram() -> Dict[str, int]:
+    return {**{f"le_{bound}": 0 for bound in DURATION_BUCKETS}, "le_inf": 0}
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+class RollingWindow:
+    """Sums of event values over the last `span` seconds, in `bucket`-second steps"""
+
+    def __init__(self, span: float, bucket: float):
+        self.span = span
+        self.bucket = bucket
+        self._buckets: Deque[List[Any]] = deque()  # [bucket_start, {key: value}]
+        self.totals: Dict[str, float] = {}
+
+    def add(self, timestamp: float, values: Dict[str, float]):
+        start = timestamp - timestamp % self.bucket
+        if self._buckets and start <= self._buckets[-1][0]:
+            # Same bucket, or a late event: fold into the newest bucket
+            sums = self._buckets[-1][1]
+        else:
+            sums = {}
+            self._buckets.append([start, sums])
+        for key, value in values.items():
+            sums[key] = sums.get(key, 0) + value
+            self.totals[key] = self.totals.get(key, 0) + value
+        self.expire(timestamp)
+
+    def expire(self, now: float):
+        while self._buckets and self._buckets[0][0] <= now - self.span:
+            _, sums = self._buckets.popleft()
+            for key, value in sums.items():
+                self.totals[key] -= value
+
+    def get(self, key: str) -> float:
+        return self.totals.get(key, 0)
+
+
+class StatsAggregator:
+    def __init__(self):
+        self.cache_stats_ttl = float(os.getenv("STATS_CACHE_TTL", "10"))
+        self.counts: Dict[str, int] = {}
+        self.completed_duration = 0.0
+        self.completed_steps = 0.0
+        self.cache_hits = 0
+        self.histogram = empty_histogram()
+        self.windows = {name: RollingWindow(span, bucket) for name, (span, bucket) in WINDOWS.items()}
+        self._cache_stats: Optional[Dict[str, Any]] = None
+        self._cache_stats_at = 0.0
+
+    def load(self, store):
+        """Seed counters from the job store once at startup"""
+        self.counts = dict(store.counts())
+        summary = store.completed_summary()
+        self.completed_duration = summary["total_duration"]
+        self.completed_steps = summary["total_steps"]
+        self.cache_hits = int(summary["cache_hits"])
+        self.histogram = empty_histogram()
+        for duration in store.completed_durations():
+            self.histogram[histogram_bucket(duration)] += 1
+
+        # Rebuild the rolling windows from the last 24 hours of finished jobs
+        horizon = time.time() - max(span for span, _ in WINDOWS.values())
+        events, cursor = [], None
+        while True:
+            page, cursor = store.list(limit=500, cursor=cursor)
+            for job in page:
+                if job["status"] in ("completed", "failed"):
+                    finished = _timestamp(job.get("completed_at") or job["created_at"])
+                    if finished >= horizon:
+                        events.append((finished, job))
+            if not cursor or not page or _timestamp(page[-1]["created_at"]) < horizon:
+                break
+        for finished, job in sorted(events, key=lambda event: event[0]):
+            self._add_to_windows(job, finished)
+
+    def record_transition(self, previous: Optional[str], job: Dict[str, Any]):
+        """Apply a job's status change (previous is None for a new job)"""
+        if previous:
+            self.counts[previous] = self.counts.get(previous, 0) - 1
+        self.counts[job["status"]] = self.counts.get(job["status"], 0) + 1
+
+        if job["status"] == "completed":
+            self._apply_completed(job, 1)
+        if job["status"] in ("completed", "failed"):
+            self._add_to_windows(job, time.time())
+
+    def record_delete(self, job: Dict[str, Any]):
+        """Remove a deleted job from the lifetime counters; windows keep the event"""
+        self.counts[job["status"]] = self.counts.get(job["status"], 0) - 1
+        if job["status"] == "completed":
+            self._apply_completed(job, -1)
+
+    def _apply_completed(self, job: Dict[str, Any], sign: int):
+        optimization = job.get("optimization") or {}
+        duration = job.get("duration") or 0
+        self.completed_duration += sign * duration
+        self.completed_steps += sign * optimization.get("final_steps", 30)
+        self.cache_hits += sign * bool(optimization.get("cache_hit"))
+        self.histogram[histogram_bucket(duration)] += sign
+
+    def _add_to_windows(self, job: Dict[str, Any], timestamp: float):
+        values = {job["status"]: 1}
+        if job["status"] == "completed":
+            duration = job.get("duration") or 0
+            values["duration"] = duration
+            values["cache_hits"] = int(bool((job.get("optimization") or {}).get("cache_hit")))
+            values[histogram_bucket(duration)] = 1
+        for window in self.windows.values():
+            window.add(timestamp, values)
+
+    def window_stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        result = {}
+        for name, window in self.windows.items():
+            window.expire(now)
+            completed = int(window.get("completed"))
+            result[name] = {
+                "completed": completed,
+                "failed": int(window.get("failed")),
+                "throughput_per_hour": round(completed * 3600 / window.span, 1),
+                "avg_duration": round(window.get("duration") / completed, 1) if completed else 0,
+                "cache_hits": int(window.get("cache_hits")),
+                "cache_hit_rate": round(window.get("cache_hits") / completed * 100, 1) if completed else 0,
+                "duration_histogram": {key: int(window.get(key)) for key in empty_histogram()},
+            }
+        return result
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def completed(self) -> int:
+        return self.counts.get("completed", 0)
+
+    async def cache_stats(self, fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Cache backend stats, refreshed at most every cache_stats_ttl seconds"""
+        now = time.monotonic()
+        if self._cache_stats is None or now - self._cache_stats_at >= self.cache_stats_ttl:
+            self._cache_stats = await fetch()
+            self._cache_stats_at = now
+        return self._cache_stats
+
+
+# Global stats aggregator instance
+stats_aggregator = StatsAggregator()
@@ -0,0 +1,78 @@
+"""
+Step Policy
+Denoising steps per resolution and prompt complexity, measured offline
+
+The step counts in AdaptiveOptimizer.analyze_prompt were picked by hand.
+calibrate_steps.py sweeps a prompt suite over several step counts, scores the
+frames against the highest-step reference and writes, per resolution and
+complexity level, the fewest steps that still pass. The levels are
+AdaptiveOptimizer's, so only it looks its step count up here (optimizer.py
+classifies prompts differently and keeps its own table). It falls back to the
+hand-picked steps for anything the policy does not cover (or when there is no
+policy file at STEP_POLICY_PATH).
+
+File format (written by calibrate_steps.py):
+    {"version": 1, "generator": "worker", "created_at": "...",
+     "policy": {"540p": {"simple": 25, "moderate": 30, ...}, ...},
+     "thresholds": {...}, "measurements": {...}}
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+STEP_POLICY_VERSION = 1
+
+
+class StepPolicy:
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.getenv("STEP_POLICY_PATH", "/opt/hunyuan-video/step_policy.json"))
+        self.policy: Dict[str, Dict[str, int]] = {}
+        self.info: Dict[str, Any] = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def load(self) -> bool:
+        """Read the policy file; False (and hand-picked steps) if missing or unreadable"""
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Step policy {self.path} unreadable: {e}")
+            return False
+        if data.get("version") != STEP_POLICY_VERSION:
+            print(f"⚠️ Step policy {self.path} has version {data.get('version')}, expected {STEP_POLICY_VERSION}")
+            return False
+
+        self.policy = {
+            resolution: {level: int(steps) for level, steps in levels.items()}
+            for resolution, levels in data.get("policy", {}).items()
+        }
+        self.info = {key: data.get(key) for key in ("generator", "created_at", "prompts", "sweep", "thresholds")}
+        if data.get("generator") == "stub":
+            print("⚠️ Step policy was calibrated with the stub generator; steps are not from real output")
+        print(f"🎚️ Loaded step policy for {', '.join(sorted(self.policy)) or 'no resolutions'}")
+        return True
+
+    def steps(self, resolution: str, level: str) -> Optional[int]:
+        """Calibrated steps, or None to use the hand-picked value"""
+        self.lookups += 1
+        steps = self.policy.get(resolution, {}).get(level)
+        if steps is not None:
+            self.hits += 1
+        return steps
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": bool(self.policy),
+            "path": str(self.path),
+            "policy": self.policy,
+            **self.info,
+            "lookups": self.lookups,
+            "hits": self.hits,
+        }
+
+
+# Global step policy instance
+step_policy = StepPolicy()
@@ -0,0 +1,234 @@
+"""
+Live Video Streaming
+Play a video while the worker is still encoding it
+
+Clients used to wait for the generation to exit, for the API to glob the result
+directory and only then fetch /api/video/{job_id}. The warm worker now pipes
+decoded frames into ffmpeg, which writes a fragmented MP4 (an init segment,
+then one self-contained moof+mdat fragment per keyframe interval) straight to
+the job's result directory:
+- FragmentedMp4Writer (worker side) feeds frames to ffmpeg one at a time and
+  reports every fragment that lands on disk
+- FragmentIndex parses the top-level boxes of the growing file incrementally,
+  so each look only reads the boxes appended since the last one
+- hls_playlist() turns the index into an HLS EVENT playlist whose segments
+  are byte ranges of that same file, ending with #EXT-X-ENDLIST once the job
+  has finished
+
+Nothing is copied when the job completes: the file the playlist points into
+is the job's video (finalize_job stores it in the result store in place).
+"""
+import math
+import os
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Frame rate of generated videos (see postprocess.VIDEO_FPS)
+STREAM_FPS = 24
+
+PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+
+
+class Fragment(NamedTuple):
+    offset: int
+    length: int  # moof + mdat
+    frames: int
+
+
+def _box_header(f, offset: int, size: int) -> Optional[Tuple[bytes, int, int]]:
+    """(type, header size, box size) of the box at offset, or None if not fully written yet"""
+    if offset + 8 > size:
+        return None
+    f.seek(offset)
+    header = f.read(16 if offset + 16 <= size else 8)
+    box_size = int.from_bytes(header[:4], "big")
+    box_type = header[4:8]
+    if box_size == 1:
+        if len(header) < 16:
+            return None
+        return box_type, 16, int.from_bytes(header[8:16], "big")
+    if box_size < 8:
+        # 0 means "to the end of the file": only known once the file is closed
+        return None
+    return box_type, 8, box_size
+
+
+def _children(data: bytes):
+    """(type, payload) of the boxes packed in data"""
+    offset = 0
+    while offset + 8 <= len(data):
+        size = int.from_bytes(data[offset:offset + 4], "big")
+        if size < 8:
+            return
+        yield data[offset + 4:offset + 8], data[offset + 8:offset + size]
+        offset += size
+
+
+def _sample_count(moof: bytes) -> int:
+    """Samples (frames) in a moof payload: the sum of its trun sample counts"""
+    count = 0
+    for box_type, traf in _children(moof):
+        if box_type != b"traf":
+            continue
+        for child_type, trun in _children(traf):
+            if child_type == b"trun" and len(trun) >= 8:
+                count += int.from_bytes(trun[4:8], "big")
+    return count
+
+
+class FragmentIndex:
+    """Init segment and complete fragments of a (possibly still growing) fragmented MP4"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.init: Optional[Tuple[int, int]] = None  # (offset, length) of ftyp + moov
+        self.fragments: List[Fragment] = []
+        self._offset = 0
+        self._moof: Optional[Tuple[int, int]] = None  # (offset, frames) waiting for its mdat
+        self._lock = threading.Lock()
+
+    def update(self) -> int:
+        """Parse the boxes written since the last call; returns the number of complete fragments"""
+        with self._lock:
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                return len(self.fragments)
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                while True:
+                    header = _box_header(f, self._offset, size)
+                    if header is None or self._offset + header[2] > size:
+                        break
+                    box_type, header_size, box_size = header
+                    if box_type == b"moov":
+                        self.init = (0, self._offset + box_size)
+                    elif box_type == b"moof":
+                        f.seek(self._offset + header_size)
+                        self._moof = (self._offset, _sample_count(f.read(box_size - header_size)))
+                    elif box_type == b"mdat" and self._moof is not None:
+                        start, frames = self._moof
+                        self.fragments.append(Fragment(start, self._offset + box_size - start, frames))
+                        self._moof = None
+                    self._offset += box_size
+            return len(self.fragments)
+
+
+def hls_playlist(index: FragmentIndex, uri: str, finished: bool, fps: float = STREAM_FPS) -> Optional[str]:
+    """HLS playlist of the index's fragments as byte ranges of `uri`; None before the first fragment"""
+    if index.init is None or not index.fragments:
+        return None
+    durations = [fragment.frames / fps for fragment in index.fragments]
+    init_offset, init_length = index.init
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{max(1, math.ceil(max(durations)))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f'#EXT-X-MAP:URI="{uri}",BYTERANGE="{init_length}@{init_offset}"',
+    ]
+    for fragment, duration in zip(index.fragments, durations):
+        lines += [f"#EXTINF:{duration:.3f},", f"#EXT-X-BYTERANGE:{fragment.length}@{fragment.offset}", uri]
+    if finished:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+class LiveStreams:
+    """Fragment indexes of the videos clients are watching, parsed incrementally per job"""
+
+    def __init__(self):
+        self._indexes: Dict[str, FragmentIndex] = {}
+        self._lock = threading.Lock()
+
+    def playlist(self, job_id: str, path: Path, finished: bool, uri: str = "video.mp4") -> Optional[str]:
+        """Current playlist of a job's video (blocking; run it in a thread)"""
+        with self._lock:
+            index = self._indexes.get(job_id)
+            if index is None or index.path != Path(path):
+                index = self._indexes[job_id] = FragmentIndex(path)
+        index.update()
+        return hls_playlist(index, uri, finished)
+
+    def discard(self, job_id: str):
+        with self._lock:
+            self._indexes.pop(job_id, None)
+
+
+class FragmentedMp4Writer:
+    """
+    Encode raw RGB frames to a fragmented MP4 with ffmpeg as they are produced
+
+    A fragment is cut at every keyframe, and keyframes are forced every
+    fragment_frames frames. on_fragment(count) is called whenever more
+    fragments are complete on disk.
+    """
+
+    def __init__(self, path: Path, width: int, height: int, fps: int = STREAM_FPS,
+                 fragment_frames: int = STREAM_FPS, command: Sequence[str] = ("ffmpeg",),
+                 on_fragment: Optional[Callable[[int], None]] = None):
+        self.path = Path(path)
+        self.index = FragmentIndex(self.path)
+        self.on_fragment = on_fragment
+        self._reported = 0
+        # A file, not a pipe: nothing reads stderr until close(), and ffmpeg
+        # would block (and with it every write()) once a pipe buffer filled up
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [*command, "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+             "-c:v", "libx264", "-pix_fmt", "yuv420p",
+             "-g", str(fragment_frames), "-keyint_min", str(fragment_frames), "-sc_threshold", "0",
+             "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-flush_packets", "1",
+             "-f", "mp4", str(self.path)],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr,
+        )
+
+    def _report(self):
+        count = self.index.update()
+        if count > self._reported:
+            self._reported = count
+            if self.on_fragment:
+                self.on_fragment(count)
+
+    def write(self, frame: bytes):
+        """Append one rgb24 frame"""
+        try:
+            self.process.stdin.write(frame)
+        except BrokenPipeError:
+            self.close()
+        self._report()
+
+    def close(self):
+        """Finish the file; raises (and removes the partial file) if ffmpeg failed"""
+        if not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = self.process.wait()
+        error = ""
+        if not self._stderr.closed:
+            self._stderr.seek(0)
+            error = self._stderr.read().decode(errors="replace")
+            self._stderr.close()
+        if returncode != 0:
+            self.path.unlink(missing_ok=True)
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {error.strip()[-500:]}")
+        self._report()
+
+    def abort(self):
+        """Stop encoding and remove the partial file"""
+        self.process.kill()
+        self.process.wait()
+        self._stderr.close()
+        self.path.unlink(missing_ok=True)
+
+
+# Global live stream registry
+live_streams = LiveStreams()
@@ -0,0 +1,905 @@
+"""
+Warm Model Worker
+Long-lived generation process that keeps HunyuanVideo loaded between jobs.
+
+Replaces the per-job `docker exec ... python sample_video.py` with a worker that
+loads the model once and accepts jobs over a local socket. Each job then only
+pays for the actual denoising instead of interpreter startup, imports and a
+full model load.
+
+Protocol (newline-delimited JSON, one request per connection):
+    -> {"type": "ping"}
+    <- {"type": "pong", "backend": "hunyuan", "load_time": 94.2, "last_success_at": 1718000000.0,
+        "gpu": {"free_gb": 21.3, "total_gb": 79.6, ...}, ...}
+
+    -> {"type": "generate", "job_id": "...", "params": {...}}
+    <- {"type": "started", "job_id": "..."}
+    <- {"type": "step", "step": 1, "total": 30}   (one per denoising step)
+    <- {"type": "segment", "video_path": "...", "segments": 1}   (one per fragment encoded, see streaming.py)
+    <- {"type": "done", "video_path": "...", "timings": {...}, "embedding_cache": {"hit": true, ...},
+        "latent_cache": {"resumed_from_step": 40, ...}}
+       or {"type": "error", "error": "..."}
+
+    params may include "init_from": {"height": 544, "width": 960, "strength": 0.6}
+    to start from the final latents of an earlier run of the same prompt and
+    seed at that resolution (see latent_cache.py).
+
+    -> {"type": "generate_batch", "job_id": "...", "items": [{...}, ...]}
+    <- {"type": "step", "item": 0, "step": 1, "total": 30}
+    <- {"type": "segment", "item": 0, "video_path": "...", "segments": 1}
+    <- {"type": "item_done", "item": 0, "video_path": "...", ...}
+       or {"type": "item_error", "item": 0, "error": "..."}
+    <- {"type": "done", "items": 2, "completed": 2}
+
+    -> {"type": "cancel", "job_id": "..."}
+    <- {"type": "cancelled", "job_id": "...", "running": true}
+    The running job stops at its next step and answers its own request with
+    {"type": "error", "error": "Cancelled"}.
+
+Run inside the HunyuanVideo container:
+    python worker.py --backend hunyuan --model-base /workspace/repo
+Or locally without a GPU:
+    python worker.py --backend stub --socket /tmp/hunyuan-worker.sock
+"""
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import random
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from cache import GenerationCache
+from latent_cache import LatentCache
+from prompt_index import PromptIndex, canonicalize
+from streaming import STREAM_FPS, FragmentedMp4Writer
+
+DEFAULT_WORKER_ADDRESS = "/opt/hunyuan-video/run/worker.sock"
+DEFAULT_CACHE_DIR = "/opt/hunyuan-video/cache"
+
+# Bump when the layout of cached encoder outputs changes
+EMBEDDING_CACHE_VERSION = 1
+
+# sampler.args fields that determine each text encoder's output
+ENCODER_VERSION_FIELDS = {
+    "text_encoder": ("text_encoder", "text_encoder_precision", "tokenizer", "text_len",
+                     "prompt_template_video", "hidden_state_skip_layer", "apply_final_norm"),
+    "text_encoder_2": ("text_encoder_2", "text_encoder_precision_2", "tokenizer_2", "text_len_2"),
+}
+
+# Callback invoked by a backend after every denoising step: (step, total)
+StepCallback = Callable[[int, int], None]
+
+# Callback invoked while the video is encoded: (video_path, complete fragments)
+StreamCallback = Callable[[str, int], None]
+
+
+def parse_address(address: str):
+    """Split a worker address into ("unix", path) or ("tcp", (host, port))"""
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    if address.startswith("unix://"):
+        address = address[len("unix://"):]
+    return "unix", address
+
+
+def _box(box_type: bytes, payload: bytes = b"") -> bytes:
+    return (len(payload) + 8).to_bytes(4, "big") + box_type + payload
+
+
+class StubBackend:
+    """
+    GPU-free backend for local development and testing.
+    Simulates model load and per-step latency and writes a placeholder file
+    laid out like a fragmented MP4 (boxes only, not playable video).
+    """
+    name = "stub"
+
+    def __init__(self, step_seconds: float = 0.05, load_seconds: float = 0.0,
+                 encode_seconds: float = 0.0, fragment_seconds: float = 1.0):
+        self.step_seconds = step_seconds
+        self.load_seconds = load_seconds
+        self.encode_seconds = encode_seconds
+        self.fragment_frames = max(1, round(fragment_seconds * STREAM_FPS))
+        self.loaded = False
+        self._encoded: set = set()
+
+    def load(self):
+        time.sleep(self.load_seconds)
+        self.loaded = True
+
+    def gpu_memory(self) -> Optional[Dict[str, float]]:
+        return None
+
+    def generate(self, params: Dict[str, Any], on_step: StepCallback,
+                 on_stream: Optional[StreamCallback] = None) -> Dict[str, Any]:
+        # Simulated text encoding, skipped for prompts seen before
+        encode_start = time.time()
+        prompt = canonicalize(params["prompt"])
+        hit = prompt in self._encoded
+        if not hit:
+            time.sleep(self.encode_seconds)
+            self._encoded.add(prompt)
+        encode_time = time.time() - encode_start
+
+        total = int(params["infer_steps"])
+        denoise_start = time.time()
+        for step in range(1, total + 1):
+            time.sleep(self.step_seconds)
+            on_step(step, total)
+        denoise_time = time.time() - denoise_start
+
+        save_dir = Path(params["save_path"])
+        save_dir.mkdir(parents=True, exist_ok=True)
+        video_path = save_dir / f"stub_seed{params.get('seed') or 0}.mp4"
+        # Deterministic bytes per (prompt, seed, shape), like a real run with a fixed seed,
+        # written one fragment at a time like the ffmpeg encoder does
+        payload = json.dumps([prompt, params.get("seed"), params["height"], params["width"],
+                              params["video_length"], total]).encode()
+        frames = int(params["video_length"])
+        with open(video_path, "wb") as f:
+            f.write(_box(b"ftyp", b"isom\0\0\2\0isomiso6") + _box(b"moov"))
+            for sequence, first in enumerate(range(0, frames, self.fragment_frames), start=1):
+                count = min(self.fragment_frames, frames - first)
+                traf = (_box(b"tfhd", bytes(4) + (1).to_bytes(4, "big"))
+                        + _box(b"trun", bytes(4) + count.to_bytes(4, "big")))
+                f.write(_box(b"moof", _box(b"mfhd", bytes(4) + sequence.to_bytes(4, "big")) + _box(b"traf", traf)))
+                f.write(_box(b"mdat", payload * count))
+                f.flush()
+                if on_stream:
+                    on_stream(str(video_path), sequence)
+                time.sleep(self.step_seconds)
+
+        return {
+            "video_path": str(video_path),
+            "seed": params.get("seed") or 0,
+            "timings": {"encode": round(encode_time, 3), "denoise": round(denoise_time, 3), "save": 0.0},
+            "embedding_cache": {
+                "hit": hit, "hits": int(hit), "misses": int(not hit), "similar_hits": 0,
+                "load_time": round(encode_time, 3) if hit else 0.0,
+                "encode_time": 0.0 if hit else round(encode_time, 3),
+            },
+            "latent_cache": {"resumed_from_step": None, "init_from": None, "checkpoints": 0},
+        }
+
+
+class HunyuanBackend:
+    """
+    Real backend: loads HunyuanVideoSampler once and reuses it for every job.
+    Must run inside the HunyuanVideo container (cwd /workspace/repo).
+    """
+    name = "hunyuan"
+
+    def __init__(self, model_base: str = "/workspace/repo", use_cpu_offload: bool = True,
+                 embedding_cache: Optional[GenerationCache] = None,
+                 prompt_index: Optional[PromptIndex] = None,
+                 latent_cache: Optional[LatentCache] = None,
+                 stream_command: Optional[List[str]] = None, fragment_seconds: float = 1.0):
+        self.model_base = model_base
+        self.use_cpu_offload = use_cpu_offload
+        # ffmpeg command for streamed fragmented MP4 output; None saves with save_videos_grid
+        self.stream_command = stream_command
+        self.fragment_frames = max(1, round(fragment_seconds * STREAM_FPS))
+        # Prompt embeddings cache; None re-encodes every prompt
+        self.embedding_cache = embedding_cache
+        # Near-duplicate fallback for embedding cache misses (None: exact canonical prompts only)
+        self.prompt_index = prompt_index
+        # Latent checkpoints for resume and refine; None always starts from noise
+        self.latent_cache = latent_cache
+        self._latent_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="latent-writer")
+        self._latent_keys: Dict[str, str] = {}  # kind -> key for the running job
+        self._start_step = 0
+        self._start_sigma = 1.0
+        self._resume_latents = None
+        self._init_latents = None
+        self._latent_report: Dict[str, Any] = {}
+        self.sampler = None
+        self.loaded = False
+        self._on_step: Optional[StepCallback] = None
+        self._step = 0
+        self._total = 0
+        self._stage_times: Dict[str, float] = {}
+        self._embedding_stats: Dict[str, float] = {}
+
+    def gpu_memory(self) -> Optional[Dict[str, float]]:
+        """Device memory in GB (cudaMemGetInfo is cheap enough for every ping)"""
+        import torch
+        if not torch.cuda.is_available():
+            return None
+        free, total = torch.cuda.mem_get_info()
+        gb = 1024 ** 3
+        return {
+            "free_gb": round(free / gb, 2),
+            "total_gb": round(total / gb, 2),
+            "allocated_gb": round(torch.cuda.memory_allocated() / gb, 2),
+            "peak_allocated_gb": round(torch.cuda.max_memory_allocated() / gb, 2),
+        }
+
+    def load(self):
+        # Imported lazily so the stub backend and the API client never need hyvideo
+        from hyvideo.config import parse_args
+        from hyvideo.inference import HunyuanVideoSampler
+
+        argv = [
+            "sample_video.py",
+            "--model-base", self.model_base,
+            "--save-path", "/opt/hunyuan-video/results",
+        ]
+        if self.use_cpu_offload:
+            argv.append("--use-cpu-offload")
+
+        # hyvideo's parse_args reads sys.argv directly
+        saved_argv = sys.argv
+        sys.argv = argv
+        try:
+            args = parse_args()
+        finally:
+            sys.argv = saved_argv
+
+        self.sampler = HunyuanVideoSampler.from_pretrained(Path(self.model_base), args=args)
+        self._instrument_scheduler()
+        self._instrument_stages()
+        self.loaded = True
+
+    def _instrument_scheduler(self):
+        """
+        Count denoising steps (and checkpoint latents) by wrapping the scheduler's
+        step(), and skip already-denoised steps by wrapping set_timesteps().
+        predict() builds a fresh scheduler per call, so patch the class, not the instance.
+        """
+        scheduler_cls = type(self.sampler.pipeline.scheduler)
+        original_step = scheduler_cls.step
+        original_set_timesteps = scheduler_cls.set_timesteps
+        backend = self
+
+        def step(self, *args, **kwargs):
+            result = original_step(self, *args, **kwargs)
+            backend._step += 1
+            backend._checkpoint(result)
+            if backend._on_step:
+                backend._on_step(backend._step, backend._total)
+            return result
+
+        def set_timesteps(self, *args, **kwargs):
+            original_set_timesteps(self, *args, **kwargs)
+            if backend._start_step:
+                # Resume: drop the steps already taken; sigmas stay aligned with timesteps
+                backend._start_sigma = float(self.sigmas[backend._start_step])
+                self.timesteps = self.timesteps[backend._start_step:]
+                self.sigmas = self.sigmas[backend._start_step:]
+
+        scheduler_cls.step = step
+        scheduler_cls.set_timesteps = set_timesteps
+
+    def _instrument_stages(self):
+        """
+        Wrap the loaded pipeline's encode_prompt (embedding cache + timing),
+        VAE decode (timing) and prepare_latents (resume/refine from cached latents). predict() calls encode_prompt once per text
+        encoder (LLaVA, then CLIP), so each encoder's output is cached separately.
+        """
+        pipeline = self.sampler.pipeline
+        encode_prompt = pipeline.encode_prompt
+        encode_signature = inspect.signature(encode_prompt)
+        decode = pipeline.vae.decode
+        prepare_latents = pipeline.prepare_latents
+
+        def resumable_prepare_latents(*args, **kwargs):
+            return self._initial_latents(prepare_latents(*args, **kwargs))
+
+        def cached_encode_prompt(*args, **kwargs):
+            start = time.time()
+            try:
+                bound = encode_signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return self._encode_with_cache(encode_prompt, bound)
+            finally:
+                self._add_stage_time("encode", time.time() - start)
+
+        def timed_decode(*args, **kwargs):
+            start = time.time()
+            try:
+                return decode(*args, **kwargs)
+            finally:
+                self._add_stage_time("vae_decode", time.time() - start)
+
+        pipeline.encode_prompt = cached_encode_prompt
+        pipeline.vae.decode = timed_decode
+        pipeline.prepare_latents = resumable_prepare_latents
+
+    def _add_stage_time(self, stage: str, seconds: float):
+        self._stage_times[stage] = self._stage_times.get(stage, 0.0) + seconds
+
+    def _encoder_version(self, encoder: str) -> str:
+        """Identity of a text encoder's configuration, part of the embedding cache key"""
+        args = self.sampler.args
+        fields = ",".join(f"{name}={getattr(args, name, None)}" for name in ENCODER_VERSION_FIELDS[encoder])
+        return f"v{EMBEDDING_CACHE_VERSION}|{self.model_base}|{fields}"
+
+    def _encode_with_cache(self, encode_prompt: Callable, bound: inspect.BoundArguments):
+        """Load encoder outputs on a hit; encode and store them on a miss"""
+        arguments = bound.arguments
+        if (self.embedding_cache is None or arguments.get("prompt_embeds") is not None
+                or not isinstance(arguments.get("prompt"), str)):
+            return encode_prompt(*bound.args, **bound.kwargs)
+
+        pipeline = self.sampler.pipeline
+        text_encoder = arguments.get("text_encoder")
+        encoder = "text_encoder"
+        if text_encoder is not None and text_encoder is getattr(pipeline, "text_encoder_2", None):
+            encoder = "text_encoder_2"
+
+        def key_for(prompt: str) -> str:
+            return self.embedding_cache.embedding_key(
+                prompt,
+                self._encoder_version(encoder),
+                negative_prompt=arguments.get("negative_prompt"),
+                num_videos_per_prompt=arguments.get("num_videos_per_prompt"),
+                do_classifier_free_guidance=arguments.get("do_classifier_free_guidance"),
+                clip_skip=arguments.get("clip_skip"),
+                data_type=arguments.get("data_type"),
+            )
+
+        start = time.time()
+        key = key_for(arguments["prompt"])
+        cached = self.embedding_cache.get_embedding_tensors(key, device=arguments.get("device"))
+        if cached is None and self.prompt_index is not None:
+            match = self.prompt_index.nearest(arguments["prompt"])
+            if match and match[0] != canonicalize(arguments["prompt"]):
+                cached = self.embedding_cache.get_embedding_tensors(key_for(match[0]), device=arguments.get("device"))
+                self._embedding_stats["similar_hits"] += cached is not None
+        if cached is not None:
+            self._embedding_stats["hits"] += 1
+            self._embedding_stats["load_time"] += time.time() - start
+            return tuple(cached)
+
+        start = time.time()
+        outputs = encode_prompt(*bound.args, **bound.kwargs)
+        self._embedding_stats["misses"] += 1
+        self._embedding_stats["encode_time"] += time.time() - start
+        self.embedding_cache.set_embedding_tensors(key, outputs)
+        if self.prompt_index is not None:
+            self.prompt_index.add(arguments["prompt"])
+        return outputs
+
+    def _prompt_key(self, prompt: str) -> str:
+        """Identity of the prompt embeddings a run was conditioned on"""
+        key_data = {
+            "prompt": canonicalize(prompt),
+            "negative_prompt": self.sampler.args.neg_prompt,
+            "encoders": [self._encoder_version(encoder) for encoder in ENCODER_VERSION_FIELDS],
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _prepare_latent_state(self, params: Dict[str, Any], seed: int):
+        """Pick the starting point of a run: a checkpoint of this run, a refine source, or noise"""
+        self._latent_keys, self._start_step, self._start_sigma = {}, 0, 1.0
+        self._resume_latents = self._init_latents = None
+        self._latent_report = {"resumed_from_step": None, "init_from": None, "checkpoints": 0}
+        if self.latent_cache is None:
+            return
+
+        args = self.sampler.args
+        scheduler = {
+            "flow_shift": args.flow_shift, "flow_reverse": args.flow_reverse,
+            "flow_solver": getattr(args, "flow_solver", None),
+            "cfg_scale": args.cfg_scale, "embedded_cfg_scale": params["cfg_scale"],
+        }
+        prompt_key = self._prompt_key(params["prompt"])
+
+        def key(height: int, width: int, **extra) -> str:
+            return LatentCache.key(prompt_key, seed, height, width, params["video_length"],
+                                   {**scheduler, **extra})
+
+        self._latent_keys = {
+            "checkpoint": key(params["height"], params["width"], infer_steps=self._total),
+            "final": key(params["height"], params["width"]),
+        }
+
+        checkpoint = self.latent_cache.load(self._latent_keys["checkpoint"], "checkpoint")
+        if checkpoint is not None and 0 < checkpoint[1].get("step", 0) < self._total:
+            self._resume_latents, meta = checkpoint
+            self._start_step = meta["step"]
+            self._latent_report["resumed_from_step"] = self._start_step
+            return
+
+        init_from = params.get("init_from")
+        if init_from:
+            source = self.latent_cache.load(key(init_from["height"], init_from["width"]), "final")
+            if source is not None:
+                strength = min(max(float(init_from.get("strength", 0.6)), 0.05), 1.0)
+                self._init_latents = source[0]
+                self._start_step = min(int(round(self._total * (1 - strength))), self._total - 1)
+                self._latent_report["init_from"] = f"{init_from['height']}x{init_from['width']}"
+
+    def _initial_latents(self, noise):
+        """Replace the pipeline's initial noise when resuming or refining"""
+        if self._resume_latents is not None:
+            return self._resume_latents.to(device=noise.device, dtype=noise.dtype)
+        if self._init_latents is None:
+            return noise
+
+        import torch
+        import torch.nn.functional as F
+        # Upsample the earlier run's clean latents to this shape, then noise them
+        # to the level of the first remaining step (flow matching interpolates
+        # linearly between data and noise)
+        source = self._init_latents.to(device=noise.device, dtype=torch.float32)
+        if source.shape[2:] != noise.shape[2:]:
+            source = F.interpolate(source, size=tuple(noise.shape[2:]), mode="trilinear", align_corners=False)
+        noise_level = self._start_sigma if self.sampler.args.flow_reverse else 1 - self._start_sigma
+        return (noise_level * noise.float() + (1 - noise_level) * source).to(noise.dtype)
+
+    def _checkpoint(self, result):
+        """Save latents every checkpoint_every steps and after the last step (off the denoising thread)"""
+        if self.latent_cache is None or not self._latent_keys:
+            return
+        final = self._step >= self._total
+        if not final and self._step % self.latent_cache.checkpoint_every:
+            return
+        latents = result[0] if isinstance(result, tuple) else getattr(result, "prev_sample", None)
+        if latents is None:
+            return
+        cpu_latents = latents.detach().to("cpu", copy=True)
+        kind = "final" if final else "checkpoint"
+        self._latent_writer.submit(self.latent_cache.save, self._latent_keys[kind], kind, cpu_latents,
+                                   {"step": self._step, "total": self._total})
+        self._latent_report["checkpoints"] += not final
+
+    def _embedding_report(self) -> Dict[str, Any]:
+        stats = self._embedding_stats
+        return {
+            "hit": stats["hits"] > 0 and stats["misses"] == 0,
+            "hits": int(stats["hits"]),
+            "misses": int(stats["misses"]),
+            "similar_hits": int(stats["similar_hits"]),
+            "load_time": round(stats["load_time"], 3),
+            "encode_time": round(stats["encode_time"], 3),
+        }
+
+    def _save_streamed(self, samples, video_path: Path, on_stream: Optional[StreamCallback]):
+        """Pipe frames into ffmpeg one at a time, reporting each fragment written"""
+        import torch
+
+        # (C, T, H, W) in [0, 1] -> (T, H, W, C) uint8, as save_videos_grid converts them
+        frames = (samples.clamp(0, 1) * 255).to(torch.uint8).permute(1, 2, 3, 0).cpu()
+        height, width = frames.shape[1], frames.shape[2]
+        writer = FragmentedMp4Writer(
+            video_path, width, height, fps=STREAM_FPS, fragment_frames=self.fragment_frames,
+            command=self.stream_command,
+            on_fragment=(lambda count: on_stream(str(video_path), count)) if on_stream else None,
+        )
+        try:
+            for frame in frames:
+                writer.write(frame.numpy().tobytes())
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+    def generate(self, params: Dict[str, Any], on_step: StepCallback,
+                 on_stream: Optional[StreamCallback] = None) -> Dict[str, Any]:
+        from hyvideo.utils.file_utils import save_videos_grid
+
+        self._total = int(params["infer_steps"])
+        self._on_step = on_step
+        self._stage_times = {}
+        self._embedding_stats = {"hits": 0, "misses": 0, "similar_hits": 0, "load_time": 0.0, "encode_time": 0.0}
+        self.sampler.args.flow_reverse = bool(params.get("flow_reverse", True))
+        # Checkpoints are keyed by seed, so pick one up front when the caller didn't
+        seed = params.get("seed")
+        if seed is None:
+            seed = random.randint(0, 2 ** 31 - 1)
+        self._prepare_latent_state(params, seed)
+        self._step = self._start_step
+
+        try:
+            predict_start = time.time()
+            outputs = self.sampler.predict(
+                prompt=params["prompt"],
+                height=params["height"],
+                width=params["width"],
+                video_length=params["video_length"],
+                seed=seed,
+                negative_prompt=self.sampler.args.neg_prompt,
+                infer_steps=self._total,
+                guidance_scale=self.sampler.args.cfg_scale,
+                num_videos_per_prompt=1,
+                flow_shift=self.sampler.args.flow_shift,
+                batch_size=1,
+                embedded_guidance_scale=params["cfg_scale"],
+            )
+            predict_time = time.time() - predict_start
+        finally:
+            self._on_step = None
+            self._resume_latents = self._init_latents = None
+            self._start_step = 0
+        if self.latent_cache is not None and self._latent_keys:
+            # Finished: the final latents supersede the checkpoint
+            self._latent_writer.submit(self.latent_cache.discard, self._latent_keys["checkpoint"], "checkpoint")
+        encode_time = self._stage_times.get("encode", 0.0)
+        decode_time = self._stage_times.get("vae_decode", 0.0)
+
+        save_start = time.time()
+        save_dir = Path(params["save_path"])
+        save_dir.mkdir(parents=True, exist_ok=True)
+        seed = outputs["seeds"][0]
+        time_flag = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
+        video_path = save_dir / f"{time_flag}_seed{seed}.mp4"
+        if self.stream_command:
+            self._save_streamed(outputs["samples"][0], video_path, on_stream)
+        else:
+            save_videos_grid(outputs["samples"][0].unsqueeze(0), str(video_path), fps=STREAM_FPS)
+
+        return {
+            "video_path": str(video_path),
+            "seed": seed,
+            "timings": {
+                "encode": round(encode_time, 3),
+                "denoise": round(predict_time - encode_time - decode_time, 3),
+                "vae_decode": round(decode_time, 3),
+                "save": round(time.time() - save_start, 3),
+            },
+            "embedding_cache": self._embedding_report(),
+            "latent_cache": self._latent_report,
+        }
+
+
+class WorkerServer:
+    """Socket server that runs jobs one at a time on a loaded backend"""
+
+    def __init__(self, backend, address: str = DEFAULT_WORKER_ADDRESS):
+        self.backend = backend
+        self.address = address
+        self.load_time = 0.0
+        self.jobs_completed = 0
+        self.last_success_at: Optional[float] = None
+        self.current_job: Optional[str] = None
+        self._cancelled: set = set()
+        self._gpu_lock = asyncio.Lock()
+
+    async def start(self):
+        """Load the model, then start listening"""
+        start = time.time()
+        await asyncio.to_thread(self.backend.load)
+        self.load_time = round(time.time() - start, 1)
+        print(f"🔥 {self.backend.name} backend loaded in {self.load_time}s")
+
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            if os.path.exists(target):
+                os.unlink(target)
+            server = await asyncio.start_unix_server(self._handle, path=target)
+        else:
+            server = await asyncio.start_server(self._handle, host=target[0], port=target[1])
+        print(f"🚀 Worker listening on {self.address}")
+        return server
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            request = json.loads(line)
+
+            if request.get("type") == "ping":
+                await self._send(writer, {
+                    "type": "pong",
+                    "backend": self.backend.name,
+                    "loaded": self.backend.loaded,
+                    "load_time": self.load_time,
+                    "busy": self.current_job is not None,
+                    "jobs_completed": self.jobs_completed,
+                    "last_success_at": self.last_success_at,
+                    "gpu": self.backend.gpu_memory() if self.backend.loaded else None,
+                })
+            elif request.get("type") == "generate":
+                await self._generate(request, writer)
+            elif request.get("type") == "generate_batch":
+                await self._generate_batch(request, writer)
+            elif request.get("type") == "cancel":
+                running = request.get("job_id") == self.current_job
+                if running:
+                    self._cancelled.add(self.current_job)
+                await self._send(writer, {"type": "cancelled", "job_id": request.get("job_id"), "running": running})
+            else:
+                await self._send(writer, {"type": "error", "error": f"Unknown request: {request.get('type')}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _generate(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        params = request["params"]
+
+        def work(emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+            return self.backend.generate(
+                params, lambda step, total: emit({"type": "step", "step": step, "total": total}),
+                lambda path, segments: emit({"type": "segment", "video_path": path, "segments": segments}),
+            )
+
+        await self._run_job(request["job_id"], writer, work)
+
+    async def _generate_batch(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        """Run a micro-batch of same-shape items back to back under one GPU hold"""
+        items = request["items"]
+
+        def work(emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+            completed = 0
+            for index, params in enumerate(items):
+                def on_step(step: int, total: int, index=index):
+                    emit({"type": "step", "item": index, "step": step, "total": total})
+
+                def on_stream(path: str, segments: int, index=index):
+                    emit({"type": "segment", "item": index, "video_path": path, "segments": segments})
+
+                item_start = time.time()
+                try:
+                    result = self.backend.generate(params, on_step, on_stream)
+                except Exception as e:
+                    emit({"type": "item_error", "item": index, "error": str(e)[:500]})
+                    continue
+                completed += 1
+                emit({"type": "item_done", "item": index,
+                      "duration": round(time.time() - item_start, 3), **result})
+            if items and not completed:
+                # Not a success: health checks read last_success_at
+                raise RuntimeError(f"All {len(items)} batch items failed")
+            return {"items": len(items), "completed": completed}
+
+        await self._run_job(request["job_id"], writer, work)
+
+    async def _run_job(self, job_id: str, writer: asyncio.StreamWriter,
+                       work: Callable[[Callable[[Dict[str, Any]], None]], Dict[str, Any]]):
+        """Hold the GPU, run work() in a thread and stream its events to the client"""
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def emit(event: Dict[str, Any]):
+            # Called from the backend thread; raising here stops a cancelled job at its next step
+            if job_id in self._cancelled:
+                raise RuntimeError("Cancelled")
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        async with self._gpu_lock:
+            self.current_job = job_id
+            await self._send(writer, {"type": "started", "job_id": job_id})
+            task = asyncio.create_task(asyncio.to_thread(work, emit))
+
+            try:
+                while not task.done() or not events.empty():
+                    try:
+                        event = await asyncio.wait_for(events.get(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    await self._send(writer, event)
+
+                result = task.result()
+                self.jobs_completed += 1
+                self.last_success_at = time.time()
+                await self._send(writer, {"type": "done", **result})
+            except ConnectionError:
+                # Client went away; let the job finish so the GPU state stays consistent
+                await asyncio.gather(task, return_exceptions=True)
+            except Exception as e:
+                print(f"❌ Job {job_id[:8]} failed: {e}")
+                await self._send(writer, {"type": "error", "error": str(e)[:500]})
+            finally:
+                self.current_job = None
+                self._cancelled.discard(job_id)
+
+    async def _send(self, writer: asyncio.StreamWriter, message: Dict[str, Any]):
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+
+class WorkerClient:
+    """Async client used by the API to talk to a warm worker"""
+
+    def __init__(self, address: Optional[str] = None):
+        self.address = address or os.getenv("WORKER_ADDRESS", DEFAULT_WORKER_ADDRESS)
+        self.enabled = os.getenv("ENABLE_WARM_WORKER", "true").lower() == "true"
+        self.connect_timeout = 2.0
+
+    async def _open(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            connect = asyncio.open_unix_connection(target, limit=2 ** 20)
+        else:
+            connect = asyncio.open_connection(target[0], target[1], limit=2 ** 20)
+        return await asyncio.wait_for(connect, timeout=self.connect_timeout)
+
+    async def _request(self, message: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        reader, writer = await self._open()
+        try:
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                yield json.loads(line)
+        finally:
+            writer.close()
+
+    async def ping(self) -> Optional[Dict[str, Any]]:
+        """Return the worker's status, or None if it is unreachable"""
+        if not self.enabled:
+            return None
+        try:
+            async for message in self._request({"type": "ping"}):
+                return message
+        except (OSError, asyncio.TimeoutError, json.JSONDecodeError):
+            return None
+        return None
+
+    async def is_available(self) -> bool:
+        status = await self.ping()
+        return bool(status and status.get("loaded"))
+
+    async def generate(self, job_id: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Submit a job and yield worker events until done/error"""
+        async for message in self._request({"type": "generate", "job_id": job_id, "params": params}):
+            yield message
+            if message["type"] in ("done", "error"):
+                return
+        yield {"type": "error", "error": "Worker closed the connection"}
+
+    async def cancel(self, job_id: str) -> bool:
+        """Stop the worker's running job; False if it was not running it (or is unreachable)"""
+        try:
+            async for message in self._request({"type": "cancel", "job_id": job_id}):
+                return bool(message.get("running"))
+        except (OSError, asyncio.TimeoutError, json.JSONDecodeError):
+            return False
+        return False
+
+    async def generate_batch(self, batch_id: str, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Submit a micro-batch; yields step/item_done/item_error events, then done/error"""
+        async for message in self._request({"type": "generate_batch", "job_id": batch_id, "items": items}):
+            yield message
+            if message["type"] in ("done", "error"):
+                return
+        yield {"type": "error", "error": "Worker closed the connection"}
+
+
+def build_backend(args):
+    if args.backend == "stub":
+        return StubBackend(step_seconds=args.stub_step_seconds, encode_seconds=args.stub_encode_seconds,
+                           fragment_seconds=args.fragment_seconds)
+    embedding_cache = None
+    if not args.no_embedding_cache:
+        embedding_cache = GenerationCache(args.cache_dir, max_bytes=int(args.cache_gb * 1024 ** 3),
+                                          policy=args.cache_eviction)
+    prompt_index = None
+    if embedding_cache is not None and args.similar_prompt_threshold > 0:
+        prompt_index = PromptIndex(args.similar_prompt_threshold,
+                                   path=embedding_cache.embeddings_dir / "prompts.txt")
+        print(f"🔁 Indexed {prompt_index.load()} cached prompts for near-duplicate reuse")
+    latent_cache = None
+    if not args.no_latent_cache:
+        # Not GenerationCache's latents/ directory: the API's cache clear swaps that one out
+        latent_cache = LatentCache(args.latent_cache_dir or Path(args.cache_dir) / "checkpoints",
+                                   max_bytes=int(args.latent_cache_gb * 1024 ** 3),
+                                   checkpoint_every=args.checkpoint_every)
+    stream_command = None
+    if not args.no_streaming:
+        stream_command = shlex.split(args.ffmpeg)
+        if shutil.which(stream_command[0]) is None:
+            print(f"⚠️ {stream_command[0]} not found; videos are saved only once fully decoded")
+            stream_command = None
+    return HunyuanBackend(model_base=args.model_base, use_cpu_offload=not args.no_cpu_offload,
+                          embedding_cache=embedding_cache, prompt_index=prompt_index,
+                          latent_cache=latent_cache, stream_command=stream_command,
+                          fragment_seconds=args.fragment_seconds)
+
+
+def benchmark_embedding_cache(backend, prompts: List[str]) -> Dict[str, Any]:
+    """
+    Measure the time saved per embedding cache hit
+
+    Each prompt is generated twice (one step, one frame) against an empty
+    cache: the first run encodes and stores the embeddings, the second loads
+    them. The encode stage of the two runs is compared.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if isinstance(backend, HunyuanBackend):
+            backend.embedding_cache = GenerationCache(tmp)
+        for prompt in prompts:
+            params = {
+                "prompt": prompt, "height": 272, "width": 480, "video_length": 1,
+                "infer_steps": 1, "seed": 0, "cfg_scale": 6.0, "flow_reverse": True,
+                "save_path": tmp,
+            }
+            miss = backend.generate(params, lambda step, total: None)
+            hit = backend.generate(params, lambda step, total: None)
+            miss_encode, hit_encode = miss["timings"]["encode"], hit["timings"]["encode"]
+            results.append({
+                "prompt": prompt[:50],
+                "hit": hit["embedding_cache"]["hit"],
+                "miss_encode_s": miss_encode,
+                "hit_load_s": hit_encode,
+                "saved_s": round(miss_encode - hit_encode, 3),
+            })
+
+    saved = [r["saved_s"] for r in results]
+    return {
+        "backend": backend.name,
+        "prompts": results,
+        "avg_saved_per_hit_s": round(sum(saved) / len(saved), 3) if saved else 0.0,
+    }
+
+
+async def serve(args):
+    server = WorkerServer(build_backend(args), address=args.socket)
+    listener = await server.start()
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HunyuanVideo warm model worker")
+    parser.add_argument("--backend", choices=["hunyuan", "stub"], default="hunyuan")
+    parser.add_argument("--socket", default=os.getenv("WORKER_ADDRESS", DEFAULT_WORKER_ADDRESS),
+                        help="Unix socket path or tcp://host:port")
+    parser.add_argument("--model-base", default="/workspace/repo")
+    parser.add_argument("--no-cpu-offload", action="store_true")
+    parser.add_argument("--stub-step-seconds", type=float, default=0.05)
+    parser.add_argument("--stub-encode-seconds", type=float, default=0.0)
+    parser.add_argument("--cache-dir", default=os.getenv("CACHE_DIR", DEFAULT_CACHE_DIR),
+                        help="Embedding cache directory (shared with the API)")
+    parser.add_argument("--no-embedding-cache", action="store_true")
+    parser.add_argument("--cache-gb", type=float, default=float(os.getenv("CACHE_MAX_GB", "10")),
+                        help="Disk budget for cached embeddings (shared with the API)")
+    parser.add_argument("--cache-eviction", choices=["lru", "lfu"], default=os.getenv("CACHE_EVICTION", "lru"),
+                        help="Which embeddings to evict when over budget")
+    parser.add_argument("--similar-prompt-threshold", type=float,
+                        default=float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", "0")),
+                        help="Reuse embeddings of a cached prompt at least this similar (0 disables)")
+    parser.add_argument("--no-latent-cache", action="store_true")
+    parser.add_argument("--latent-cache-dir", default=os.getenv("LATENT_CACHE_DIR"),
+                        help="Latent checkpoint directory (default: <cache-dir>/checkpoints)")
+    parser.add_argument("--latent-cache-gb", type=float, default=float(os.getenv("LATENT_CACHE_MAX_GB", "20")),
+                        help="Disk budget for latent checkpoints (least recently used evicted first)")
+    parser.add_argument("--checkpoint-every", type=int, default=int(os.getenv("LATENT_CHECKPOINT_EVERY", "10")),
+                        help="Save resumable latents every N denoising steps")
+    parser.add_argument("--ffmpeg", default=os.getenv("WORKER_FFMPEG", "ffmpeg"),
+                        help="ffmpeg command that encodes the streamed fragmented MP4")
+    parser.add_argument("--fragment-seconds", type=float, default=float(os.getenv("STREAM_FRAGMENT_SECONDS", "1")),
+                        help="Length of each streamed video fragment (one keyframe interval)")
+    parser.add_argument("--no-streaming", action="store_true",
+                        help="Save videos with save_videos_grid once fully decoded")
+    parser.add_argument("--benchmark-embeddings", nargs="*", metavar="PROMPT",
+                        help="Measure time saved per embedding cache hit and exit")
+    args = parser.parse_args()
+
+    if args.benchmark_embeddings is not None:
+        backend = build_backend(args)
+        backend.load()
+        prompts = args.benchmark_embeddings or [
+            "A cat walks on the grass, realistic style.",
+            "Aerial drone shot of a busy city at sunset, cinematic, volumetric light",
+        ]
+        print(json.dumps(benchmark_embedding_cache(backend, prompts), indent=2))
+        return
+
+    asyncio.run(serve(args))
+
+
+# Global worker client instance
+worker_client = WorkerClient()
+
+
+if __name__ == "__main__":
+    main()
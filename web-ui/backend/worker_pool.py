@@ -0,0 +1,321 @@
+"""
+Worker Pool
+Registry of warm workers across GPUs and nodes with VRAM-aware placement
+
+Multi-GPU droplets run one warm worker per GPU (pinned with CUDA_VISIBLE_DEVICES).
+The pool knows each node's devices and their free memory, and places jobs:
+- 720p jobs only on devices with enough free VRAM, largest first
+- 540p and preview jobs spread across the least-loaded devices, preferring
+  devices too small for 720p so large GPUs stay available
+
+Configuration (WORKERS_CONFIG, JSON file):
+    [{"name": "node-1", "devices": [
+        {"address": "tcp://10.0.0.5:7001", "memory_gb": 80, "type": "H100"},
+        {"address": "tcp://10.0.0.5:7002", "memory_gb": 80, "type": "H100"}]}]
+Without a config file the pool has one local node with GPU_COUNT devices
+sharing WORKER_ADDRESS (type GPU_TYPE). A device's type defaults to its
+memory size, e.g. "80GB".
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from worker import WorkerClient
+
+# Peak VRAM per job (see deployment/GPU_SELECTION_GUIDE.md)
+VRAM_REQUIREMENTS_GB = {
+    "720p": 60,
+    "540p": 45,
+    "preview": 25,
+}
+
+
+def vram_required(video_size: str) -> float:
+    return VRAM_REQUIREMENTS_GB.get(video_size, VRAM_REQUIREMENTS_GB["720p"])
+
+
+def devices_from_droplet_size(size_slug: str) -> List[float]:
+    """
+    Device memory layout for a DigitalOcean GPU size slug
+
+    e.g. "gpu-h100x8-640gb" -> [80.0] * 8, "gpu-h100x1-80gb" -> [80.0]
+    """
+    match = re.search(r"x(\d+)-(\d+)gb", size_slug)
+    if not match:
+        return []
+    count, total_gb = int(match.group(1)), float(match.group(2))
+    return [total_gb / count] * count
+
+
+class GpuDevice:
+    """One GPU served by one warm worker"""
+
+    def __init__(self, node: str, index: int, address: str, memory_gb: float,
+                 max_jobs: int = 1, client=None, kind: Optional[str] = None):
+        self.node = node
+        self.index = index
+        self.address = address
+        self.memory_gb = memory_gb
+        # GPU model; the runtime estimator learns step costs per kind
+        self.kind = kind or f"{memory_gb:g}GB"
+        self.max_jobs = max_jobs
+        self.client = client or WorkerClient(address)
+        self.reserved_gb = 0.0
+        self.active_jobs: List[str] = []
+        self.jobs_completed = 0
+        # Set by the health monitor's worker pings (see health.py)
+        self.healthy = True
+
+    @property
+    def name(self) -> str:
+        return f"{self.node}/gpu{self.index}"
+
+    @property
+    def free_memory_gb(self) -> float:
+        return self.memory_gb - self.reserved_gb
+
+    def fits(self, required_gb: float) -> bool:
+        return (
+            self.healthy
+            and len(self.active_jobs) < self.max_jobs
+            and self.free_memory_gb >= required_gb
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "address": self.address,
+            "memory_gb": self.memory_gb,
+            "type": self.kind,
+            "free_memory_gb": self.free_memory_gb,
+            "active_jobs": list(self.active_jobs),
+            "jobs_completed": self.jobs_completed,
+            "healthy": self.healthy,
+        }
+
+
+class Placement:
+    """A job's reservation on a device; released when the job ends"""
+
+    def __init__(self, job_id: str, device: GpuDevice, required_gb: float):
+        self.job_id = job_id
+        self.device = device
+        self.required_gb = required_gb
+
+    @property
+    def client(self):
+        return self.device.client
+
+
+class WorkerPool:
+    def __init__(self):
+        self.devices: List[GpuDevice] = []
+        self._placements: Dict[str, Placement] = {}
+
+    @property
+    def device_count(self) -> int:
+        return len(self.devices)
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of concurrent jobs across all devices"""
+        return sum(device.max_jobs for device in self.devices)
+
+    def register_node(self, name: str, memory_gb: List[float], addresses: List[str],
+                      max_jobs: int = 1, clients: Optional[List[Any]] = None,
+                      kinds: Optional[List[Optional[str]]] = None):
+        """Add a node with one device per entry in memory_gb"""
+        for index, (memory, address) in enumerate(zip(memory_gb, addresses)):
+            client = clients[index] if clients else None
+            kind = kinds[index] if kinds else None
+            self.devices.append(GpuDevice(name, index, address, memory, max_jobs, client, kind))
+
+    def unregister_node(self, name: str):
+        self.devices = [device for device in self.devices if device.node != name]
+
+    def load_config(self):
+        """Populate from WORKERS_CONFIG, or a single local node"""
+        self.devices = []
+        config_path = os.getenv("WORKERS_CONFIG")
+        max_jobs = int(os.getenv("MAX_JOBS_PER_GPU", "1"))
+
+        if config_path and Path(config_path).exists():
+            for node in json.loads(Path(config_path).read_text()):
+                self.register_node(
+                    node["name"],
+                    [device["memory_gb"] for device in node["devices"]],
+                    [device["address"] for device in node["devices"]],
+                    max_jobs=node.get("max_jobs_per_gpu", max_jobs),
+                    kinds=[device.get("type") for device in node["devices"]],
+                )
+        else:
+            gpu_count = int(os.getenv("GPU_COUNT", "1"))
+            memory_gb = float(os.getenv("GPU_MEMORY_GB", "80"))
+            address = os.getenv("WORKER_ADDRESS") or WorkerClient().address
+            kind = os.getenv("GPU_TYPE") or None
+            self.register_node("local", [memory_gb] * gpu_count, [address] * gpu_count, max_jobs,
+                               kinds=[kind] * gpu_count)
+
+        print(f"🖥️ Worker pool: {self.device_count} device(s), capacity {self.capacity} job(s)")
+
+    def can_ever_place(self, video_size: str) -> bool:
+        """True if some device is large enough for this job when idle"""
+        required = vram_required(video_size)
+        return any(device.memory_gb >= required for device in self.devices)
+
+    def try_place(self, job_id: str, video_size: str) -> Optional[Placement]:
+        """Reserve a device for the job, or return None if nothing fits right now"""
+        required = vram_required(video_size)
+        candidates = [device for device in self.devices if device.fits(required)]
+        if not candidates:
+            return None
+
+        if video_size == "720p":
+            # Largest free memory first
+            device = max(candidates, key=lambda d: (d.free_memory_gb, -len(d.active_jobs)))
+        else:
+            # Spread: fewest active jobs; among equals prefer devices that can't take 720p
+            large = vram_required("720p")
+            device = min(candidates, key=lambda d: (
+                len(d.active_jobs),
+                d.memory_gb >= large,
+                -d.free_memory_gb,
+            ))
+
+        device.reserved_gb += required
+        device.active_jobs.append(job_id)
+        placement = Placement(job_id, device, required)
+        self._placements[job_id] = placement
+        return placement
+
+    def placement(self, job_id: str) -> Optional[Placement]:
+        """Where a running job was placed, or None if it is not running"""
+        return self._placements.get(job_id)
+
+    def release(self, job_id: str, succeeded: bool = True):
+        placement = self._placements.pop(job_id, None)
+        if placement is None:
+            return
+        device = placement.device
+        device.reserved_gb = max(0.0, device.reserved_gb - placement.required_gb)
+        if job_id in device.active_jobs:
+            device.active_jobs.remove(job_id)
+        if succeeded:
+            device.jobs_completed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "devices": [device.to_dict() for device in self.devices],
+            "capacity": self.capacity,
+            "active_jobs": len(self._placements),
+        }
+
+
+class FakeWorkerClient:
+    """
+    In-process stand-in for WorkerClient that simulates step latency
+    Lets placement and scaling be exercised without GPUs or sockets.
+    """
+
+    def __init__(self, seconds_per_step: float = 0.01, memory_gb: float = 80):
+        self.seconds_per_step = seconds_per_step
+        self.memory_gb = memory_gb
+        self.address = f"fake://{id(self)}"
+        self.jobs_completed = 0
+        self._running: set = set()
+        self._cancelled: set = set()
+
+    async def ping(self) -> Optional[Dict[str, Any]]:
+        return {"type": "pong", "backend": "fake", "loaded": True, "memory_gb": self.memory_gb}
+
+    async def is_available(self) -> bool:
+        return True
+
+    async def generate(self, job_id: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        total = int(params["infer_steps"])
+        self._running.add(job_id)
+        try:
+            yield {"type": "started", "job_id": job_id}
+            for step in range(1, total + 1):
+                await asyncio.sleep(self.seconds_per_step)
+                if job_id in self._cancelled:
+                    yield {"type": "error", "error": "Cancelled"}
+                    return
+                yield {"type": "step", "step": step, "total": total}
+            self.jobs_completed += 1
+            yield {"type": "done", "video_path": None, "timings": {"denoise": total * self.seconds_per_step}}
+        finally:
+            self._running.discard(job_id)
+            self._cancelled.discard(job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        if job_id not in self._running:
+            return False
+        self._cancelled.add(job_id)
+        return True
+
+    async def generate_batch(self, batch_id: str, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        yield {"type": "started", "job_id": batch_id}
+        for index, params in enumerate(items):
+            total = int(params["infer_steps"])
+            for step in range(1, total + 1):
+                await asyncio.sleep(self.seconds_per_step)
+                yield {"type": "step", "item": index, "step": step, "total": total}
+            self.jobs_completed += 1
+            yield {"type": "item_done", "item": index, "video_path": None,
+                   "duration": total * self.seconds_per_step}
+        yield {"type": "done", "items": len(items), "completed": len(items)}
+
+
+async def simulate(device_memory_gb: List[float], video_sizes: List[str],
+                   steps: int = 20, seconds_per_step: float = 0.005) -> Dict[str, Any]:
+    """
+    Run a batch of fake jobs through placement and report throughput
+
+    Jobs that don't fit wait for a release, the same way the scheduler waits.
+    """
+    pool = WorkerPool()
+    clients = [FakeWorkerClient(seconds_per_step, memory) for memory in device_memory_gb]
+    pool.register_node("sim", device_memory_gb, [c.address for c in clients], clients=clients)
+    changed = asyncio.Event()
+
+    async def run(job_id: str, video_size: str):
+        while True:
+            placement = pool.try_place(job_id, video_size)
+            if placement:
+                break
+            changed.clear()
+            await changed.wait()
+        try:
+            async for _ in placement.client.generate(job_id, {"infer_steps": steps}):
+                pass
+        finally:
+            pool.release(job_id)
+            changed.set()
+
+    start = time.time()
+    await asyncio.gather(*(run(f"job-{i}", size) for i, size in enumerate(video_sizes)))
+    elapsed = time.time() - start
+
+    return {
+        "devices": len(device_memory_gb),
+        "jobs": len(video_sizes),
+        "elapsed_s": round(elapsed, 3),
+        "jobs_per_s": round(len(video_sizes) / elapsed, 2),
+        "per_device": [c.jobs_completed for c in clients],
+    }
+
+
+# Global worker pool instance
+worker_pool = WorkerPool()
+
+
+if __name__ == "__main__":
+    # Scaling check: same mixed workload on 1, 2 and 8 simulated H100s
+    workload = ["720p", "540p", "preview", "540p"] * 8
+    for count in (1, 2, 8):
+        print(asyncio.run(simulate([80.0] * count, workload)))
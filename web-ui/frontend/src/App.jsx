@@ -7,7 +7,7 @@ import { useJobs } from './hooks/useApi';
 import './index.css';
 
 function App() {
-  const { jobs, loading, generateVideo, deleteJob } = useJobs();
+  const { jobs, loading, generateVideo, refineJob, deleteJob } = useJobs();
   const [generating, setGenerating] = useState(false);
   const [filter, setFilter] = useState('all');
 
@@ -22,6 +22,14 @@ function App() {
     }
   };
 
+  const handleRefine = async (jobId) => {
+    try {
+      await refineJob(jobId);
+    } catch (error) {
+      alert('Failed to refine draft: ' + error.message);
+    }
+  };
+
   const handleDelete = async (jobId) => {
     if (confirm('Delete this video?')) {
       try {
@@ -156,6 +164,7 @@ function App() {
                   <VideoCard
                     key={job.job_id}
                     job={job}
+                    onRefine={handleRefine}
                     onDelete={handleDelete}
                   />
                 ))}
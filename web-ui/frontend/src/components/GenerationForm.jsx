@@ -10,7 +10,8 @@ export default function GenerationForm({ onGenerate, generating }) {
     infer_steps: 0,  // 0 = auto-adaptive
     seed: null,
     cfg_scale: 6.0,
-    flow_reverse: true
+    flow_reverse: true,
+    draft: false  // Quick preview-resolution draft first, refined once approved
   });
 
   const [showAdvanced, setShowAdvanced] = useState(false);
@@ -178,6 +179,18 @@ export default function GenerationForm({ onGenerate, generating }) {
             className="w-full"
           />
         </div>
+
+        {/* Draft First */}
+        <label className="flex items-center gap-2 cursor-pointer">
+          <input
+            type="checkbox"
+            checked={formData.draft}
+            onChange={(e) => setFormData({ ...formData, draft: e.target.checked })}
+            className="w-4 h-4 rounded bg-dark-card border-dark-border"
+          />
+          <span className="text-sm">Draft first</span>
+          <span className="text-xs text-gray-500">480×272 preview; refine it at {formData.video_size} once it looks right</span>
+        </label>
       </div>
 
       {/* Advanced Settings */}
@@ -1,9 +1,15 @@
 import { useState } from 'react';
-import { Play, Download, Trash2, Clock, CheckCircle, XCircle, Loader, X } from 'lucide-react';
+import { Play, Download, Trash2, Clock, CheckCircle, XCircle, Loader, X, Sparkles } from 'lucide-react';
 import OptimizationBadge from './OptimizationBadge';
 
-export default function VideoCard({ job, onDelete }) {
+// The live stream is an HLS playlist; play it where the browser supports HLS natively
+const canPlayHls = typeof document !== 'undefined'
+  && document.createElement('video').canPlayType('application/vnd.apple.mpegurl') !== '';
+
+export default function VideoCard({ job, onRefine, onDelete }) {
   const [isPlaying, setIsPlaying] = useState(false);
+  const [scrubFrame, setScrubFrame] = useState(null);
+  const [isHovering, setIsHovering] = useState(false);
   const getStatusBadge = () => {
     switch (job.status) {
       case 'completed':
@@ -31,21 +37,71 @@ export default function VideoCard({ job, onDelete }) {
     return date.toLocaleString();
   };
 
+  // Hover-seek: pick the sprite sheet tile under the pointer
+  const handleScrub = (event) => {
+    if (!job.sprite) return;
+    const rect = event.currentTarget.getBoundingClientRect();
+    const fraction = Math.min(Math.max((event.clientX - rect.left) / rect.width, 0), 0.999);
+    setScrubFrame(Math.floor(fraction * job.sprite.frames));
+  };
+
+  const spriteStyle = () => {
+    const { columns, rows } = job.sprite;
+    const column = scrubFrame % columns;
+    const row = Math.floor(scrubFrame / columns);
+    return {
+      backgroundImage: `url(/api/sprite/${job.job_id})`,
+      backgroundSize: `${columns * 100}% ${rows * 100}%`,
+      backgroundPosition: `${columns > 1 ? (column / (columns - 1)) * 100 : 0}% ${rows > 1 ? (row / (rows - 1)) * 100 : 0}%`,
+    };
+  };
+
   return (
     <div className="card group">
       {/* Thumbnail or Placeholder */}
-      <div className="relative aspect-video bg-dark-hover rounded-lg overflow-hidden mb-4">
-        {job.status === 'completed' && job.thumbnail_path ? (
+      <div
+        className="relative aspect-video bg-dark-hover rounded-lg overflow-hidden mb-4"
+        onMouseEnter={() => setIsHovering(true)}
+        onMouseMove={handleScrub}
+        onMouseLeave={() => { setIsHovering(false); setScrubFrame(null); }}
+      >
+        {job.status === 'completed' && job.sprite_path && scrubFrame !== null ? (
+          <div className="w-full h-full" style={spriteStyle()} />
+        ) : job.status === 'completed' && job.preview_path && isHovering ? (
+          <video
+            src={`/api/preview/${job.job_id}`}
+            poster={job.thumbnail_path ? `/api/thumbnail/${job.job_id}` : undefined}
+            autoPlay
+            muted
+            loop
+            playsInline
+            className="w-full h-full object-cover"
+          />
+        ) : job.status === 'completed' && job.thumbnail_path ? (
           <img
             src={`/api/thumbnail/${job.job_id}`}
             alt={job.prompt}
             className="w-full h-full object-cover"
           />
+        ) : job.status === 'processing' && job.stream_segments > 0 && canPlayHls ? (
+          <video
+            src={`/api/stream/${job.job_id}/index.m3u8`}
+            autoPlay
+            muted
+            playsInline
+            className="w-full h-full object-cover"
+          />
         ) : job.status === 'processing' ? (
           <div className="flex items-center justify-center h-full">
             <div className="text-center">
               <Loader className="w-12 h-12 text-primary-500 animate-spin mx-auto mb-2" />
               <p className="text-sm text-gray-400">{job.progress}%</p>
+              {job.total_steps > 0 && (
+                <p className="text-xs text-gray-500">
+                  Step {job.step}/{job.total_steps}
+                  {job.eta_seconds != null && ` · ~${Math.ceil(job.eta_seconds / 60)} min left`}
+                </p>
+              )}
               <div className="w-48 h-2 bg-dark-card rounded-full mt-2 overflow-hidden">
                 <div
                   className="h-full bg-primary-500 transition-all duration-300"
@@ -63,13 +119,21 @@ export default function VideoCard({ job, onDelete }) {
           </div>
         ) : (
           <div className="flex items-center justify-center h-full">
-            <Clock className="w-12 h-12 text-gray-600" />
+            <div className="text-center">
+              <Clock className="w-12 h-12 text-gray-600 mx-auto mb-2" />
+              {job.queue_position != null && (
+                <p className="text-xs text-gray-500">
+                  #{job.queue_position + 1} in queue
+                  {job.eta_seconds != null && ` · done in ~${Math.ceil(job.eta_seconds / 60)} min`}
+                </p>
+              )}
+            </div>
           </div>
         )}
 
         {/* Play overlay for completed videos */}
         {job.status === 'completed' && (
-          <div className="absolute inset-0 bg-black/50 opacity-0 group-hover:opacity-100 transition-opacity flex items-center justify-center">
+          <div className={`absolute inset-0 ${job.sprite_path ? 'bg-black/20' : 'bg-black/50'} opacity-0 group-hover:opacity-100 transition-opacity flex items-center justify-center`}>
             <button
               onClick={() => setIsPlaying(true)}
               className="bg-primary-600 hover:bg-primary-700 p-4 rounded-full transition-transform transform group-hover:scale-110"
@@ -81,8 +145,9 @@ export default function VideoCard({ job, onDelete }) {
       </div>
 
       {/* Status Badge */}
-      <div className="mb-3">
+      <div className="mb-3 flex items-center gap-2">
         {getStatusBadge()}
+        {job.draft && <span className="badge-info">Draft</span>}
       </div>
 
       {/* Prompt */}
@@ -115,6 +180,16 @@ export default function VideoCard({ job, onDelete }) {
 
       {/* Actions */}
       <div className="flex gap-2">
+        {job.status === 'completed' && job.draft && !job.refined_by && (
+          <button
+            onClick={() => onRefine(job.job_id)}
+            className="btn-primary flex-1 flex items-center justify-center gap-2"
+            title={`Render at ${job.refine_size} from this draft`}
+          >
+            <Sparkles className="w-4 h-4" />
+            Refine
+          </button>
+        )}
         {job.status === 'completed' && (
           <>
             <a
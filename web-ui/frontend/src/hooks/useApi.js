@@ -1,46 +1,79 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
 
 const API_BASE = '/api';
 
-export const useWebSocket = () => {
-  const [ws, setWs] = useState(null);
+// Delta protocol: snapshot + per-field deltas, resumable by sequence number
+const WS_PROTOCOL = 2;
+
+export const useWebSocket = (onMessage) => {
   const [connected, setConnected] = useState(false);
+  const lastSeq = useRef(null);
+  const handler = useRef(onMessage);
+  handler.current = onMessage;
 
   useEffect(() => {
-    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws`;
-    
-    const websocket = new WebSocket(wsUrl);
-    
-    websocket.onopen = () => {
-      console.log('WebSocket connected');
-      setConnected(true);
-    };
-    
-    websocket.onclose = () => {
-      console.log('WebSocket disconnected');
-      setConnected(false);
-      // Reconnect after 3 seconds
-      setTimeout(() => {
-        window.location.reload();
-      }, 3000);
+    let websocket;
+    let reconnectTimer;
+    let closed = false;
+
+    const connect = () => {
+      const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+      const since = lastSeq.current !== null ? `&since=${lastSeq.current}` : '';
+      websocket = new WebSocket(`${protocol}//${window.location.host}/ws?protocol=${WS_PROTOCOL}${since}`);
+
+      websocket.onopen = () => {
+        console.log('WebSocket connected');
+        setConnected(true);
+      };
+
+      websocket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (typeof data.seq === 'number') {
+          lastSeq.current = data.seq;
+        }
+        handler.current(data);
+      };
+
+      websocket.onclose = () => {
+        console.log('WebSocket disconnected');
+        setConnected(false);
+        // Reconnect after 3 seconds, resuming from the last sequence seen
+        if (!closed) {
+          reconnectTimer = setTimeout(connect, 3000);
+        }
+      };
     };
-    
-    setWs(websocket);
-    
+
+    connect();
+
     return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
       websocket.close();
     };
   }, []);
 
-  return { ws, connected };
+  return { connected };
+};
+
+const applyDelta = (jobs, data) => {
+  if (data.deleted) {
+    return jobs.filter(j => j.job_id !== data.job_id);
+  }
+  const index = jobs.findIndex(j => j.job_id === data.job_id);
+  if (index >= 0) {
+    const updated = [...jobs];
+    updated[index] = { ...jobs[index], ...data.changes };
+    return updated;
+  }
+  // New job (e.g. submitted from another tab)
+  return [{ job_id: data.job_id, ...data.changes }, ...jobs];
 };
 
 export const useJobs = () => {
   const [jobs, setJobs] = useState([]);
   const [loading, setLoading] = useState(true);
-  const { ws } = useWebSocket();
 
   const fetchJobs = useCallback(async () => {
     try {
@@ -54,44 +87,25 @@ export const useJobs = () => {
     }
   }, []);
 
-  // Fetch jobs on mount
-  useEffect(() => {
-    fetchJobs();
-  }, [fetchJobs]);
-
-  // Only listen to status updates from WebSocket, not initial_state
-  useEffect(() => {
-    if (!ws) return;
-
-    ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      
-      if (data.type === 'status_update') {
-        console.log('[WebSocket] Status update for job:', data.job.job_id, '→', data.job.status);
-        setJobs(prev => {
-          const index = prev.findIndex(j => j.job_id === data.job.job_id);
-          if (index >= 0) {
-            // Update existing job
-            const updated = [...prev];
-            updated[index] = data.job;
-            console.log('[WebSocket] Updated existing job at index', index);
-            return updated;
-          } else {
-            // New job from background task
-            console.log('[WebSocket] Adding new job');
-            return [data.job, ...prev];
-          }
-        });
-      }
-    };
-  }, [ws]);
+  // Initial state arrives as a snapshot; after that only changed fields
+  useWebSocket((data) => {
+    if (data.type === 'snapshot') {
+      console.log('[WebSocket] Snapshot at seq', data.seq, 'with', data.jobs.length, 'jobs');
+      setJobs(data.jobs);
+      setLoading(false);
+    } else if (data.type === 'delta') {
+      setJobs(prev => applyDelta(prev, data));
+    }
+  });
 
   const generateVideo = async (params) => {
     try {
       const response = await axios.post(`${API_BASE}/generate`, params);
       console.log('[API] Generated video:', response.data.job_id);
-      // Add to local state immediately
-      setJobs(prev => [response.data, ...prev]);
+      // Add to local state immediately (a delta may already have added it)
+      setJobs(prev => prev.some(j => j.job_id === response.data.job_id)
+        ? prev
+        : [response.data, ...prev]);
       return response.data;
     } catch (error) {
       console.error('Failed to generate video:', error);
@@ -99,6 +113,20 @@ export const useJobs = () => {
     }
   };
 
+  // Approve a finished draft; the refine run is a new job
+  const refineJob = async (jobId) => {
+    try {
+      const response = await axios.post(`${API_BASE}/jobs/${jobId}/refine`);
+      setJobs(prev => prev.some(j => j.job_id === response.data.job_id)
+        ? prev
+        : [response.data, ...prev.map(j => j.job_id === jobId ? { ...j, refined_by: response.data.job_id } : j)]);
+      return response.data;
+    } catch (error) {
+      console.error('Failed to refine draft:', error);
+      throw error;
+    }
+  };
+
   const deleteJob = async (jobId) => {
     try {
       await axios.delete(`${API_BASE}/jobs/${jobId}`);
@@ -113,6 +141,7 @@ export const useJobs = () => {
     jobs,
     loading,
     generateVideo,
+    refineJob,
     deleteJob,
     refresh: fetchJobs
   };